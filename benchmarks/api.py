@@ -0,0 +1,218 @@
+"""Benchmark the hook API endpoints against an in-process fake Moodle.
+
+Usage: python -m benchmarks.api [--concurrency 1,10,50] [--requests 200]
+    [--output results.json] [--baseline baseline.json] [--threshold 0.2] ...
+
+Each scenario sends `--requests` requests to the hook ASGI app from `--concurrency`
+concurrent clients and measures the throughput and the p50/p99 latencies. A
+second run traces the peak memory allocated by the scenario. Moodle is replaced
+by a fake serving synthetic courses, thus only the hook overhead is measured.
+Caches are disabled unless `--cache` is set.
+
+Results are written to the `--output` JSON file. Given a `--baseline` results
+file of the same fake Moodle and requests parameters, the run fails if a
+throughput drops or a latency or peak memory grows by more than the `--threshold`
+ratio.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import tracemalloc
+from itertools import cycle
+
+import httpx
+
+from benchmarks.fake_moodle import FakeMoodle
+from hook.conf import get_settings
+from hook.main import app
+
+SCENARIOS = {
+    "site_info": "/",
+    "courses": "/courses",
+    "course": "/courses/{course_id}?html=false",
+    "course_html": "/courses/{course_id}?html=true",
+    "quiz": "/quiz/{quiz_id}",
+}
+
+
+def install(client: httpx.AsyncClient, transport: httpx.AsyncBaseTransport) -> None:
+    """Replace the connection pool of the hook Moodle `client` with `transport`."""
+    # pylint: disable=protected-access
+    wrapper = client._transport
+    while not isinstance(wrapper.transport, httpx.AsyncHTTPTransport):
+        wrapper = wrapper.transport
+    wrapper.transport = transport
+
+
+async def run(
+    client: httpx.AsyncClient, paths: list[str], concurrency: int
+) -> dict[str, float]:
+    """Request all `paths` from `concurrency` clients and return the measures."""
+    latencies = []
+    pending = iter(paths)
+
+    async def worker() -> None:
+        for path in pending:
+            start = time.perf_counter()
+            response = await client.get(path)
+            latencies.append(time.perf_counter() - start)
+            response.raise_for_status()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    duration = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "throughput": len(paths) / duration,
+        "p50": latencies[len(latencies) // 2],
+        "p99": latencies[int(len(latencies) * 0.99)],
+    }
+
+
+async def trace(client: httpx.AsyncClient, paths: list[str], concurrency: int) -> int:
+    """Return the peak memory (in bytes) allocated to request all `paths`."""
+    tracemalloc.start()
+    try:
+        await run(client, paths, concurrency)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+async def benchmark(args: argparse.Namespace, moodle: FakeMoodle) -> dict[str, dict]:
+    """Run the selected scenarios at each concurrency level and return the results."""
+    # pylint: disable=no-member
+    results = {}
+    async with app.router.lifespan_context(app):
+        transport = httpx.MockTransport(moodle.handle)
+        install(app.moodle, transport)
+        install(app.moodle_file, transport)
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://hook"
+        ) as client:
+            for name in args.scenarios:
+                ids = zip(cycle(moodle.course_ids), cycle(moodle.quiz_ids))
+                paths = [
+                    SCENARIOS[name].format(course_id=course_id, quiz_id=quiz_id)
+                    for _, (course_id, quiz_id) in zip(range(args.requests), ids)
+                ]
+                for concurrency in args.concurrency:
+                    result = await run(client, paths, concurrency)
+                    if args.memory:
+                        result["peak_memory"] = await trace(client, paths, concurrency)
+                    results[f"{name}@{concurrency}"] = result
+                    print_result(f"{name}@{concurrency}", result)
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    """Return the regressions of `results` over `baseline` beyond `threshold`."""
+    regressions = []
+    for key, result in results.items():
+        reference = baseline.get(key)
+        if reference is None:
+            continue
+        if result["throughput"] < reference["throughput"] * (1 - threshold):
+            regressions.append(
+                f"{key} throughput: {result['throughput']:.1f}/s "
+                f"< {reference['throughput']:.1f}/s"
+            )
+        for metric in ("p50", "p99", "peak_memory"):
+            if metric not in result or metric not in reference:
+                continue
+            if result[metric] > reference[metric] * (1 + threshold):
+                regressions.append(
+                    f"{key} {metric}: {result[metric]:.4g} > {reference[metric]:.4g}"
+                )
+    return regressions
+
+
+def print_result(key: str, result: dict) -> None:
+    """Print the measures of the `key` scenario."""
+    peak_memory = result.get("peak_memory")
+    print(
+        f"{key:<20} {result['throughput']:>10.1f}/s "
+        f"{result['p50'] * 1000:>9.2f}ms {result['p99'] * 1000:>9.2f}ms "
+        + (f"{peak_memory / 1024**2:>9.1f}MiB" if peak_memory is not None else "")
+    )
+
+
+def main():
+    """Run the API benchmarks, write their results and check for regressions."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--courses", type=int, default=5)
+    parser.add_argument("--modules", type=int, default=50)
+    parser.add_argument("--files", type=int, default=1)
+    parser.add_argument("--quizzes", type=int, default=5)
+    parser.add_argument("--questions", type=int, default=10)
+    parser.add_argument("--html-size", type=int, default=2000)
+    parser.add_argument("--latency", type=float, default=0)
+    parser.add_argument(
+        "--concurrency",
+        type=lambda value: [int(level) for level in value.split(",")],
+        default=[1, 10, 50],
+    )
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument(
+        "--scenarios",
+        type=lambda value: value.split(","),
+        default=list(SCENARIOS),
+    )
+    parser.add_argument("--cache", action="store_true")
+    parser.add_argument("--memory", action=argparse.BooleanOptionalAction, default=True)
+    parser.add_argument("--output")
+    parser.add_argument("--baseline")
+    parser.add_argument("--threshold", type=float, default=0.2)
+    args = parser.parse_args()
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios {sorted(unknown)}")
+
+    os.environ.setdefault("HOOK_MOODLE_URL", "http://moodle")
+    settings = get_settings()
+    settings.moodle_url = "http://moodle"
+    settings.warm_up = False
+    if not args.cache:
+        settings.cache_maxsize = 0
+        settings.cache_ttls = {}
+    moodle = FakeMoodle(
+        args.courses,
+        args.modules,
+        args.files,
+        args.quizzes,
+        args.questions,
+        args.html_size,
+        args.latency,
+    )
+    # Scenarios, concurrency levels and memory tracing only select the measures.
+    parameters = {
+        name: value
+        for name, value in vars(args).items()
+        if name
+        not in {"output", "baseline", "threshold", "scenarios", "concurrency", "memory"}
+    }
+
+    print(f"{'scenario':<20} {'throughput':>12} {'p50':>11} {'p99':>11} {'peak':>12}")
+    results = asyncio.run(benchmark(args, moodle))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump({"parameters": parameters, "results": results}, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as file:
+            baseline = json.load(file)
+        if baseline["parameters"] != parameters:
+            sys.exit(f"Baseline parameters differ: {baseline['parameters']}")
+        regressions = compare(results, baseline["results"], args.threshold)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""An in-process fake Moodle serving synthetic courses to the hook clients."""
+
+import asyncio
+import json
+from itertools import count
+from urllib.parse import parse_qs
+
+import httpx
+
+HTML_CHUNK = "<p>Lorem ipsum dolor sit amet, consectetur adipiscing elit.</p>\n"
+
+
+class FakeMoodle:
+    """A fake Moodle webservices and files server with synthetic courses.
+
+    Each course has `modules` modules, the first `quizzes` of which are quizzes of
+    `questions` questions, the others being resources of `files` HTML files. Files
+    and questions are made of `html_size` characters. Responses are serialized
+    once and delayed by `latency` seconds.
+
+    Args:
+        courses (int): The number of courses.
+        modules (int): The number of modules per course.
+        files (int): The number of files per resource.
+        quizzes (int): The number of quizzes per course.
+        questions (int): The number of questions per quiz.
+        html_size (int): The size (in characters) of files and questions.
+        latency (float): The latency (in seconds) of each response.
+    """
+
+    # pylint: disable=too-many-arguments,too-few-public-methods
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(
+        self,
+        courses: int = 5,
+        modules: int = 50,
+        files: int = 1,
+        quizzes: int = 5,
+        questions: int = 10,
+        html_size: int = 2000,
+        latency: float = 0,
+    ):
+        """Generate the synthetic courses and their serialized responses."""
+        self.latency = latency
+        self.course_ids = list(range(2, courses + 2))
+        self.quiz_ids = []
+        self._attempts = count(1)
+        html = HTML_CHUNK * max(html_size // len(HTML_CHUNK), 1)
+        self._file = html.encode()
+        self._contents = {}
+        module_ids = count(1)
+        for course_id in self.course_ids:
+            course_modules = []
+            for index in range(modules):
+                module_id = next(module_ids)
+                module = {
+                    "id": module_id,
+                    "instance": module_id,
+                    "name": f"Module {module_id}",
+                    "visible": 1,
+                }
+                if index < quizzes:
+                    self.quiz_ids.append(module_id)
+                    module.update(
+                        modname="quiz",
+                        url=f"http://moodle/mod/quiz/view.php?id={module_id}",
+                    )
+                else:
+                    module.update(
+                        modname="resource",
+                        url=f"http://moodle/mod/resource/view.php?id={module_id}",
+                        contents=[
+                            {
+                                "type": "file",
+                                "mimetype": "text/html",
+                                "fileurl": (
+                                    "http://moodle/webservice/pluginfile.php/"
+                                    f"{module_id}/mod_resource/content/{file}.html"
+                                ),
+                                "timemodified": 1,
+                            }
+                            for file in range(files)
+                        ],
+                    )
+                course_modules.append(module)
+            self._contents[course_id] = json.dumps(
+                [{"id": 1, "visible": 1, "modules": course_modules}]
+            ).encode()
+        self._courses = json.dumps(
+            [{"id": 1, "format": "site", "visible": 1}]
+            + [
+                {
+                    "id": course_id,
+                    "fullname": f"Course {course_id}",
+                    "summary": "<p>Synthetic course.</p>",
+                    "format": "topics",
+                    "visible": 1,
+                }
+                for course_id in self.course_ids
+            ]
+        ).encode()
+        self._review = json.dumps(
+            {
+                "questions": [
+                    {"slot": slot, "type": "multichoice", "page": 0, "html": html}
+                    for slot in range(1, questions + 1)
+                ]
+            }
+        ).encode()
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        """Return the fake Moodle response to the `request`."""
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if "/pluginfile.php" in request.url.path:
+            return httpx.Response(
+                200, content=self._file, headers={"content-type": "text/html"}
+            )
+
+        data = {
+            name: values[0]
+            for name, values in parse_qs(request.content.decode()).items()
+        }
+        content = self.call(data.pop("wsfunction", None), data)
+        return httpx.Response(
+            200, content=content, headers={"content-type": "application/json"}
+        )
+
+    def call(self, wsfunction: str, params: dict) -> bytes:
+        """Return the serialized result of the `wsfunction` webservice."""
+        if wsfunction == "core_course_get_contents":
+            return self._contents[int(params["courseid"])]
+        if wsfunction == "core_course_get_courses":
+            return self._courses
+        if wsfunction == "mod_quiz_get_attempt_review":
+            return self._review
+        if wsfunction == "mod_quiz_start_attempt":
+            return json.dumps({"attempt": {"id": next(self._attempts)}}).encode()
+        result = {
+            "core_webservice_get_site_info": {
+                "sitename": "Fake Moodle",
+                "siteurl": "http://moodle",
+            },
+            "mod_quiz_get_user_attempts": {"attempts": []},
+            "mod_quiz_process_attempt": {"state": "finished"},
+        }.get(wsfunction, {"exception": "invalid_function", "errorcode": "invalid"})
+        return json.dumps(result).encode()
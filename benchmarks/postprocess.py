@@ -0,0 +1,95 @@
+"""Benchmark the event loop lag caused by quiz post-processing.
+
+Usage: python -m benchmarks.postprocess [--questions 50] [--size 200000] ...
+
+Concurrent quiz reviews are post-processed while a probe task measures how late
+the event loop wakes it up. Inline post-processing blocks the loop for the whole
+regex run whereas thread and process pools keep the lag bounded.
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from types import SimpleNamespace
+
+from hook.conf import Settings, get_settings
+from hook.moodle import get_quiz_questions
+from hook.postprocess import create_executor
+
+
+def create_review(questions: int, size: int) -> dict:
+    """Return a synthetic quiz attempt review of `questions` of `size` characters."""
+    chunk = "<p>Lorem ipsum dolor sit amet.</p><![CDATA[var x = 1;]]>"
+    html = chunk * (size // len(chunk))
+    return {
+        "questions": [
+            {"slot": slot, "type": "multichoice", "page": 0, "html": html}
+            for slot in range(questions)
+        ]
+    }
+
+
+async def probe(lags: list[float], interval: float, stop: asyncio.Event) -> None:
+    """Record how late the event loop resumes a task sleeping for `interval`."""
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - start - interval)
+
+
+async def run(mode: str, review: dict, concurrency: int, rounds: int) -> dict:
+    """Post-process `review` `concurrency` times per round with the `mode` pool."""
+    executor = None
+    if mode != "inline":
+        executor = create_executor(Settings(postprocess_executor=mode))
+    fastapi_app = SimpleNamespace(executor=executor)
+    lags, stop = [], asyncio.Event()
+    probe_task = asyncio.create_task(probe(lags, 0.001, stop))
+    start = time.perf_counter()
+    for _ in range(rounds):
+        await asyncio.gather(
+            *(get_quiz_questions(fastapi_app, review) for _ in range(concurrency))
+        )
+    duration = time.perf_counter() - start
+    stop.set()
+    await probe_task
+    if executor:
+        executor.shutdown()
+
+    lags.sort()
+    return {
+        "mode": mode,
+        "duration": duration,
+        "lag_p50": statistics.median(lags) if lags else 0,
+        "lag_p99": lags[int(len(lags) * 0.99)] if lags else 0,
+        "lag_max": lags[-1] if lags else 0,
+    }
+
+
+def main():
+    """Run the benchmark for each post-processing mode and print the results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--questions", type=int, default=50)
+    parser.add_argument("--size", type=int, default=200_000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    # Always offload the benchmarked payloads when a pool is used.
+    get_settings().postprocess_threshold = 0
+    review = create_review(args.questions, args.size)
+    print(
+        f"{'mode':<8} {'duration':>10} {'lag p50':>10} {'lag p99':>10} {'lag max':>10}"
+    )
+    for mode in ("inline", "thread", "process"):
+        result = asyncio.run(run(mode, review, args.concurrency, args.rounds))
+        print(
+            f"{result['mode']:<8} {result['duration']:>9.3f}s "
+            f"{result['lag_p50'] * 1000:>8.2f}ms {result['lag_p99'] * 1000:>8.2f}ms "
+            f"{result['lag_max'] * 1000:>8.2f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
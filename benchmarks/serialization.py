@@ -0,0 +1,143 @@
+"""Benchmark the serialization path of large `/courses/{course_id}` responses.
+
+Usage: python -m benchmarks.serialization [--modules 2000] [--size 2000] ...
+
+The baseline normalizes modules to dicts, converts them with FastAPI's
+`jsonable_encoder` and renders them with the standard `json` module, as done for
+plain endpoint results. The models path normalizes modules to slot-backed models
+rendered directly by orjson. Upstream decoding of the `core_course_get_contents`
+payload is benchmarked with each `moodle_json_decoder`.
+"""
+
+import argparse
+import json
+import time
+from typing import Callable
+
+import httpx
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from hook.conf import get_settings
+from hook.models import Content, Module
+from hook.serialization import decode_response
+from hook.timing import TimedJSONResponse
+
+
+def create_sections(modules: int, size: int) -> list[dict]:
+    """Return a synthetic course of `modules` modules with files of `size` chars."""
+    return [
+        {
+            "visible": 1,
+            "modules": [
+                {
+                    "id": index,
+                    "instance": index,
+                    "name": f"Resource {index}",
+                    "modname": "resource",
+                    "visible": 1,
+                    "url": f"http://moodle/mod/resource/view.php?id={index}",
+                    "contents": [
+                        {
+                            "type": "file",
+                            "mimetype": "text/html",
+                            "fileurl": f"http://moodle/pluginfile.php/{index}/a.html",
+                            "content": "<p>Lorem ipsum dolor sit amet.</p>"
+                            * (size // 34),
+                        }
+                    ],
+                }
+                for index in range(modules)
+            ],
+        }
+    ]
+
+
+def serialize_dicts(sections: list[dict]) -> bytes:
+    """Normalize and render the course `sections` as done before typed models."""
+    modules = [
+        {
+            "id": module["id"],
+            "instance": module["instance"],
+            "name": module["name"],
+            "modname": module["modname"],
+            "url": module["url"],
+            "contents": [
+                {
+                    "type": content["type"],
+                    "mimetype": content["mimetype"],
+                    "fileurl": content["fileurl"],
+                    "content": content["content"],
+                }
+                for content in module["contents"]
+            ],
+        }
+        for section in sections
+        for module in section["modules"]
+    ]
+    return JSONResponse(jsonable_encoder(modules)).body
+
+
+def serialize_models(sections: list[dict]) -> bytes:
+    """Normalize and render the course `sections` with models and orjson."""
+    modules = [
+        Module(
+            id=module["id"],
+            instance=module["instance"],
+            name=module["name"],
+            modname=module["modname"],
+            url=module["url"],
+            contents=[
+                Content(
+                    type=content["type"],
+                    mimetype=content["mimetype"],
+                    fileurl=content["fileurl"],
+                    content=content["content"],
+                )
+                for content in module["contents"]
+            ],
+        )
+        for section in sections
+        for module in section["modules"]
+    ]
+    return TimedJSONResponse(modules).body
+
+
+def measure(func: Callable, arg, rounds: int) -> float:
+    """Return the best duration of `rounds` calls of `func(arg)` in seconds."""
+    durations = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        func(arg)
+        durations.append(time.perf_counter() - start)
+    return min(durations)
+
+
+def main():
+    """Run the serialization and decoding benchmarks and print the results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--modules", type=int, default=2000)
+    parser.add_argument("--size", type=int, default=2000)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    sections = create_sections(args.modules, args.size)
+    assert json.loads(serialize_dicts(sections)) == json.loads(
+        serialize_models(sections)
+    )
+    response = httpx.Response(200, content=json.dumps(sections).encode())
+    print(f"{'path':<20} {'duration':>10}")
+    for name, func, arg in (
+        ("serialize dicts", serialize_dicts, sections),
+        ("serialize models", serialize_models, sections),
+    ):
+        print(f"{name:<20} {measure(func, arg, args.rounds) * 1000:>8.2f}ms")
+
+    for decoder in ("json", "orjson"):
+        get_settings().moodle_json_decoder = decoder
+        duration = measure(decode_response, response, args.rounds)
+        print(f"{'decode ' + decoder:<20} {duration * 1000:>8.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
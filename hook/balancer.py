@@ -0,0 +1,178 @@
+"""Load balancing of Moodle upstream requests across several Moodle web nodes."""
+
+import asyncio
+import logging
+
+import httpx
+
+from hook.guard import GuardedStream
+from hook.metrics import UPSTREAM_ORIGIN_HEALTHY
+
+logger = logging.getLogger(__name__)
+
+
+class Origin:
+    """A Moodle web node and its load and health state.
+
+    Args:
+        url (str): The base URL of the Moodle web node.
+    """
+
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, url: str):
+        """Initialize a healthy origin without outstanding requests."""
+        self.url = httpx.URL(url)
+        self.outstanding = 0
+        self.requests = 0
+        self.failures = 0
+        self.healthy = True
+
+    def stats(self) -> dict:
+        """Return the load and health state of the origin."""
+        return {
+            "url": str(self.url),
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+        }
+
+
+class OriginPool:
+    """A pool of Moodle web nodes shared by the Moodle clients.
+
+    Requests are sent to the healthy origin with the least outstanding requests.
+    Origins are ejected after `max_failures` consecutive failures (transport
+    errors and 5xx responses) or a failed health check, and are restored once a
+    health check succeeds. If all origins are ejected, all of them are used.
+
+    Args:
+        urls (list): The base URLs of the Moodle web nodes.
+        max_failures (int): The number of consecutive failures ejecting an origin.
+        health_path (str): The path requested by health checks.
+        health_timeout (float): The timeout (in seconds) of health checks.
+    """
+
+    def __init__(
+        self,
+        urls: list[str],
+        max_failures: int,
+        health_path: str = "/",
+        health_timeout: float = 5.0,
+    ):
+        """Initialize the pool of healthy origins."""
+        self.origins = [Origin(url) for url in urls]
+        self.max_failures = max_failures
+        self.health_path = health_path
+        self._client = httpx.AsyncClient(timeout=health_timeout)
+        for origin in self.origins:
+            UPSTREAM_ORIGIN_HEALTHY.labels(str(origin.url)).set(1)
+
+    def select(self) -> Origin:
+        """Return the healthy origin with the least outstanding requests."""
+        origins = [origin for origin in self.origins if origin.healthy] or self.origins
+        # Ties are broken by the total number of requests to spread the load.
+        return min(origins, key=lambda origin: (origin.outstanding, origin.requests))
+
+    def record(self, origin: Origin, success: bool) -> None:
+        """Record the outcome of a request to `origin`, ejecting failing origins."""
+        if success:
+            origin.failures = 0
+            return
+
+        origin.failures += 1
+        if origin.healthy and origin.failures >= self.max_failures:
+            logger.warning("Ejecting Moodle origin %s", origin.url)
+            self.set_healthy(origin, False)
+
+    def set_healthy(self, origin: Origin, healthy: bool) -> None:
+        """Set the health state of `origin`."""
+        origin.healthy = healthy
+        UPSTREAM_ORIGIN_HEALTHY.labels(str(origin.url)).set(healthy)
+
+    async def check(self, origin: Origin) -> bool:
+        """Return whether the health check request to `origin` succeeds."""
+        try:
+            response = await self._client.get(origin.url.join(self.health_path))
+        except httpx.HTTPError:
+            return False
+        return response.status_code < 500
+
+    async def check_health(self) -> None:
+        """Check the health of all origins, ejecting or restoring them."""
+        results = await asyncio.gather(*map(self.check, self.origins))
+        for origin, healthy in zip(self.origins, results):
+            if healthy != origin.healthy:
+                logger.warning(
+                    "%s Moodle origin %s",
+                    "Restoring" if healthy else "Ejecting",
+                    origin.url,
+                )
+            origin.failures = 0 if healthy else origin.failures
+            self.set_healthy(origin, healthy)
+
+    async def run_health_checks(self, interval: float) -> None:
+        """Check the health of all origins every `interval` seconds."""
+        while True:
+            await self.check_health()
+            await asyncio.sleep(interval)
+
+    def stats(self) -> list[dict]:
+        """Return the load and health state of all origins."""
+        return [origin.stats() for origin in self.origins]
+
+    async def aclose(self) -> None:
+        """Close the health checks HTTP client."""
+        await self._client.aclose()
+
+
+class BalancerTransport(httpx.AsyncBaseTransport):
+    """An HTTP transport sending each request to an origin of the `origins` pool.
+
+    The request URL scheme, host and port are replaced with the selected origin
+    ones, the path and query being kept. The `Host` header still targets the public
+    Moodle host, as Moodle redirects requests not matching its `wwwroot`. The origin
+    outstanding requests count is held until the response is closed.
+
+    Args:
+        transport (AsyncBaseTransport): The wrapped transport.
+        origins (OriginPool): The pool of Moodle web nodes.
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, origins: OriginPool):
+        """Initialize the balancer transport."""
+        self.transport = transport
+        self.origins = origins
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        """Send the `request` to the selected origin."""
+        origin = self.origins.select()
+        request.url = request.url.copy_with(
+            scheme=origin.url.scheme, host=origin.url.host, port=origin.url.port
+        )
+        origin.outstanding += 1
+        origin.requests += 1
+
+        def release() -> None:
+            origin.outstanding -= 1
+
+        try:
+            response = await self.transport.handle_async_request(request)
+        except httpx.TransportError:
+            self.origins.record(origin, success=False)
+            release()
+            raise
+        except BaseException:
+            release()
+            raise
+
+        self.origins.record(origin, response.status_code < 500)
+        if response.is_closed:
+            release()
+        else:
+            response.stream = GuardedStream(response.stream, release)
+        return response
+
+    async def aclose(self) -> None:
+        """Close the wrapped transport."""
+        await self.transport.aclose()
@@ -0,0 +1,259 @@
+"""In-memory and shared caching of Moodle webservice results."""
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable
+
+try:
+    from redis.asyncio import Redis
+    from redis.exceptions import RedisError
+except ImportError:  # pragma: no cover
+    Redis = None
+    RedisError = OSError
+
+from hook.conf import Settings
+from hook.serialization import pack, unpack
+
+logger = logging.getLogger(__name__)
+
+
+class TTLCache:
+    """A size-bounded LRU cache whose entries expire after a time-to-live.
+
+    Args:
+        maxsize (int): The maximum number of entries kept in the cache. When the
+            cache is full, the least recently used entry is evicted.
+    """
+
+    def __init__(self, maxsize: int):
+        """Initialize an empty cache."""
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+
+    def __len__(self) -> int:
+        """Return the number of entries in the cache, including expired ones."""
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        """Return whether `key` has a non-expired entry in the cache."""
+        entry = self._entries.get(key)
+        return entry is not None and entry[0] > time.monotonic()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return the value cached for `key` or `default` if missing or expired."""
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return default
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key: Hashable, value: Any, ttl: float) -> None:
+        """Cache `value` under `key` for `ttl` seconds."""
+        if self.maxsize <= 0:
+            return
+
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, prefix: Hashable = None) -> int:
+        """Remove cached entries and return the number of removed entries.
+
+        Args:
+            prefix (Hashable): If set, only remove tuple keys starting with `prefix`
+                (e.g. the webservice function name). Otherwise, remove all entries.
+        """
+        if prefix is None:
+            count = len(self._entries)
+            self._entries.clear()
+            return count
+
+        keys = [
+            key
+            for key in self._entries
+            if isinstance(key, tuple) and key and key[0] == prefix
+        ]
+        for key in keys:
+            del self._entries[key]
+        return len(keys)
+
+    def stats(self) -> dict:
+        """Return the cache size and hit/miss counters."""
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+class SharedCache:
+    """A cache shared by hook workers in Redis, with a local `TTLCache` in front.
+
+    Values are serialized with MessagePack in Redis. Local entries expire after at
+    most `local_ttl` seconds, so that workers catch up with shared invalidations.
+    Redis errors are logged and treated as cache misses. Without Redis, only the
+    local cache is used.
+
+    Args:
+        local (TTLCache): The local in-process cache (L1).
+        redis (Redis): The Redis client of the shared cache (L2), or `None`.
+        local_ttl (float): The maximum time-to-live of local entries in seconds.
+        prefix (str): The prefix of the Redis keys.
+    """
+
+    def __init__(
+        self,
+        local: TTLCache,
+        redis: "Redis" = None,
+        local_ttl: float = 5.0,
+        prefix: str = "hook",
+    ):
+        """Initialize the shared cache."""
+        self.local = local
+        self.redis = redis
+        self.local_ttl = local_ttl
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+
+    def get_redis_key(self, key: tuple) -> str:
+        """Return the Redis key of the cache `key`."""
+        return ":".join(map(str, (self.prefix, *key)))
+
+    async def get(self, key: tuple, default: Any = None) -> Any:
+        """Return the value cached for `key` or `default` if missing or expired."""
+        value = self.local.get(key)
+        if value is not None or self.redis is None:
+            return default if value is None else value
+
+        try:
+            data, ttl = await (
+                self.redis.pipeline(transaction=False)
+                .get(self.get_redis_key(key))
+                .pttl(self.get_redis_key(key))
+                .execute()
+            )
+        except RedisError:
+            logger.exception("Failed to get %s from the shared cache", key)
+            return default
+
+        if data is None:
+            self.misses += 1
+            return default
+
+        self.hits += 1
+        value = unpack(data)
+        self.local.set(key, value, min(self.local_ttl, max(ttl, 0) / 1000))
+        return value
+
+    async def set(self, key: tuple, value: Any, ttl: float) -> None:
+        """Cache `value` under `key` for `ttl` seconds."""
+        if self.redis is None:
+            self.local.set(key, value, ttl)
+            return
+
+        self.local.set(key, value, min(self.local_ttl, ttl))
+        try:
+            await self.redis.set(
+                self.get_redis_key(key),
+                pack(value),
+                px=int(ttl * 1000),
+            )
+        except RedisError:
+            logger.exception("Failed to set %s in the shared cache", key)
+
+    async def invalidate(self, prefix: Hashable = None) -> int:
+        """Remove cached entries and return the number of removed entries.
+
+        Args:
+            prefix (Hashable): If set, only remove keys starting with `prefix`.
+                Otherwise, remove all entries.
+        """
+        count = self.local.invalidate(prefix)
+        if self.redis is None:
+            return count
+
+        pattern = self.get_redis_key((prefix, "*") if prefix else ("*",))
+        try:
+            keys = [key async for key in self.redis.scan_iter(match=pattern)]
+            if prefix:
+                # Single element keys (e.g. `courses`) do not match the pattern.
+                keys.append(self.get_redis_key((prefix,)))
+            if keys:
+                count += await self.redis.delete(*keys)
+        except RedisError:
+            logger.exception("Failed to invalidate the shared cache")
+        return count
+
+    def stats(self) -> dict:
+        """Return the shared cache hit/miss counters."""
+        return {
+            "enabled": self.redis is not None,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    async def aclose(self) -> None:
+        """Close the Redis client."""
+        if self.redis is not None:
+            await self.redis.aclose()
+
+
+def create_shared_cache(settings: Settings, local: TTLCache) -> SharedCache:
+    """Return the shared cache configured by the `settings` in front of `local`."""
+    if not settings.redis_url:
+        return SharedCache(local)
+
+    if Redis is None:
+        raise RuntimeError("The shared cache requires the `hook[redis]` extra")
+
+    return SharedCache(
+        local, Redis.from_url(settings.redis_url), settings.redis_local_ttl
+    )
+
+
+class SingleFlight:
+    """Coalesce concurrent calls sharing the same key into a single in-flight call.
+
+    While a call for a key is in flight, subsequent callers with the same key await
+    the result of the first call instead of issuing their own.
+    """
+
+    def __init__(self):
+        """Initialize the in-flight calls registry."""
+        self.coalesced = 0
+        self._calls: dict[Hashable, asyncio.Task] = {}
+
+    def __len__(self) -> int:
+        """Return the number of calls currently in flight."""
+        return len(self._calls)
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable]) -> Any:
+        """Return the result of `func()`, sharing it with concurrent `key` callers."""
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func())
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._forget(key, task))
+        else:
+            self.coalesced += 1
+
+        # Shield the shared call so that a cancelled caller doesn't cancel it for
+        # the other callers.
+        return await asyncio.shield(task)
+
+    def _forget(self, key: Hashable, task: asyncio.Task) -> None:
+        """Remove the completed `task` from the in-flight calls registry."""
+        if self._calls.get(key) is task:
+            del self._calls[key]
@@ -0,0 +1,241 @@
+"""Response compression and conditional requests of the hook API."""
+
+import hashlib
+import zlib
+from typing import Protocol
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from hook.conf import get_settings
+from hook.timing import timed
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/x-ndjson")
+
+
+class Compressor(Protocol):
+    """A streaming compressor of response body chunks."""
+
+    # pylint: disable=too-few-public-methods
+
+    def compress(self, data: bytes, finish: bool) -> bytes:
+        """Return the compressed `data`, flushed to be decodable as is."""
+
+
+class GzipCompressor:
+    """A streaming gzip compressor."""
+
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self):
+        """Initialize the gzip stream."""
+        self._compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes, finish: bool) -> bytes:
+        """Return the compressed `data`, flushed to be decodable as is."""
+        mode = zlib.Z_FINISH if finish else zlib.Z_SYNC_FLUSH
+        return self._compressor.compress(data) + self._compressor.flush(mode)
+
+
+class ZstdCompressor:
+    """A streaming zstd compressor."""
+
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self):
+        """Initialize the zstd stream."""
+        self._compressor = zstandard.ZstdCompressor(level=3).compressobj()
+
+    def compress(self, data: bytes, finish: bool) -> bytes:
+        """Return the compressed `data`, flushed to be decodable as is."""
+        mode = (
+            zstandard.COMPRESSOBJ_FLUSH_FINISH
+            if finish
+            else zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        )
+        return self._compressor.compress(data) + self._compressor.flush(mode)
+
+
+def get_encoding(accept_encoding: str) -> str:
+    """Return the preferred supported encoding in `accept_encoding` or `None`.
+
+    zstd is preferred over gzip when both are equally accepted and zstd support is
+    installed.
+    """
+    supported = ("zstd", "gzip") if zstandard else ("gzip",)
+    qualities = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.strip().lower().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        qualities[coding.strip()] = quality
+
+    wildcard = qualities.get("*", 0.0)
+    encodings = [
+        (qualities.get(coding, wildcard), -index, coding)
+        for index, coding in enumerate(supported)
+    ]
+    quality, _, coding = max(encodings)
+    return coding if quality > 0 else None
+
+
+class CompressionMiddleware:
+    """An ASGI middleware compressing responses with gzip or zstd.
+
+    Text and JSON responses of at least `compression_threshold` bytes are
+    compressed with the encoding negotiated through `Accept-Encoding`. Streamed
+    responses (e.g. NDJSON) are compressed chunk by chunk, each chunk being
+    flushed so that clients can decode it as soon as it is received.
+    """
+
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, app: ASGIApp):
+        """Initialize the compression middleware."""
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Handle the request and compress its response."""
+        if scope["type"] != "http" or not get_settings().compression:
+            await self.app(scope, receive, send)
+            return
+
+        encoding = get_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        start_message = None
+        compressor = None
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal start_message, compressor
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            headers = None
+            if start_message is not None:
+                headers = MutableHeaders(raw=list(start_message["headers"]))
+                if self.is_compressible(headers, start_message["status"]):
+                    headers.add_vary_header("Accept-Encoding")
+                    threshold = get_settings().compression_threshold
+                    if encoding and (more_body or len(body) >= threshold):
+                        compressor = (
+                            ZstdCompressor() if encoding == "zstd" else GzipCompressor()
+                        )
+                        headers["Content-Encoding"] = encoding
+
+            if compressor is not None:
+                with timed("compress"):
+                    body = compressor.compress(body, finish=not more_body)
+
+            if headers is not None:
+                if compressor is not None and not more_body:
+                    headers["Content-Length"] = str(len(body))
+                elif compressor is not None:
+                    del headers["Content-Length"]
+                await send({**start_message, "headers": headers.raw})
+                start_message = None
+            await send({**message, "body": body})
+
+        await self.app(scope, receive, send_wrapper)
+
+    @staticmethod
+    def is_compressible(headers: MutableHeaders, status: int) -> bool:
+        """Return whether a response with `headers` and `status` is compressible."""
+        return (
+            status not in (204, 206, 304)
+            and "content-encoding" not in headers
+            and "content-range" not in headers
+            and headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES)
+        )
+
+
+def get_etag(body: bytes) -> str:
+    """Return the weak ETag of the response `body`.
+
+    The ETag is weak as it identifies the payload regardless of its encoding.
+    """
+    return f'W/"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+
+def is_not_modified(if_none_match: str, etag: str) -> bool:
+    """Return whether `etag` matches the `If-None-Match` header value."""
+    if if_none_match.strip() == "*":
+        return True
+
+    # Weak comparison: the `W/` prefix is ignored on both sides.
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return etag.removeprefix("W/") in candidates
+
+
+class ETagMiddleware:
+    """An ASGI middleware adding ETags to complete hook API responses.
+
+    The ETag is computed from the normalized payload; `GET` requests with a
+    matching `If-None-Match` header get a `304 Not Modified` response without body.
+    Streamed responses and responses having an ETag already are left unchanged.
+    """
+
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, app: ASGIApp):
+        """Initialize the ETag middleware."""
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Handle the request and add an ETag to its response."""
+        if scope["type"] != "http" or scope["method"] not in ("GET", "HEAD"):
+            await self.app(scope, receive, send)
+            return
+
+        if_none_match = Headers(scope=scope).get("if-none-match")
+        start_message = None
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+
+            if message["type"] != "http.response.body" or start_message is None:
+                await send(message)
+                return
+
+            headers = MutableHeaders(raw=list(start_message["headers"]))
+            body = message.get("body", b"")
+            if (
+                start_message["status"] != 200
+                or message.get("more_body", False)
+                or "etag" in headers
+            ):
+                await send(start_message)
+                start_message = None
+                await send(message)
+                return
+
+            headers["ETag"] = get_etag(body)
+            if if_none_match and is_not_modified(if_none_match, headers["ETag"]):
+                for name in ("content-length", "content-type"):
+                    del headers[name]
+                await send({**start_message, "status": 304, "headers": headers.raw})
+                await send({"type": "http.response.body", "body": b""})
+                return
+
+            await send({**start_message, "headers": headers.raw})
+            start_message = None
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,155 @@
+"""Hook configuration."""
+
+from functools import lru_cache
+from pathlib import Path
+from typing import Annotated, Literal
+
+from annotated_types import Ge, Gt
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+
+class Settings(BaseSettings):
+    """Hook settings."""
+
+    model_config = SettingsConfigDict(env_prefix="HOOK_")
+
+    moodle_url: str = "http://moodle"
+    moodle_webservice_token: str = ""
+
+    # Maximum number of concurrent upstream calls issued for a single API request.
+    moodle_concurrency: Annotated[int, Gt(0)] = 10
+    # Timeout (in seconds) of each individual upstream call.
+    moodle_timeout: Annotated[float, Gt(0)] = 30.0
+    moodle_connect_timeout: Annotated[float, Gt(0)] = 5.0
+    # Connection pool limits of each Moodle client (webservices and files).
+    moodle_max_connections: Annotated[int, Gt(0)] = 100
+    moodle_max_keepalive_connections: Annotated[int, Ge(0)] = 20
+    moodle_keepalive_expiry: Annotated[float, Ge(0)] = 5.0
+    moodle_http2: bool = False
+    # JSON decoder of Moodle responses; `orjson` is faster on large payloads but
+    # stricter (e.g. it rejects invalid UTF-8 instead of replacing it).
+    moodle_json_decoder: Literal["json", "orjson"] = "json"
+    # Whether to send upstream requests to Moodle (`live`), to also record their
+    # exchanges to the `upstream_archive` file (`record`) or to serve them from it
+    # without Moodle (`replay`), delayed by `replay_latency` seconds, give or take
+    # up to `replay_jitter` seconds.
+    upstream_mode: Literal["live", "record", "replay"] = "live"
+    upstream_archive: Path = Path("upstream.jsonl.gz")
+    replay_latency: Annotated[float, Ge(0)] = 0
+    replay_jitter: Annotated[float, Ge(0)] = 0
+    # Whether to guard each Moodle client with an adaptive concurrency limit and a
+    # circuit breaker, shedding requests with 503 responses when Moodle is
+    # overloaded. The limit starts at `guard_initial_limit` concurrent requests,
+    # grows while responses come within `guard_latency_target` seconds and shrinks
+    # otherwise. Requests over the limit are queued (at most `guard_queue_size`)
+    # for at most `guard_queue_timeout` seconds. The circuit opens for
+    # `guard_open_duration` seconds after `guard_failure_threshold` consecutive
+    # failures (transport errors and 5xx responses).
+    guard: bool = False
+    guard_initial_limit: Annotated[int, Gt(0)] = 20
+    guard_min_limit: Annotated[int, Gt(0)] = 2
+    guard_max_limit: Annotated[int, Gt(0)] = 100
+    guard_latency_target: Annotated[float, Gt(0)] = 2.0
+    guard_queue_size: Annotated[int, Ge(0)] = 1000
+    guard_queue_timeout: Annotated[float, Gt(0)] = 10.0
+    guard_failure_threshold: Annotated[int, Gt(0)] = 5
+    guard_open_duration: Annotated[float, Gt(0)] = 30.0
+    # Maximum number of calls sent in a single `tool_mobile_call_external_functions`
+    # request (Moodle 3.7+) by batch endpoints (0 sends each call separately).
+    moodle_batch_size: Annotated[int, Ge(0)] = 0
+    # Base URLs of the Moodle web nodes sharing upstream requests (e.g. JSON
+    # `["http://moodle-1", "http://moodle-2"]`), `moodle_url` remaining the public
+    # URL of Moodle. Each request goes to the healthy node with the least
+    # outstanding requests. Nodes are ejected after `moodle_origin_max_failures`
+    # consecutive failures (transport errors and 5xx responses) or a failed health
+    # check, a GET of `moodle_health_path` every `moodle_health_interval` seconds,
+    # and restored once a health check succeeds.
+    moodle_origins: list[str] = []
+    moodle_origin_max_failures: Annotated[int, Gt(0)] = 3
+    moodle_health_path: str = "/login/index.php"
+    moodle_health_interval: Annotated[float, Gt(0)] = 10.0
+
+    # Whether to reuse finished quiz attempts started after the last quiz
+    # modification instead of submitting a new attempt on each quiz request, and
+    # the time-to-live (in seconds) of the resulting cached quiz questions.
+    quiz_reuse_attempts: bool = False
+    quiz_cache_ttl: Annotated[float, Gt(0)] = 3600
+
+    # Whether to keep a snapshot of each course contents, only refetching the
+    # modules reported as updated by Moodle since the last sync, and the
+    # time-to-live (in seconds) of snapshots, after which a full sync is done.
+    course_sync: bool = False
+    course_sync_ttl: Annotated[float, Gt(0)] = 3600
+
+    # Pool used to post-process (decode and clean up) payloads larger than
+    # `postprocess_threshold` characters or bytes off the event loop.
+    postprocess_executor: Literal["thread", "process"] = "thread"
+    postprocess_workers: Annotated[int, Gt(0)] = 4
+    postprocess_threshold: Annotated[int, Ge(0)] = 64 * 1024
+
+    # Directory of the persistent store of downloaded file contents (disabled if
+    # unset) and its maximum size in bytes.
+    file_store_path: Path | None = None
+    file_store_maxsize: Annotated[int, Gt(0)] = 1024**3
+
+    # Whether to crawl all visible courses at startup to warm up the caches, the
+    # interval (in seconds) between crawls (0 to crawl at startup only) and the
+    # maximum number of courses crawled concurrently. Quizzes are only crawled
+    # with `quiz_reuse_attempts`, as crawling them would submit new attempts.
+    warm_up: bool = False
+    warm_up_interval: Annotated[float, Ge(0)] = 0
+    warm_up_concurrency: Annotated[int, Gt(0)] = 2
+
+    # Whether to index the modules names, file contents and quiz questions of the
+    # courses resolved with their contents, to search them with `/search`.
+    search: bool = False
+
+    # Number of workers resolving courses in background jobs, maximum number of
+    # pending jobs and time (in seconds) finished jobs and their results are kept.
+    jobs_workers: Annotated[int, Gt(0)] = 2
+    jobs_queue_size: Annotated[int, Ge(0)] = 100
+    jobs_ttl: Annotated[float, Gt(0)] = 600
+
+    # Whether to add a `Server-Timing` header to all responses. When disabled, the
+    # header can still be requested with the `timing=1` query parameter.
+    server_timing: bool = False
+
+    # Whether to compress text and JSON responses of at least `compression_threshold`
+    # bytes with gzip or zstd (with the `zstd` extra), as negotiated with clients.
+    compression: bool = True
+    compression_threshold: Annotated[int, Ge(0)] = 1024
+
+    # Maximum number of cached webservice results (0 disables the cache).
+    cache_maxsize: Annotated[int, Ge(0)] = 1024
+    # Time-to-live (in seconds) of cached results by webservice function. Results of
+    # webservice functions missing from this mapping are never cached.
+    cache_ttls: dict[str, Annotated[float, Gt(0)]] = {
+        "core_webservice_get_site_info": 3600,
+        "core_course_get_courses": 300,
+        "core_course_get_contents": 60,
+        "core_course_get_course_module_by_instance": 3600,
+        "mod_quiz_get_quizzes_by_courses": 60,
+    }
+    # Read-only webservice functions for which concurrent identical calls share a
+    # single in-flight upstream request. User attempts are not coalesced, as
+    # concurrent callers would all start a new attempt when none is in progress.
+    singleflight_wsfunctions: set[str] = {
+        "core_webservice_get_site_info",
+        "core_course_get_courses",
+        "core_course_get_contents",
+        "core_course_get_course_module_by_instance",
+        "mod_quiz_get_quizzes_by_courses",
+        "mod_quiz_get_attempt_review",
+    }
+
+    # URL of the Redis cache of normalized results shared by all hook workers
+    # (disabled if empty, e.g. `redis://redis:6379/0`) and the maximum time-to-live
+    # (in seconds) of shared results in the in-process cache of each worker.
+    redis_url: str = ""
+    redis_local_ttl: Annotated[float, Ge(0)] = 5.0
+
+
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """Return a cached settings instance."""
+    return Settings()
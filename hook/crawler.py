@@ -0,0 +1,83 @@
+"""Background crawling of Moodle courses to warm up the hook caches."""
+
+import asyncio
+import logging
+
+from fastapi import FastAPI
+
+from hook.conf import get_settings
+from hook.moodle import (
+    get_course_contents,
+    get_course_modules,
+    get_courses,
+    get_visible_modules,
+    resolve_course_modules,
+)
+from hook.search import index_course_modules
+
+logger = logging.getLogger(__name__)
+
+
+async def warm_up(fastapi_app: FastAPI) -> int:
+    """Resolve all visible Moodle courses to fill the hook caches.
+
+    Courses are resolved with their contents (files and quizzes), at most
+    `warm_up_concurrency` at once. Return the number of warmed up courses.
+
+    Quizzes are only resolved with the `quiz_reuse_attempts` setting. Otherwise,
+    each crawl would submit a new attempt of every quiz, and only the other modules
+    are resolved to warm up the course contents. Their files are then only
+    downloaded if kept, by the file store or the search index.
+    """
+    settings = get_settings()
+    course_ids = [course.id for course in await get_courses(fastapi_app)]
+    semaphore = asyncio.Semaphore(settings.warm_up_concurrency)
+
+    async def warm_up_course(course_id: int) -> bool:
+        async with semaphore:
+            try:
+                if settings.quiz_reuse_attempts:
+                    await get_course_modules(fastapi_app, course_id, html=True)
+                else:
+                    await warm_up_course_without_quizzes(fastapi_app, course_id)
+            except Exception:  # pylint: disable=broad-exception-caught
+                logger.exception("Failed to warm up course %d", course_id)
+                return False
+            return True
+
+    results = await asyncio.gather(*map(warm_up_course, course_ids))
+    return sum(results)
+
+
+async def warm_up_course_without_quizzes(fastapi_app: FastAPI, course_id: int) -> None:
+    """Resolve the visible modules of a course, except quizzes.
+
+    Module contents are only resolved if the file store or search is enabled, as
+    nothing else keeps them.
+    """
+    settings = get_settings()
+    modules = [
+        module
+        for module in get_visible_modules(
+            await get_course_contents(fastapi_app, course_id)
+        )
+        if module.get("modname") != "quiz"
+    ]
+    html = settings.file_store_path is not None or settings.search
+    modules = await resolve_course_modules(fastapi_app, modules, html=html)
+    await index_course_modules(fastapi_app, course_id, modules, complete=False)
+
+
+async def crawl(fastapi_app: FastAPI) -> None:
+    """Warm up the hook caches at startup and every `warm_up_interval` seconds."""
+    interval = get_settings().warm_up_interval
+    while True:
+        try:
+            count = await warm_up(fastapi_app)
+            logger.info("Warmed up %d courses", count)
+        except Exception:  # pylint: disable=broad-exception-caught
+            logger.exception("Failed to warm up courses")
+
+        if not interval:
+            return
+        await asyncio.sleep(interval)
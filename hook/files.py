@@ -0,0 +1,111 @@
+"""Persistent on-disk store of Moodle file contents."""
+
+import hashlib
+import logging
+import mmap
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+class FileStore:
+    """A content store keeping Moodle file bodies on disk.
+
+    Files are stored under a name derived from their URL and modification time,
+    thus a modified file is stored under a new name and never served stale. When
+    the store exceeds `maxsize` bytes, the least recently used files are removed.
+
+    Args:
+        path (Path): The directory where files are stored.
+        maxsize (int): The maximum total size of stored files in bytes.
+    """
+
+    def __init__(self, path: Path, maxsize: int):
+        """Initialize the store, indexing files kept from previous runs."""
+        self.path = Path(path)
+        self.maxsize = maxsize
+        self.size = 0
+        self._lock = threading.Lock()
+        self._index: OrderedDict[str, int] = OrderedDict()
+        self.path.mkdir(parents=True, exist_ok=True)
+        entries = [
+            entry
+            for directory in os.scandir(self.path)
+            if directory.is_dir()
+            for entry in os.scandir(directory.path)
+            if entry.is_file() and not entry.name.startswith(".")
+        ]
+        for entry in sorted(entries, key=lambda entry: entry.stat().st_mtime):
+            self._index[entry.name] = entry.stat().st_size
+            self.size += entry.stat().st_size
+        logger.info("Indexed %d stored files (%d bytes)", len(self._index), self.size)
+
+    def __len__(self) -> int:
+        """Return the number of stored files."""
+        return len(self._index)
+
+    @staticmethod
+    def get_key(url: str, timemodified: int) -> str:
+        """Return the storage key of the file at `url` modified at `timemodified`."""
+        return hashlib.sha256(f"{timemodified}:{url}".encode()).hexdigest()
+
+    def get_path(self, key: str) -> Path:
+        """Return the path of the stored file with the storage `key`."""
+        return self.path / key[:2] / key
+
+    def read_text(self, url: str, timemodified: int) -> str:
+        """Return the stored text of the file at `url` or `None` if not stored.
+
+        The text is decoded directly from the memory-mapped file.
+        """
+        key = self.get_key(url, timemodified)
+        path = self.get_path(key)
+        try:
+            with open(path, "rb") as file:
+                if not os.fstat(file.fileno()).st_size:
+                    text = ""
+                else:
+                    with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                        text = str(data, "utf-8")
+        except FileNotFoundError:
+            return None
+
+        with self._lock:
+            if key in self._index:
+                self._index.move_to_end(key)
+            # Keep the modification time in line with the LRU order across restarts,
+            # without recreating a file evicted since it was read.
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                pass
+        return text
+
+    def write_text(self, url: str, timemodified: int, text: str) -> None:
+        """Store the `text` of the file at `url` modified at `timemodified`."""
+        key = self.get_key(url, timemodified)
+        path = self.get_path(key)
+        path.parent.mkdir(exist_ok=True)
+        data = text.encode("utf-8")
+        # Write to a temporary file first so that readers never see partial files.
+        with tempfile.NamedTemporaryFile(
+            dir=path.parent, prefix=".", delete=False
+        ) as file:
+            file.write(data)
+        os.replace(file.name, path)
+
+        with self._lock:
+            self.size += len(data) - self._index.pop(key, 0)
+            self._index[key] = len(data)
+            self._evict()
+
+    def _evict(self) -> None:
+        """Remove the least recently used files until the store fits `maxsize`."""
+        while self.size > self.maxsize and self._index:
+            key, size = self._index.popitem(last=False)
+            self.size -= size
+            self.get_path(key).unlink(missing_ok=True)
@@ -0,0 +1,299 @@
+"""Adaptive concurrency limiting and circuit breaking of Moodle upstream requests."""
+
+import asyncio
+import time
+from collections import deque
+from typing import AsyncIterator, Callable
+
+import httpx
+
+from hook.metrics import (
+    UPSTREAM_CIRCUIT_OPEN,
+    UPSTREAM_CONCURRENCY_LIMIT,
+    UPSTREAM_QUEUE_DEPTH,
+    UPSTREAM_REJECTIONS,
+)
+
+
+class UpstreamUnavailable(Exception):
+    """Raised when an upstream request is shed to protect an overloaded Moodle.
+
+    Args:
+        reason (str): Why the request was shed (`queue_full`, `queue_timeout` or
+            `circuit_open`).
+        retry_after (float): The number of seconds clients should wait before
+            retrying.
+    """
+
+    def __init__(self, reason: str, retry_after: float):
+        """Initialize the exception."""
+        super().__init__(f"Moodle is unavailable ({reason})")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdaptiveLimiter:
+    """An AIMD concurrency limit adapting to the observed upstream latency.
+
+    The limit grows by one for every `limit` requests completed within
+    `latency_target` seconds (additive increase) and is multiplied by `backoff`
+    at most once per `latency_target` on slower or failed requests
+    (multiplicative decrease). Requests over the limit wait in a FIFO queue of at
+    most `max_queue` requests for at most `queue_timeout` seconds.
+
+    Args:
+        limit (float): The initial concurrency limit.
+        min_limit (int): The minimum concurrency limit.
+        max_limit (int): The maximum concurrency limit.
+        latency_target (float): The latency (in seconds) of a healthy upstream.
+        max_queue (int): The maximum number of queued requests.
+        queue_timeout (float): The maximum queueing duration in seconds.
+        backoff (float): The ratio applied to the limit on slow requests.
+    """
+
+    # pylint: disable=too-many-arguments,too-many-instance-attributes
+
+    def __init__(
+        self,
+        limit: float,
+        min_limit: int,
+        max_limit: int,
+        latency_target: float,
+        max_queue: int,
+        queue_timeout: float,
+        backoff: float = 0.9,
+    ):
+        """Initialize the limiter with no request in flight."""
+        self.limit = float(min(max(limit, min_limit), max_limit))
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target = latency_target
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.backoff = backoff
+        self.in_flight = 0
+        self._waiters: deque[asyncio.Future] = deque()
+        self._decreased_at = float("-inf")
+
+    def __len__(self) -> int:
+        """Return the number of queued requests."""
+        return len(self._waiters)
+
+    async def acquire(self) -> None:
+        """Wait for a request slot, raising `UpstreamUnavailable` if none frees up."""
+        if self.in_flight < int(self.limit) and not self._waiters:
+            self.in_flight += 1
+            return
+
+        if len(self._waiters) >= self.max_queue:
+            raise UpstreamUnavailable("queue_full", self.queue_timeout)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except asyncio.TimeoutError as error:
+            raise UpstreamUnavailable("queue_timeout", self.queue_timeout) from error
+        except asyncio.CancelledError:
+            # The slot might have been handed over right before the cancellation.
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+
+    def release(self) -> None:
+        """Free a request slot and hand it over to the next queued requests."""
+        self.in_flight -= 1
+        self._wake_up()
+
+    def record(self, latency: float, success: bool) -> None:
+        """Adapt the limit to a request completed in `latency` seconds."""
+        if success and latency <= self.latency_target:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self._wake_up()
+            return
+
+        now = time.monotonic()
+        if now - self._decreased_at >= self.latency_target:
+            self._decreased_at = now
+            self.limit = max(self.min_limit, self.limit * self.backoff)
+
+    def _wake_up(self) -> None:
+        """Hand free request slots over to queued requests in order."""
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+
+class CircuitBreaker:
+    """A circuit breaker shedding requests while the upstream keeps failing.
+
+    The circuit opens after `failure_threshold` consecutive failures and rejects
+    requests for `open_duration` seconds. It then lets a single probe request
+    through (half-open), whose outcome closes or reopens the circuit.
+
+    Args:
+        failure_threshold (int): The number of consecutive failures opening it.
+        open_duration (float): The duration (in seconds) of the open state.
+    """
+
+    def __init__(self, failure_threshold: int, open_duration: float):
+        """Initialize a closed circuit."""
+        self.failure_threshold = failure_threshold
+        self.open_duration = open_duration
+        self.state = "closed"
+        self.failures = 0
+        self._opened_at = 0.0
+
+    def check(self) -> bool:
+        """Raise `UpstreamUnavailable` if requests are currently shed.
+
+        Return whether the request let through is the half-open probe.
+        """
+        if self.state == "closed":
+            return False
+
+        remaining = self._opened_at + self.open_duration - time.monotonic()
+        if self.state == "open" and remaining <= 0:
+            self.state = "half_open"
+            return True
+
+        raise UpstreamUnavailable("circuit_open", max(remaining, 1))
+
+    def abort(self) -> None:
+        """Let another probe through if the half-open probe request was aborted.
+
+        Only the probe request, as returned by `check`, should call it.
+        """
+        if self.state == "half_open":
+            self.state = "open"
+            self._opened_at = time.monotonic() - self.open_duration
+
+    def record(self, success: bool) -> None:
+        """Update the circuit state with the outcome of a request."""
+        if success:
+            self.state = "closed"
+            self.failures = 0
+            return
+
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            self.state = "open"
+            self._opened_at = time.monotonic()
+
+
+class GuardedStream(httpx.AsyncByteStream):
+    """A response stream calling `release` once closed."""
+
+    def __init__(self, stream: httpx.AsyncByteStream, release: Callable[[], None]):
+        """Initialize the guarded stream."""
+        self.stream = stream
+        self._release = release
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        """Yield the chunks of the wrapped stream."""
+        async for chunk in self.stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        """Close the wrapped stream and release its request slot."""
+        if self._release:
+            self._release()
+            self._release = None
+        await self.stream.aclose()
+
+
+class GuardTransport(httpx.AsyncBaseTransport):
+    """An HTTP transport protecting Moodle from overload.
+
+    Requests go through the circuit breaker, then wait for a slot of the adaptive
+    concurrency limiter, which is held until the response is closed. Transport
+    errors and 5xx responses count as failures.
+
+    Args:
+        transport (AsyncBaseTransport): The wrapped transport.
+        client (str): The name of the Moodle client, used as metric label.
+        limiter (AdaptiveLimiter): The concurrency limiter.
+        breaker (CircuitBreaker): The circuit breaker.
+    """
+
+    def __init__(
+        self,
+        transport: httpx.AsyncBaseTransport,
+        client: str,
+        limiter: AdaptiveLimiter,
+        breaker: CircuitBreaker,
+    ):
+        """Initialize the guard transport."""
+        self.transport = transport
+        self.client = client
+        self.limiter = limiter
+        self.breaker = breaker
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        """Send the `request` unless Moodle is deemed overloaded."""
+        queue_depth = UPSTREAM_QUEUE_DEPTH.labels(self.client)
+        probe = False
+        try:
+            probe = self.breaker.check()
+            queue_depth.inc()
+            try:
+                await self.limiter.acquire()
+            finally:
+                queue_depth.dec()
+        except UpstreamUnavailable as error:
+            UPSTREAM_REJECTIONS.labels(self.client, error.reason).inc()
+            self.abort(probe)
+            raise
+        except asyncio.CancelledError:
+            self.abort(probe)
+            raise
+
+        start = time.perf_counter()
+        try:
+            response = await self.transport.handle_async_request(request)
+        except httpx.TransportError:
+            self.record(time.perf_counter() - start, success=False)
+            self.limiter.release()
+            raise
+        except BaseException:
+            self.abort(probe)
+            self.limiter.release()
+            raise
+
+        self.record(time.perf_counter() - start, response.status_code < 500)
+        if response.is_closed:
+            # The response body has already been read (e.g. by a mocked transport).
+            self.limiter.release()
+        else:
+            response.stream = GuardedStream(response.stream, self.limiter.release)
+        return response
+
+    def abort(self, probe: bool) -> None:
+        """Let another probe through if the aborted request was the `probe`."""
+        if probe:
+            self.breaker.abort()
+
+    def record(self, latency: float, success: bool) -> None:
+        """Record the outcome of a request and update the guard metrics."""
+        self.limiter.record(latency, success)
+        self.breaker.record(success)
+        UPSTREAM_CONCURRENCY_LIMIT.labels(self.client).set(int(self.limiter.limit))
+        UPSTREAM_CIRCUIT_OPEN.labels(self.client).set(self.breaker.state != "closed")
+
+    def stats(self) -> dict:
+        """Return the concurrency limit and circuit breaker state."""
+        return {
+            "limit": int(self.limiter.limit),
+            "in_flight": self.limiter.in_flight,
+            "queued": len(self.limiter),
+            "circuit": self.breaker.state,
+        }
+
+    async def aclose(self) -> None:
+        """Close the wrapped transport."""
+        await self.transport.aclose()
@@ -0,0 +1,148 @@
+"""Background jobs resolving expensive hook results off the request path."""
+
+import asyncio
+import logging
+import time
+import uuid
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Hashable
+
+logger = logging.getLogger(__name__)
+
+current_job: ContextVar["Job"] = ContextVar("current_job", default=None)
+
+
+@dataclass(slots=True)
+class Job:
+    """A background job and its progress counters."""
+
+    # pylint: disable=too-many-instance-attributes
+
+    id: str
+    key: Hashable
+    status: str = "pending"
+    total: int = 0
+    resolved: int = 0
+    result: Any = None
+    error: str = None
+    created: float = field(default_factory=time.time)
+    finished: float = None
+
+    def summary(self) -> dict:
+        """Return the job state, with its result once done."""
+        summary = {
+            "id": self.id,
+            "status": self.status,
+            "total": self.total,
+            "resolved": self.resolved,
+            "created": self.created,
+            "finished": self.finished,
+        }
+        if self.status == "done":
+            summary["result"] = self.result
+        elif self.status == "failed":
+            summary["error"] = self.error
+        return summary
+
+
+def add_progress(total: int = 0, resolved: int = 0) -> None:
+    """Add to the `total` and `resolved` items counters of the current job, if any."""
+    job = current_job.get()
+    if job is not None:
+        job.total += total
+        job.resolved += resolved
+
+
+class JobQueue:
+    """A queue of background jobs run by a bounded pool of workers.
+
+    Jobs are deduplicated by key: submitting a job whose key matches a pending or
+    running job returns the existing job, while a new job is queued for the key of
+    a finished job. Finished jobs are kept for `ttl` seconds. Jobs live in the
+    memory of the current process.
+
+    Args:
+        workers (int): The number of jobs run concurrently.
+        maxsize (int): The maximum number of pending jobs (0 for no limit).
+        ttl (float): The time (in seconds) finished jobs are kept.
+    """
+
+    def __init__(self, workers: int, maxsize: int, ttl: float):
+        """Initialize an empty job queue, without started workers."""
+        self.workers = workers
+        self.ttl = ttl
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize)
+        self._jobs: dict[str, Job] = {}
+        self._keys: dict[Hashable, str] = {}
+        self._tasks: list[asyncio.Task] = []
+
+    def __len__(self) -> int:
+        """Return the number of kept jobs."""
+        return len(self._jobs)
+
+    def start(self) -> None:
+        """Start the workers running the queued jobs."""
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    def submit(self, key: Hashable, func: Callable[[], Awaitable]) -> Job:
+        """Return the job of `key`, queueing a new job running `func()` if needed.
+
+        Raise `asyncio.QueueFull` if the maximum number of pending jobs is reached.
+        """
+        self._expire()
+        job = self._jobs.get(self._keys.get(key))
+        if job is not None and job.status in {"pending", "running"}:
+            return job
+
+        job = Job(id=uuid.uuid4().hex, key=key)
+        self._queue.put_nowait((job, func))
+        self._jobs[job.id] = job
+        self._keys[key] = job.id
+        return job
+
+    def get(self, job_id: str) -> Job:
+        """Return the job `job_id` or `None` if unknown or expired."""
+        self._expire()
+        return self._jobs.get(job_id)
+
+    def stats(self) -> dict:
+        """Return the number of kept jobs by status."""
+        stats = dict.fromkeys(("pending", "running", "done", "failed"), 0)
+        for job in self._jobs.values():
+            stats[job.status] += 1
+        return stats
+
+    async def _work(self) -> None:
+        """Run queued jobs, one at a time."""
+        while True:
+            job, func = await self._queue.get()
+            job.status = "running"
+            token = current_job.set(job)
+            try:
+                job.result = await func()
+                job.status = "done"
+            except Exception as error:  # pylint: disable=broad-exception-caught
+                logger.exception("Job %s failed", job.id)
+                job.error = str(error)
+                job.status = "failed"
+            finally:
+                current_job.reset(token)
+                job.finished = time.time()
+                self._queue.task_done()
+
+    def _expire(self) -> None:
+        """Forget finished jobs older than `ttl` seconds."""
+        now = time.time()
+        for job in list(self._jobs.values()):
+            if job.finished is not None and now - job.finished > self.ttl:
+                del self._jobs[job.id]
+                if self._keys.get(job.key) == job.id:
+                    del self._keys[job.key]
+
+    async def aclose(self) -> None:
+        """Cancel the workers and their running jobs."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
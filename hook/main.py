@@ -1,52 +1,151 @@
 """Hook API main entrypoint."""
 
-import os
-import re
-from contextlib import asynccontextmanager
-from urllib.parse import urlparse
+import asyncio
+import math
+from contextlib import asynccontextmanager, suppress
 
-import httpx
-from fastapi import FastAPI, Request
+from fastapi import Body, FastAPI, HTTPException, Query, Request
+from fastapi.responses import Response, StreamingResponse
+from starlette.background import BackgroundTask
+
+from hook.cache import SingleFlight, TTLCache, create_shared_cache
+from hook.compression import CompressionMiddleware, ETagMiddleware
+from hook.conf import get_settings
+from hook.crawler import crawl
+from hook.files import FileStore
+from hook.guard import UpstreamUnavailable
+from hook.jobs import JobQueue
+from hook.metrics import MetricsMiddleware, get_metrics
+from hook.models import Module, project
+from hook.moodle import (
+    get_course_contents,
+    get_course_modules,
+    get_courses,
+    get_quiz,
+    get_visible_modules,
+    moodle_ws,
+    patch_moodle_url,
+    resolve_courses_modules,
+    stream_course_modules,
+)
+from hook.postprocess import create_executor
+from hook.search import SearchIndex
+from hook.timing import ServerTimingMiddleware, TimedJSONResponse
+from hook.upstream import (
+    create_archive,
+    create_moodle_client,
+    create_origin_pool,
+    get_guard_stats,
+    get_pool_stats,
+)
 
 
 @asynccontextmanager
 async def lifespan(fastapi_app: FastAPI):
     """Add moodle clients to the FastAPI app at startup."""
-    moodle_url = os.environ.get("HOOK_MOODLE_URL")
-    token = os.environ.get("HOOK_MOODLE_WEBSERVICE_TOKEN")
-    fastapi_app.moodle = httpx.AsyncClient(
-        base_url=f"{moodle_url}/webservice/rest/server.php",
-        params={"wstoken": token, "moodlewsrestformat": "json"},
+    settings = get_settings()
+    token = settings.moodle_webservice_token
+    fastapi_app.origins = create_origin_pool(settings)
+    archive = create_archive(settings)
+    fastapi_app.moodle = create_moodle_client(
+        settings,
+        "moodle",
+        "/webservice/rest/server.php",
+        {"wstoken": token, "moodlewsrestformat": "json"},
+        fastapi_app.origins,
+        archive,
+    )
+    fastapi_app.moodle_file = create_moodle_client(
+        settings,
+        "moodle_file",
+        "/webservice/pluginfile.php",
+        {"token": token},
+        fastapi_app.origins,
+        archive,
     )
-    fastapi_app.moodle_file = httpx.AsyncClient(
-        base_url=f"{moodle_url}/webservice/pluginfile.php", params={"token": token}
+    fastapi_app.cache = TTLCache(settings.cache_maxsize)
+    fastapi_app.shared_cache = create_shared_cache(settings, fastapi_app.cache)
+    fastapi_app.singleflight = SingleFlight()
+    fastapi_app.executor = create_executor(settings)
+    fastapi_app.file_store = None
+    if settings.file_store_path:
+        fastapi_app.file_store = FileStore(
+            settings.file_store_path, settings.file_store_maxsize
+        )
+    fastapi_app.search_index = SearchIndex() if settings.search else None
+    fastapi_app.jobs = JobQueue(
+        settings.jobs_workers, settings.jobs_queue_size, settings.jobs_ttl
     )
+    fastapi_app.jobs.start()
+    tasks = []
+    if fastapi_app.origins:
+        tasks.append(
+            asyncio.create_task(
+                fastapi_app.origins.run_health_checks(settings.moodle_health_interval)
+            )
+        )
+    if settings.warm_up:
+        tasks.append(asyncio.create_task(crawl(fastapi_app)))
 
     yield
 
+    for task in tasks:
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
+
+    await fastapi_app.jobs.aclose()
     await fastapi_app.moodle.aclose()
     await fastapi_app.moodle_file.aclose()
+    await fastapi_app.shared_cache.aclose()
+    if fastapi_app.origins:
+        await fastapi_app.origins.aclose()
+    fastapi_app.executor.shutdown(wait=False, cancel_futures=True)
+
+
+app = FastAPI(lifespan=lifespan, default_response_class=TimedJSONResponse)
+app.add_middleware(ETagMiddleware)
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(ServerTimingMiddleware)
+app.add_middleware(MetricsMiddleware)
+
+
+@app.exception_handler(UpstreamUnavailable)
+async def upstream_unavailable(_: Request, error: UpstreamUnavailable):
+    """Respond with a 503 error when Moodle upstream requests are shed."""
+    return TimedJSONResponse(
+        {"detail": str(error)},
+        status_code=503,
+        headers={"Retry-After": str(math.ceil(error.retry_after))},
+    )
 
 
-app = FastAPI(lifespan=lifespan)
+COURSE_FIELDS = {"id", "fullname", "url", "summary"}
+MODULE_FIELDS = {"id", "instance", "name", "modname", "url", "contents"}
 
 
-def patch_moodle_url(url: str) -> str:
-    """Replace the hostname in `url` with the `HOOK_MOODLE_URL` value."""
-    if not url:
+def parse_fields(fields: str, allowed: set[str]) -> set[str]:
+    """Return the set of comma-separated `fields`, or `None` if `fields` is empty.
+
+    Raise an HTTP 422 error if a field is not in the `allowed` fields.
+    """
+    if not fields:
         return None
 
-    moodle_url = urlparse(os.environ.get("HOOK_MOODLE_URL"))
-    moodle_netloc = moodle_url.netloc
-    moodle_scheme = moodle_url.scheme
-    return urlparse(url)._replace(netloc=moodle_netloc, scheme=moodle_scheme).geturl()
+    requested = {field.strip() for field in fields.split(",") if field.strip()}
+    unknown = requested - allowed
+    if unknown:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Unknown fields {sorted(unknown)}, allowed: {sorted(allowed)}",
+        )
+    return requested
 
 
 @app.get("/")
 async def root(request: Request, raw: bool = False):
     """Get Moodle site info."""
-    data = {"wsfunction": "core_webservice_get_site_info"}
-    result = (await request.app.moodle.post("/", data=data)).json()
+    result = await moodle_ws(request.app, "core_webservice_get_site_info")
     if raw:
         return result
 
@@ -56,128 +155,265 @@ async def root(request: Request, raw: bool = False):
     }
 
 
+@app.get("/admin/cache")
+async def cache_stats(request: Request):
+    """Get the webservice cache and request coalescing statistics."""
+    return {
+        **request.app.cache.stats(),
+        "coalesced": request.app.singleflight.coalesced,
+        "shared": request.app.shared_cache.stats(),
+    }
+
+
+@app.delete("/admin/cache")
+async def cache_invalidate(request: Request, wsfunction: str = None):
+    """Invalidate the local and shared caches, optionally only for a `wsfunction`.
+
+    Normalized results can be invalidated with the `courses`, `course_modules` and
+    `quiz` prefixes instead of a `wsfunction`. Course snapshots of the incremental
+    course sync are invalidated with the `course` prefix.
+    """
+    return {"invalidated": await request.app.shared_cache.invalidate(wsfunction)}
+
+
+@app.get("/admin/jobs")
+async def jobs_stats(request: Request):
+    """Get the number of background jobs by status."""
+    return request.app.jobs.stats()
+
+
+@app.get("/admin/search")
+async def search_stats(request: Request):
+    """Get the number of indexed courses, modules and terms."""
+    index = request.app.search_index
+    return index.stats() if index else None
+
+
+@app.get("/admin/pool")
+async def pool_stats(request: Request):
+    """Get the connection pool, guard and origins statistics of the Moodle clients."""
+    origins = request.app.origins
+    return {
+        **{
+            name: {**get_pool_stats(client), "guard": get_guard_stats(client)}
+            for name, client in (
+                ("moodle", request.app.moodle),
+                ("moodle_file", request.app.moodle_file),
+            )
+        },
+        "origins": origins.stats() if origins else None,
+    }
+
+
+@app.get("/metrics")
+async def metrics():
+    """Get the hook API and Moodle upstream metrics in the Prometheus text format."""
+    content, media_type = get_metrics()
+    return Response(content, headers={"Content-Type": media_type})
+
+
 @app.get("/courses")
-async def courses(request: Request, raw: bool = False):
-    """Get the list of visible Moodle courses."""
-    data = {"wsfunction": "core_course_get_courses"}
-    result = (await request.app.moodle.post("/", data=data)).json()
+async def courses(
+    request: Request,
+    raw: bool = False,
+    fields: str = None,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(None, gt=0),
+):
+    """Get the list of visible Moodle courses.
+
+    Courses can be restricted to comma-separated `fields` and paginated with
+    `offset` and `limit`. The total number of courses is returned in the
+    `X-Total-Count` header.
+    """
+    fields = parse_fields(fields, COURSE_FIELDS)
     if raw:
-        return result
+        return await moodle_ws(request.app, "core_course_get_courses")
+
+    visible_courses = await get_courses(request.app)
+    end = offset + limit if limit else None
+    return TimedJSONResponse(
+        [project(course, fields) for course in visible_courses[offset:end]],
+        headers={"X-Total-Count": str(len(visible_courses))},
+    )
+
 
-    return [
+@app.post("/courses/batch")
+async def courses_batch(
+    request: Request,
+    course_ids: list[int] = Body(),
+    html: bool = True,
+    fields: str = None,
+):
+    """Get the lists of visible Moodle course modules of `course_ids` by course id.
+
+    Courses are resolved concurrently and their contents are fetched in batches
+    when Moodle supports it. A Moodle error is returned in place of the modules of
+    a course that could not be retrieved.
+    """
+    fields = parse_fields(fields, MODULE_FIELDS)
+    html = html and (fields is None or "contents" in fields)
+    results = await resolve_courses_modules(request.app, course_ids, html)
+    return TimedJSONResponse(
         {
-            "id": course.get("id"),
-            "fullname": course.get("fullname"),
-            "url": patch_moodle_url(f"/course/view.php?id={course.get('id')}"),
-            "summary": course.get("summary"),
+            course_id: result
+            if isinstance(result, dict)
+            else [project(module, fields) for module in result]
+            for course_id, result in results.items()
         }
-        for course in result
-        if course.get("visible") and course.get("format") != "site"
-    ]
+    )
 
 
 @app.get("/courses/{course_id}")
-async def course(
-    request: Request, course_id: int, raw: bool = False, html: bool = True
+async def course(  # pylint: disable=too-many-arguments
+    request: Request,
+    course_id: int,
+    raw: bool = False,
+    html: bool = True,
+    stream: bool = False,
+    fields: str = None,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(None, gt=0),
 ):
-    """Get the list of visible Moodle course modules by `course_id`."""
-    data = {
-        "wsfunction": "core_course_get_contents",
-        "courseid": course_id,
-    }
-    result = (await request.app.moodle.post("/", data=data)).json()
+    """Get the list of visible Moodle course modules by `course_id`.
+
+    With `stream=1`, modules are streamed as newline-delimited JSON as soon as
+    their contents are resolved.
+
+    Modules can be restricted to comma-separated `fields` and paginated with
+    `offset` and `limit`; contents are only fetched for the modules of the page
+    and if the `contents` field is requested. The total number of modules is
+    returned in the `X-Total-Count` header.
+    """
+    fields = parse_fields(fields, MODULE_FIELDS)
+    html = html and (fields is None or "contents" in fields)
+    if not raw and not stream:
+        modules, total = await get_course_modules(
+            request.app, course_id, html, offset, limit
+        )
+        return TimedJSONResponse(
+            [project(module, fields) for module in modules],
+            headers={"X-Total-Count": str(total)},
+        )
+
+    result = await get_course_contents(request.app, course_id)
     if raw:
         return result
 
-    get_file = request.app.moodle_file.post
-    return [
-        {
-            "id": module.get("id"),
-            "instance": module.get("instance"),
-            "name": module.get("name"),
-            "modname": module.get("modname"),
-            "url": patch_moodle_url(module.get("url")),
-            "contents": [
-                {
-                    "type": content.get("type"),
-                    "mimetype": content.get("mimetype", "text/html"),
-                    "fileurl": patch_moodle_url(content["fileurl"])
-                    if content.get("type") == "file"
-                    else content["fileurl"],
-                    "content": (
-                        await get_file(patch_moodle_url(content["fileurl"]))
-                    ).text
-                    if content.get("type") == "file"
-                    and content.get("mimetype", "text/html").startswith("text")
-                    else None,
-                }
-                for content in module.get("contents", [])
-                if content.get("type") != "content" and content.get("fileurl")
-            ]
-            if module.get("modname") != "quiz" and html
-            else (await quiz(request, int(module.get("instance"))))
-            if html
-            else None,
-        }
-        for section in result
-        for module in section.get("modules", [])
-        if (
-            section.get("visible")
-            and module.get("visible")
-            and module.get("modname") != "label"
-        )
-    ]
+    modules = get_visible_modules(result)
+    end = offset + limit if limit else None
+    return StreamingResponse(
+        stream_course_modules(request.app, modules[offset:end], html, fields),
+        media_type="application/x-ndjson",
+        headers={"X-Total-Count": str(len(modules))},
+    )
 
 
-@app.get("/quiz/{quiz_id}")
-async def quiz(request: Request, quiz_id: int, raw: bool = False):
-    """Get Moodle quiz contents by `quiz_id`."""
-    data = {
-        "wsfunction": "mod_quiz_get_user_attempts",
-        "quizid": quiz_id,
-        "status": "all",
-        "includepreviews": 1,
-    }
-    attempts = (await request.app.moodle.post("/", data=data)).json()
-    # Try to retrieve existing attempt.
-    attempt = next(
-        (x["id"] for x in attempts.get("attempts", []) if x["state"] == "inprogress"),
-        None,
+@app.post("/courses/{course_id}/jobs", status_code=202)
+async def course_job(request: Request, course_id: int, html: bool = True):
+    """Resolve the visible Moodle course modules by `course_id` in a background job.
+
+    The job is returned at once, its state and result being available at the
+    `Location` of the response. Pending or running jobs of the same course are
+    deduplicated.
+    """
+    fastapi_app = request.app
+
+    async def resolve() -> list[Module]:
+        modules, _ = await get_course_modules(fastapi_app, course_id, html)
+        return modules
+
+    try:
+        job = fastapi_app.jobs.submit(("course_modules", course_id, html), resolve)
+    except asyncio.QueueFull as error:
+        raise HTTPException(status_code=503, detail="Too many pending jobs") from error
+    return TimedJSONResponse(
+        job.summary(), status_code=202, headers={"Location": f"/jobs/{job.id}"}
     )
 
-    # Create new attempt if no previous attempt exists.
-    if not attempt:
-        data = {
-            "wsfunction": "mod_quiz_start_attempt",
-            "quizid": quiz_id,
-        }
-        attempt = (await request.app.moodle.post("/", data=data)).json()["attempt"][
-            "id"
-        ]
-
-    # Submit attempt.
-    data = {
-        "wsfunction": "mod_quiz_process_attempt",
-        "attemptid": attempt,
-        "finishattempt": 1,
-    }
-    (await request.app.moodle.post("/", data=data)).json()
 
-    # Get attempt result.
-    data = {
-        "wsfunction": "mod_quiz_get_attempt_review",
-        "attemptid": attempt,
-    }
-    result = (await request.app.moodle.post("/", data=data)).json()
-    if raw:
-        return result
-    pattern = r"<!\[CDATA\[(.*?)\]\]>"
-    return [
-        {
-            "slot": question.get("slot"),
-            "type": question.get("type"),
-            "page": question.get("page"),
-            "html": re.sub(pattern, "", question.get("html"), flags=re.DOTALL),
-        }
-        for question in result.get("questions", [])
-    ]
+@app.get("/jobs/{job_id}")
+async def job_status(request: Request, job_id: str):
+    """Get the state and progress of a background job, with its result once done."""
+    job = request.app.jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return TimedJSONResponse(job.summary())
+
+
+@app.get("/search")
+async def search(
+    request: Request,
+    q: str = Query(min_length=1),
+    course_id: int = None,
+    limit: int = Query(20, gt=0, le=100),
+):
+    """Search the indexed course modules names, file contents and quiz questions.
+
+    Modules containing any word of the `q` query are ranked by relevance, without
+    calling Moodle. Only courses previously resolved with their contents are
+    indexed. The total number of matching modules is returned in the
+    `X-Total-Count` header.
+    """
+    index = request.app.search_index
+    if index is None:
+        raise HTTPException(status_code=404, detail="Search is disabled")
+
+    hits, total = index.search(q, course_id, limit)
+    return TimedJSONResponse(hits, headers={"X-Total-Count": str(total)})
+
+
+@app.get("/files/{path:path}")
+async def file(request: Request, path: str):
+    """Stream a Moodle file by its `pluginfile.php` `path`.
+
+    The file is streamed chunk by chunk. Range and conditional requests are
+    forwarded to Moodle. Paths with `.` or `..` segments or backslashes are
+    rejected, as they could reach other Moodle endpoints with the hook token.
+    """
+    if "\\" in path or any(segment in {".", ".."} for segment in path.split("/")):
+        raise HTTPException(status_code=400, detail="Invalid file path")
+
+    forwarded_request_headers = ("range", "if-range", "if-none-match")
+    upstream_request = request.app.moodle_file.build_request(
+        "GET",
+        f"/{path}",
+        params=request.query_params,
+        headers={
+            name: request.headers[name]
+            for name in forwarded_request_headers
+            if name in request.headers
+        },
+    )
+    if not upstream_request.url.path.startswith("/webservice/pluginfile.php/"):
+        raise HTTPException(status_code=400, detail="Invalid file path")
+
+    response = await request.app.moodle_file.send(upstream_request, stream=True)
+    forwarded_response_headers = (
+        "accept-ranges",
+        "cache-control",
+        "content-disposition",
+        "content-encoding",
+        "content-length",
+        "content-range",
+        "content-type",
+        "etag",
+        "last-modified",
+    )
+    # Raw (still encoded) chunks are forwarded to keep `Content-Length` accurate.
+    return StreamingResponse(
+        response.aiter_raw(),
+        status_code=response.status_code,
+        headers={
+            name: response.headers[name]
+            for name in forwarded_response_headers
+            if name in response.headers
+        },
+        background=BackgroundTask(response.aclose),
+    )
+
+
+@app.get("/quiz/{quiz_id}")
+async def quiz(request: Request, quiz_id: int, raw: bool = False):
+    """Get Moodle quiz contents by `quiz_id`."""
+    return TimedJSONResponse(await get_quiz(request.app, quiz_id, raw))
@@ -0,0 +1,176 @@
+"""Prometheus metrics of the hook API and its Moodle upstream calls."""
+
+import os
+import time
+from urllib.parse import parse_qs
+
+import httpx
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client.multiprocess import MultiProcessCollector
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, float("inf"))
+
+UPSTREAM_DURATION = Histogram(
+    "hook_upstream_request_duration_seconds",
+    "Duration of Moodle upstream requests until response headers are received.",
+    ["client", "function"],
+    buckets=BUCKETS,
+)
+UPSTREAM_ERRORS = Counter(
+    "hook_upstream_request_errors_total",
+    "Number of failed Moodle upstream requests.",
+    ["client", "function", "reason"],
+)
+UPSTREAM_IN_FLIGHT = Gauge(
+    "hook_upstream_requests_in_flight",
+    "Number of Moodle upstream requests in flight.",
+    ["client", "function"],
+    multiprocess_mode="livesum",
+)
+UPSTREAM_QUEUE_DEPTH = Gauge(
+    "hook_upstream_queue_depth",
+    "Number of Moodle upstream requests waiting for a concurrency limit slot.",
+    ["client"],
+    multiprocess_mode="livesum",
+)
+UPSTREAM_REJECTIONS = Counter(
+    "hook_upstream_rejections_total",
+    "Number of Moodle upstream requests shed to protect Moodle.",
+    ["client", "reason"],
+)
+UPSTREAM_CONCURRENCY_LIMIT = Gauge(
+    "hook_upstream_concurrency_limit",
+    "Adaptive concurrency limit of Moodle upstream requests.",
+    ["client"],
+    multiprocess_mode="liveall",
+)
+UPSTREAM_CIRCUIT_OPEN = Gauge(
+    "hook_upstream_circuit_open",
+    "Whether the circuit breaker of Moodle upstream requests is open.",
+    ["client"],
+    multiprocess_mode="liveall",
+)
+UPSTREAM_ORIGIN_HEALTHY = Gauge(
+    "hook_upstream_origin_healthy",
+    "Whether a Moodle origin (web node) receives upstream requests.",
+    ["origin"],
+    multiprocess_mode="liveall",
+)
+REQUEST_DURATION = Histogram(
+    "hook_request_duration_seconds",
+    "Duration of hook API requests.",
+    ["method", "route", "status"],
+    buckets=BUCKETS,
+)
+
+
+def get_upstream_function(request: httpx.Request) -> str:
+    """Return the Moodle webservice function name of the upstream `request`.
+
+    File downloads (which have no webservice function) are labelled `pluginfile`.
+    """
+    if "pluginfile.php" in request.url.path:
+        return "pluginfile"
+
+    wsfunction = request.url.params.get("wsfunction")
+    if not wsfunction and request.headers.get("content-type", "").startswith(
+        "application/x-www-form-urlencoded"
+    ):
+        wsfunction = parse_qs(request.content.decode()).get("wsfunction", [None])[0]
+
+    return wsfunction or "unknown"
+
+
+class MetricsTransport(httpx.AsyncBaseTransport):
+    """An HTTP transport recording metrics of the requests sent by `transport`.
+
+    Args:
+        transport (AsyncBaseTransport): The wrapped transport.
+        client (str): The name of the Moodle client, used as metric label.
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, client: str):
+        """Initialize the metrics transport."""
+        self.transport = transport
+        self.client = client
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        """Send the `request` and record its latency, errors and in-flight state."""
+        labels = (self.client, get_upstream_function(request))
+        in_flight = UPSTREAM_IN_FLIGHT.labels(*labels)
+        in_flight.inc()
+        start = time.perf_counter()
+        try:
+            response = await self.transport.handle_async_request(request)
+        except httpx.TransportError as error:
+            UPSTREAM_ERRORS.labels(*labels, type(error).__name__).inc()
+            raise
+        finally:
+            UPSTREAM_DURATION.labels(*labels).observe(time.perf_counter() - start)
+            in_flight.dec()
+
+        if response.status_code >= 400:
+            UPSTREAM_ERRORS.labels(*labels, str(response.status_code)).inc()
+        return response
+
+    async def aclose(self) -> None:
+        """Close the wrapped transport."""
+        await self.transport.aclose()
+
+
+class MetricsMiddleware:
+    """An ASGI middleware recording the duration of hook API requests by route."""
+
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, app: ASGIApp):
+        """Initialize the metrics middleware."""
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Handle the request and record its duration."""
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = "500"
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # The matched route is stored in the scope by the router; using its path
+            # template keeps the label cardinality bounded.
+            route = scope.get("route")
+            REQUEST_DURATION.labels(
+                scope["method"], getattr(route, "path", "unmatched"), status
+            ).observe(time.perf_counter() - start)
+
+
+def get_metrics() -> tuple[bytes, str]:
+    """Return the latest metrics in the Prometheus text format and its media type.
+
+    When `PROMETHEUS_MULTIPROC_DIR` is set (e.g. with several uvicorn workers),
+    metrics of all worker processes are aggregated.
+    """
+    registry = REGISTRY
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        MultiProcessCollector(registry)
+
+    return generate_latest(registry), CONTENT_TYPE_LATEST
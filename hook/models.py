@@ -0,0 +1,66 @@
+"""Typed models of the normalized hook API results."""
+
+from dataclasses import dataclass
+from typing import Any
+
+
+@dataclass(slots=True)
+class Course:
+    """A visible Moodle course."""
+
+    id: int
+    fullname: str
+    url: str
+    summary: str
+
+
+@dataclass(slots=True)
+class Content:
+    """A file or URL of a Moodle course module, with the text of text files."""
+
+    type: str
+    mimetype: str
+    fileurl: str
+    content: str
+
+
+@dataclass(slots=True)
+class Question:
+    """A question of a Moodle quiz attempt review, with its cleaned up HTML."""
+
+    slot: int
+    type: str
+    page: int
+    html: str
+
+
+@dataclass(slots=True)
+class Module:
+    """A visible Moodle course module, with its contents or quiz questions."""
+
+    id: int
+    instance: int
+    name: str
+    modname: str
+    url: str
+    contents: list[Content] | list[Question] | None
+
+
+@dataclass(slots=True)
+class SearchHit:
+    """A Moodle course module matching a search query, with its relevance score."""
+
+    course_id: int
+    id: int
+    name: str
+    modname: str
+    url: str
+    score: float
+
+
+def project(item: Any, fields: set[str]) -> Any:
+    """Return the model `item` as a dict restricted to `fields`, or as is if unset."""
+    if fields is None:
+        return item
+
+    return {name: getattr(item, name) for name in item.__slots__ if name in fields}
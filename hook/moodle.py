@@ -0,0 +1,624 @@
+"""Moodle webservices calls and normalization of their results."""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, AsyncIterator
+from urllib.parse import urlparse
+
+from fastapi import FastAPI
+
+from hook.conf import get_settings
+from hook.jobs import add_progress
+from hook.models import Content, Course, Module, Question, project
+from hook.postprocess import clean_quiz_questions, decode_text, postprocess
+from hook.search import index_course_modules
+from hook.serialization import decode_response, dumps, loads
+from hook.timing import timed
+
+logger = logging.getLogger(__name__)
+
+
+def patch_moodle_url(url: str) -> str:
+    """Replace the hostname in `url` with the `HOOK_MOODLE_URL` value."""
+    if not url:
+        return None
+
+    moodle_url = urlparse(os.environ.get("HOOK_MOODLE_URL"))
+    moodle_netloc = moodle_url.netloc
+    moodle_scheme = moodle_url.scheme
+    return urlparse(url)._replace(netloc=moodle_netloc, scheme=moodle_scheme).geturl()
+
+
+async def moodle_ws(fastapi_app: FastAPI, wsfunction: str, **params) -> Any:
+    """Call the Moodle `wsfunction` webservice with `params` and return its result.
+
+    Results of webservice functions having a configured TTL are cached and
+    concurrent identical calls to read-only webservice functions are coalesced.
+    """
+    settings = get_settings()
+    ttl = settings.cache_ttls.get(wsfunction)
+    key = (wsfunction, *sorted(params.items()))
+    if ttl:
+        result = fastapi_app.cache.get(key)
+        if result is not None:
+            return result
+
+    async def call():
+        return await moodle_ws_call(fastapi_app, wsfunction, **params)
+
+    if wsfunction in settings.singleflight_wsfunctions:
+        result = await fastapi_app.singleflight.do(key, call)
+    else:
+        result = await call()
+
+    # Moodle reports errors with a successful status code and an `exception` key.
+    if ttl and not (isinstance(result, dict) and "exception" in result):
+        fastapi_app.cache.set(key, result, ttl)
+
+    return result
+
+
+async def moodle_ws_call(fastapi_app: FastAPI, wsfunction: str, **params) -> Any:
+    """Call the Moodle `wsfunction` webservice with `params`, bypassing the cache."""
+    data = {"wsfunction": wsfunction, **params}
+    with timed("ws"):
+        return decode_response(await fastapi_app.moodle.post("/", data=data))
+
+
+async def moodle_ws_batch(
+    fastapi_app: FastAPI, wsfunction: str, params_list: list[dict]
+) -> list[Any]:
+    """Call the Moodle `wsfunction` webservice with each `params` of `params_list`.
+
+    Calls are sent in `tool_mobile_call_external_functions` requests of at most
+    `moodle_batch_size` calls. If batching is disabled or unavailable, they are run
+    concurrently, at most `moodle_concurrency` at once. Results are returned in the
+    order of `params_list`.
+    """
+    settings = get_settings()
+    results = [None] * len(params_list)
+    size = settings.moodle_batch_size
+    for start in range(0, len(params_list) if size else 0, size or 1):
+        batch = await call_external_functions(
+            fastapi_app, wsfunction, params_list[start : start + size]
+        )
+        if batch is None:
+            break
+        results[start : start + size] = batch
+
+    semaphore = asyncio.Semaphore(settings.moodle_concurrency)
+
+    async def call(index: int) -> None:
+        async with semaphore:
+            results[index] = await moodle_ws(
+                fastapi_app, wsfunction, **params_list[index]
+            )
+
+    await asyncio.gather(
+        *(call(index) for index, result in enumerate(results) if result is None)
+    )
+    return results
+
+
+async def call_external_functions(
+    fastapi_app: FastAPI, wsfunction: str, params_list: list[dict]
+) -> list[Any]:
+    """Call `wsfunction` with each `params` of `params_list` in a single request.
+
+    Cached results are not requested again. Return `None` if the
+    `tool_mobile_call_external_functions` webservice is not available (e.g. not
+    enabled for the webservice token).
+    """
+    ttl = get_settings().cache_ttls.get(wsfunction)
+    keys = [(wsfunction, *sorted(params.items())) for params in params_list]
+    results = [fastapi_app.cache.get(key) if ttl else None for key in keys]
+    missing = [index for index, result in enumerate(results) if result is None]
+    if not missing:
+        return results
+
+    data = {"wsfunction": "tool_mobile_call_external_functions"}
+    for request_index, index in enumerate(missing):
+        data[f"requests[{request_index}][function]"] = wsfunction
+        data[f"requests[{request_index}][arguments]"] = json.dumps(params_list[index])
+
+    with timed("ws"):
+        result = decode_response(await fastapi_app.moodle.post("/", data=data))
+
+    if isinstance(result, dict) and "exception" in result:
+        logger.warning("Failed to batch %s calls: %s", wsfunction, result)
+        return None
+
+    # Each response holds either JSON-encoded `data` or a JSON-encoded `exception`.
+    for index, response in zip(missing, result.get("responses", [])):
+        results[index] = loads(
+            response["exception"] if response.get("error") else response["data"]
+        )
+        if ttl and not response.get("error"):
+            fastapi_app.cache.set(keys[index], results[index], ttl)
+
+    return results
+
+
+async def get_course_contents(fastapi_app: FastAPI, course_id: int) -> Any:
+    """Return the sections of the Moodle course `course_id` with their modules.
+
+    With the `course_sync` setting, a snapshot of the course is kept and only the
+    modules updated since the last sync are refetched. Structural changes missed
+    by Moodle update tracking (e.g. deleted modules) are caught up by a full sync
+    once the snapshot expires after `course_sync_ttl` seconds.
+    """
+    if not get_settings().course_sync:
+        return await moodle_ws(
+            fastapi_app, "core_course_get_contents", courseid=course_id
+        )
+
+    key = ("course", course_id)
+    return await fastapi_app.singleflight.do(
+        key, lambda: sync_course_contents(fastapi_app, course_id)
+    )
+
+
+async def sync_course_contents(fastapi_app: FastAPI, course_id: int) -> Any:
+    """Update the snapshot of the Moodle course `course_id` and return its sections."""
+    key = ("course", course_id)
+    snapshot = fastapi_app.cache.get(key)
+    # Take the sync time before any upstream call not to miss concurrent updates.
+    now = int(time.time())
+    sections = None
+    if snapshot is not None:
+        sections, since = snapshot
+        sections = await patch_course_contents(fastapi_app, course_id, sections, since)
+
+    if sections is None:
+        sections = await moodle_ws_call(
+            fastapi_app, "core_course_get_contents", courseid=course_id
+        )
+
+    if not (isinstance(sections, dict) and "exception" in sections):
+        fastapi_app.cache.set(key, (sections, now), get_settings().course_sync_ttl)
+    return sections
+
+
+async def patch_course_contents(
+    fastapi_app: FastAPI, course_id: int, sections: list[dict], since: int
+) -> list[dict]:
+    """Return the course `sections` with the modules updated `since` refetched.
+
+    Return `None` if a full sync is needed (e.g. a module was added or hidden).
+    """
+    updates = await moodle_ws_call(
+        fastapi_app, "core_course_get_updates_since", courseid=course_id, since=since
+    )
+    if "exception" in updates:
+        return None
+
+    module_ids = {
+        instance["id"]
+        for instance in updates.get("instances", [])
+        if instance.get("contextlevel") == "module"
+    }
+    if not module_ids:
+        return sections
+
+    semaphore = asyncio.Semaphore(get_settings().moodle_concurrency)
+
+    async def get_module(module_id: int) -> dict:
+        async with semaphore:
+            result = await moodle_ws_call(
+                fastapi_app,
+                "core_course_get_contents",
+                courseid=course_id,
+                **{"options[0][name]": "cmid", "options[0][value]": module_id},
+            )
+        if isinstance(result, dict):
+            return None
+        return next(
+            (
+                module
+                for section in result
+                for module in section.get("modules", [])
+                if module.get("id") == module_id
+            ),
+            None,
+        )
+
+    modules = await asyncio.gather(*map(get_module, module_ids))
+    updated = {module["id"]: module for module in modules if module is not None}
+    if len(updated) < len(module_ids):
+        return None
+
+    # Copy the snapshot sections as they may be in use by concurrent requests.
+    patched = [
+        {
+            **section,
+            "modules": [
+                updated.pop(module.get("id"), module)
+                for module in section.get("modules", [])
+            ],
+        }
+        for section in sections
+    ]
+    # Modules missing from the snapshot have been added to the course.
+    return None if updated else patched
+
+
+async def get_courses(fastapi_app: FastAPI) -> list[Course]:
+    """Return the normalized visible Moodle courses.
+
+    Normalized courses are kept in the shared cache as long as the
+    `core_course_get_courses` results.
+    """
+    key = ("courses",)
+    courses = await fastapi_app.shared_cache.get(key)
+    if courses is not None:
+        return courses
+
+    result = await moodle_ws(fastapi_app, "core_course_get_courses")
+    courses = [
+        Course(
+            id=course.get("id"),
+            fullname=course.get("fullname"),
+            url=patch_moodle_url(f"/course/view.php?id={course.get('id')}"),
+            summary=course.get("summary"),
+        )
+        for course in result
+        if course.get("visible") and course.get("format") != "site"
+    ]
+    ttl = get_settings().cache_ttls.get("core_course_get_courses")
+    if ttl:
+        await fastapi_app.shared_cache.set(key, courses, ttl)
+    return courses
+
+
+async def get_course_modules(
+    fastapi_app: FastAPI,
+    course_id: int,
+    html: bool,
+    offset: int = 0,
+    limit: int = None,
+) -> tuple[list[Module], int]:
+    """Return a page of normalized visible modules of a course and their total.
+
+    Modules of fully resolved courses are kept in the shared cache as long as the
+    `core_course_get_contents` results, thus later pages are served from it.
+    Modules resolved with their contents are added to the search index.
+    """
+    key = ("course_modules", course_id, html)
+    end = offset + limit if limit else None
+    modules = await fastapi_app.shared_cache.get(key)
+    if modules is not None:
+        if html:
+            # Modules might have been resolved by another worker.
+            await index_course_modules(fastapi_app, course_id, modules, refresh=False)
+        return modules[offset:end], len(modules)
+
+    visible_modules = get_visible_modules(
+        await get_course_contents(fastapi_app, course_id)
+    )
+    page = visible_modules[offset:end]
+    modules = await resolve_course_modules(fastapi_app, page, html)
+    complete = len(page) == len(visible_modules)
+    if html:
+        await index_course_modules(fastapi_app, course_id, modules, complete)
+    ttl = get_settings().cache_ttls.get("core_course_get_contents")
+    if ttl and complete:
+        await fastapi_app.shared_cache.set(key, modules, ttl)
+    return modules, len(visible_modules)
+
+
+def get_visible_modules(sections: list[dict]) -> list[dict]:
+    """Return the visible modules of the visible course `sections`, except labels."""
+    return [
+        module
+        for section in sections
+        for module in section.get("modules", [])
+        if (
+            section.get("visible")
+            and module.get("visible")
+            and module.get("modname") != "label"
+        )
+    ]
+
+
+async def resolve_course_modules(
+    fastapi_app: FastAPI,
+    modules: list[dict],
+    html: bool,
+    semaphore: asyncio.Semaphore = None,
+) -> list[dict]:
+    """Return the normalized course `modules`, with their contents if `html` is set.
+
+    Upstream file and quiz requests are bounded by the `semaphore`, which defaults
+    to a new semaphore of `moodle_concurrency` shared across all modules. Resolved
+    modules are counted in the progress of the current background job, if any.
+    """
+    contents = [None] * len(modules)
+    add_progress(total=len(modules))
+    if html:
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(get_settings().moodle_concurrency)
+
+        async def resolve_module_contents(module: dict) -> Any:
+            module_contents = await get_module_contents(fastapi_app, module, semaphore)
+            add_progress(resolved=1)
+            return module_contents
+
+        contents = await asyncio.gather(*map(resolve_module_contents, modules))
+    else:
+        add_progress(resolved=len(modules))
+
+    return [
+        normalize_module(module, module_contents)
+        for module, module_contents in zip(modules, contents)
+    ]
+
+
+async def resolve_courses_modules(
+    fastapi_app: FastAPI, course_ids: list[int], html: bool
+) -> dict[int, Any]:
+    """Return the normalized visible modules of the courses `course_ids` by id.
+
+    Courses are resolved concurrently, sharing a single bound of
+    `moodle_concurrency` upstream file and quiz requests. Moodle errors are
+    returned as is in place of the course modules.
+    """
+    course_ids = list(dict.fromkeys(course_ids))
+    if get_settings().course_sync:
+        results = await asyncio.gather(
+            *(get_course_contents(fastapi_app, course_id) for course_id in course_ids)
+        )
+    else:
+        results = await moodle_ws_batch(
+            fastapi_app,
+            "core_course_get_contents",
+            [{"courseid": course_id} for course_id in course_ids],
+        )
+    semaphore = asyncio.Semaphore(get_settings().moodle_concurrency)
+
+    async def resolve(course_id: int, result: Any) -> Any:
+        if isinstance(result, dict) and "exception" in result:
+            return result
+        modules = get_visible_modules(result)
+        modules = await resolve_course_modules(fastapi_app, modules, html, semaphore)
+        if html:
+            await index_course_modules(fastapi_app, course_id, modules)
+        return modules
+
+    return dict(
+        zip(course_ids, await asyncio.gather(*map(resolve, course_ids, results)))
+    )
+
+
+async def stream_course_modules(
+    fastapi_app: FastAPI, modules: list[dict], html: bool, fields: set[str] = None
+) -> AsyncIterator[bytes]:
+    """Yield normalized course `modules` as newline-delimited JSON, in order.
+
+    Contents are resolved for at most `moodle_concurrency` modules ahead of the
+    last yielded one, which keeps memory usage flat for large courses. If `fields`
+    is set, modules are restricted to these fields.
+    """
+    window = get_settings().moodle_concurrency
+    semaphore = asyncio.Semaphore(window)
+    pending = deque()
+    try:
+        for module in modules:
+            contents = None
+            if html:
+                contents = asyncio.ensure_future(
+                    get_module_contents(fastapi_app, module, semaphore)
+                )
+            pending.append((module, contents))
+            if len(pending) < window:
+                continue
+            module, contents = pending.popleft()
+            contents = await contents if contents else None
+            yield dumps(project(normalize_module(module, contents), fields)) + b"\n"
+
+        while pending:
+            module, contents = pending.popleft()
+            contents = await contents if contents else None
+            yield dumps(project(normalize_module(module, contents), fields)) + b"\n"
+    finally:
+        # Cancel remaining upstream requests if the client went away.
+        for _, contents in pending:
+            if contents:
+                contents.cancel()
+
+
+def normalize_module(module: dict, contents: list[Content] | list[Question]) -> Module:
+    """Return the normalized Moodle course `module` with its `contents`."""
+    return Module(
+        id=module.get("id"),
+        instance=module.get("instance"),
+        name=module.get("name"),
+        modname=module.get("modname"),
+        url=patch_moodle_url(module.get("url")),
+        contents=contents,
+    )
+
+
+async def get_module_contents(
+    fastapi_app: FastAPI, module: dict, semaphore: asyncio.Semaphore
+) -> list[Content] | list[Question]:
+    """Get the normalized contents of a Moodle course `module`."""
+    if module.get("modname") == "quiz":
+        async with semaphore:
+            with timed("quiz"):
+                return await get_quiz(fastapi_app, int(module.get("instance")))
+
+    contents = [
+        content
+        for content in module.get("contents", [])
+        if content.get("type") != "content" and content.get("fileurl")
+    ]
+    texts = await asyncio.gather(
+        *(get_file_text(fastapi_app, content, semaphore) for content in contents)
+    )
+    return [
+        Content(
+            type=content.get("type"),
+            mimetype=content.get("mimetype", "text/html"),
+            fileurl=patch_moodle_url(content["fileurl"])
+            if content.get("type") == "file"
+            else content["fileurl"],
+            content=text,
+        )
+        for content, text in zip(contents, texts)
+    ]
+
+
+async def get_file_text(
+    fastapi_app: FastAPI, content: dict, semaphore: asyncio.Semaphore
+) -> str:
+    """Get the text of a Moodle file `content`, or `None` if it is not a text file.
+
+    When the file store is enabled, files are downloaded once per modification time.
+    """
+    if content.get("type") != "file" or not content.get(
+        "mimetype", "text/html"
+    ).startswith("text"):
+        return None
+
+    store = fastapi_app.file_store
+    url = content["fileurl"]
+    timemodified = content.get("timemodified")
+    if store is not None and timemodified:
+        with timed("store"):
+            text = await asyncio.to_thread(store.read_text, url, timemodified)
+        if text is not None:
+            return text
+
+    async with semaphore:
+        with timed("file"):
+            response = await fastapi_app.moodle_file.post(patch_moodle_url(url))
+
+    text = await postprocess(
+        fastapi_app,
+        len(response.content),
+        decode_text,
+        response.content,
+        response.encoding,
+    )
+    if store is not None and timemodified and response.is_success:
+        await asyncio.to_thread(store.write_text, url, timemodified, text)
+    return text
+
+
+async def get_quiz(fastapi_app: FastAPI, quiz_id: int, raw: bool = False):
+    """Return the questions of the Moodle quiz `quiz_id` from an attempt review.
+
+    With the `quiz_reuse_attempts` setting, the review of a finished attempt is
+    reused and the questions are cached until the quiz is modified. Otherwise, an
+    attempt is submitted on each call.
+    """
+    settings = get_settings()
+    timemodified = None
+    if settings.quiz_reuse_attempts:
+        timemodified = await get_quiz_timemodified(fastapi_app, quiz_id)
+
+    if timemodified is None:
+        review = await get_quiz_review(fastapi_app, quiz_id)
+        return review if raw else await get_quiz_questions(fastapi_app, review)
+
+    key = ("quiz", quiz_id, timemodified)
+    if not raw:
+        questions = await fastapi_app.shared_cache.get(key)
+        if questions is not None:
+            return questions
+
+    review = await get_quiz_review(fastapi_app, quiz_id, timemodified)
+    if raw:
+        return review
+
+    questions = await get_quiz_questions(fastapi_app, review)
+    await fastapi_app.shared_cache.set(key, questions, settings.quiz_cache_ttl)
+    return questions
+
+
+async def get_quiz_timemodified(fastapi_app: FastAPI, quiz_id: int) -> int:
+    """Return the last modification time of the quiz `quiz_id` or `None`."""
+    result = await moodle_ws(
+        fastapi_app,
+        "core_course_get_course_module_by_instance",
+        module="quiz",
+        instance=quiz_id,
+    )
+    course_id = result.get("cm", {}).get("course")
+    if not course_id:
+        return None
+
+    result = await moodle_ws(
+        fastapi_app, "mod_quiz_get_quizzes_by_courses", **{"courseids[0]": course_id}
+    )
+    return next(
+        (
+            quiz.get("timemodified")
+            for quiz in result.get("quizzes", [])
+            if quiz.get("id") == quiz_id
+        ),
+        None,
+    )
+
+
+async def get_quiz_review(
+    fastapi_app: FastAPI, quiz_id: int, timemodified: int = None
+) -> dict:
+    """Return an attempt review of the Moodle quiz `quiz_id`.
+
+    If `timemodified` is set, the last attempt finished after this time is reused.
+    Otherwise, an attempt is submitted.
+    """
+    attempts = await moodle_ws(
+        fastapi_app,
+        "mod_quiz_get_user_attempts",
+        quizid=quiz_id,
+        status="all",
+        includepreviews=1,
+    )
+    attempts = attempts.get("attempts", [])
+    # Try to reuse a finished attempt started after the last quiz modification.
+    attempt = None
+    if timemodified is not None:
+        attempt = next(
+            (
+                x["id"]
+                for x in reversed(attempts)
+                if x["state"] == "finished" and x.get("timestart", 0) >= timemodified
+            ),
+            None,
+        )
+
+    if not attempt:
+        # Try to retrieve existing attempt.
+        attempt = next(
+            (x["id"] for x in attempts if x["state"] == "inprogress"),
+            None,
+        )
+
+        # Create new attempt if no previous attempt exists.
+        if not attempt:
+            attempt = (
+                await moodle_ws(fastapi_app, "mod_quiz_start_attempt", quizid=quiz_id)
+            )["attempt"]["id"]
+
+        # Submit attempt.
+        await moodle_ws(
+            fastapi_app, "mod_quiz_process_attempt", attemptid=attempt, finishattempt=1
+        )
+
+    # Get attempt result.
+    return await moodle_ws(
+        fastapi_app, "mod_quiz_get_attempt_review", attemptid=attempt
+    )
+
+
+async def get_quiz_questions(fastapi_app: FastAPI, review: dict) -> list[Question]:
+    """Return the normalized questions of a quiz attempt `review`."""
+    questions = review.get("questions", [])
+    size = sum(len(question.get("html") or "") for question in questions)
+    return await postprocess(fastapi_app, size, clean_quiz_questions, questions)
@@ -0,0 +1,63 @@
+"""Post-processing of Moodle contents off the event loop."""
+
+import asyncio
+import re
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable
+
+from fastapi import FastAPI
+
+from hook.conf import Settings, get_settings
+from hook.models import Question
+from hook.timing import timed
+
+CDATA_PATTERN = re.compile(r"<!\[CDATA\[(.*?)\]\]>", flags=re.DOTALL)
+
+
+def clean_html(html: str) -> str:
+    """Return the Moodle `html` without its CDATA sections (e.g. inline scripts)."""
+    return CDATA_PATTERN.sub("", html)
+
+
+def clean_quiz_questions(questions: list[dict]) -> list[Question]:
+    """Return the normalized quiz `questions` with their HTML cleaned up."""
+    return [
+        Question(
+            slot=question.get("slot"),
+            type=question.get("type"),
+            page=question.get("page"),
+            html=clean_html(question.get("html")),
+        )
+        for question in questions
+    ]
+
+
+def decode_text(content: bytes, encoding: str) -> str:
+    """Return the `content` decoded with `encoding`, replacing invalid characters."""
+    return content.decode(encoding, errors="replace")
+
+
+def create_executor(settings: Settings) -> Executor:
+    """Return the post-processing pool configured by the `settings`."""
+    if settings.postprocess_executor == "process":
+        return ProcessPoolExecutor(max_workers=settings.postprocess_workers)
+
+    return ThreadPoolExecutor(
+        max_workers=settings.postprocess_workers, thread_name_prefix="postprocess"
+    )
+
+
+async def postprocess(
+    fastapi_app: FastAPI, size: int, func: Callable, *args: Any
+) -> Any:
+    """Return `func(*args)`, computed in the post-processing pool for large payloads.
+
+    Payloads of `size` below the `postprocess_threshold` setting are processed
+    inline, as the pool round trip would cost more than it saves.
+    """
+    with timed("postprocess"):
+        executor = fastapi_app.executor
+        if executor is None or size < get_settings().postprocess_threshold:
+            return func(*args)
+
+        return await asyncio.get_running_loop().run_in_executor(executor, func, *args)
@@ -0,0 +1,208 @@
+"""Recording and replay of Moodle upstream exchanges."""
+
+import asyncio
+import base64
+import gzip
+import hashlib
+import json
+import logging
+import random
+from collections import defaultdict
+from pathlib import Path
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Query parameters holding Moodle credentials, never recorded nor matched.
+SECRET_PARAMS = {"token", "wstoken"}
+# Response headers describing the original encoding of the recorded content.
+ENCODING_HEADERS = {"content-encoding", "content-length", "transfer-encoding"}
+
+
+def get_exchange_key(request: httpx.Request) -> str:
+    """Return the key matching the `request` with its recorded response.
+
+    The key is made of the request method, path, query (without credentials) and
+    body digest, thus requests match whatever Moodle origin they were sent to.
+    """
+    params = sorted(
+        (name, value)
+        for name, value in request.url.params.multi_items()
+        if name not in SECRET_PARAMS
+    )
+    query = "&".join(f"{name}={value}" for name, value in params)
+    digest = hashlib.sha256(request.content).hexdigest()[:16]
+    return f"{request.method} {request.url.path}?{query} {digest}"
+
+
+class Archive:
+    """An on-disk archive of Moodle upstream exchanges.
+
+    Exchanges are stored as gzip-compressed JSON lines. New exchanges are buffered
+    in memory until flushed, each flush appending a separate gzip member.
+    Responses recorded several times for the same request (e.g. quiz attempts)
+    are replayed in order, the last one being repeated.
+
+    Args:
+        path (Path): The archive file path.
+    """
+
+    def __init__(self, path: Path):
+        """Initialize the archive, loading exchanges recorded in `path`."""
+        self.path = Path(path)
+        self.exchanges: dict[str, list[dict]] = defaultdict(list)
+        self._replayed: dict[str, int] = defaultdict(int)
+        self._pending: list[str] = []
+        self._lock = asyncio.Lock()
+        if self.path.exists():
+            with gzip.open(self.path, "rt", encoding="utf-8") as file:
+                for line in file:
+                    exchange = json.loads(line)
+                    self.exchanges[exchange.pop("key")].append(exchange)
+        logger.info("Loaded %d recorded exchanges", len(self))
+
+    def __len__(self) -> int:
+        """Return the number of recorded exchanges."""
+        return sum(map(len, self.exchanges.values()))
+
+    def record(self, request: httpx.Request, response: httpx.Response) -> None:
+        """Add the `request` exchange with its read `response` to the archive.
+
+        The exchange is written to disk by the next `flush`.
+        """
+        key = get_exchange_key(request)
+        exchange = {
+            "status": response.status_code,
+            "headers": [
+                (name, value)
+                for name, value in response.headers.items()
+                if name not in ENCODING_HEADERS and name != "set-cookie"
+            ],
+            "content": base64.b64encode(response.content).decode("ascii"),
+        }
+        self.exchanges[key].append(exchange)
+        self._pending.append(json.dumps({"key": key, **exchange}) + "\n")
+
+    async def flush(self) -> None:
+        """Append the buffered exchanges to the archive file, off the event loop."""
+        async with self._lock:
+            while self._pending:
+                lines, self._pending = self._pending, []
+                await asyncio.to_thread(self._write, lines)
+
+    def _write(self, lines: list[str]) -> None:
+        """Append the exchange `lines` to the archive file as a new gzip member."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with gzip.open(self.path, "at", encoding="utf-8") as file:
+            file.writelines(lines)
+
+    def replay(self, request: httpx.Request) -> httpx.Response:
+        """Return the recorded response to the `request` or `None` if missing.
+
+        The response is returned as an unread stream, as sent by a live transport.
+        """
+        key = get_exchange_key(request)
+        exchanges = self.exchanges.get(key)
+        if not exchanges:
+            return None
+
+        index = min(self._replayed[key], len(exchanges) - 1)
+        self._replayed[key] += 1
+        exchange = exchanges[index]
+        return httpx.Response(
+            exchange["status"],
+            headers=exchange["headers"],
+            stream=httpx.ByteStream(base64.b64decode(exchange["content"])),
+            request=request,
+        )
+
+
+class RecordTransport(httpx.AsyncBaseTransport):
+    """An HTTP transport recording the exchanges of the wrapped transport.
+
+    Responses are read in full to be recorded, then returned as unread streams
+    for callers streaming them (e.g. files). Recorded exchanges are flushed to the
+    archive file in the background, and once the transport is closed.
+
+    Args:
+        transport (AsyncBaseTransport): The wrapped transport.
+        archive (Archive): The archive exchanges are recorded to.
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, archive: Archive):
+        """Initialize the record transport."""
+        self.transport = transport
+        self.archive = archive
+        self._flush: asyncio.Task = None
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        """Send the `request` and record its response."""
+        response = await self.transport.handle_async_request(request)
+        try:
+            content = await response.aread()
+        finally:
+            await response.aclose()
+
+        self.archive.record(request, response)
+        if self._flush is None or self._flush.done():
+            self._flush = asyncio.create_task(self.archive.flush())
+        return httpx.Response(
+            response.status_code,
+            headers=[
+                (name, value)
+                for name, value in response.headers.multi_items()
+                if name not in ENCODING_HEADERS
+            ],
+            stream=httpx.ByteStream(content),
+            request=request,
+        )
+
+    async def aclose(self) -> None:
+        """Flush the recorded exchanges and close the wrapped transport."""
+        await self.archive.flush()
+        await self.transport.aclose()
+
+
+class ReplayTransport(httpx.AsyncBaseTransport):
+    """An HTTP transport serving recorded exchanges instead of Moodle.
+
+    Each response is delayed by `latency` seconds, give or take up to `jitter`
+    seconds. Requests missing from the archive get a 404 Moodle exception.
+
+    Args:
+        archive (Archive): The archive exchanges are replayed from.
+        latency (float): The mean injected latency (in seconds).
+        jitter (float): The maximum deviation (in seconds) from the `latency`.
+    """
+
+    def __init__(self, archive: Archive, latency: float = 0, jitter: float = 0):
+        """Initialize the replay transport."""
+        self.archive = archive
+        self.latency = latency
+        self.jitter = jitter
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        """Return the recorded response to the `request`."""
+        delay = self.latency + random.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        response = self.archive.replay(request)
+        if response is None:
+            key = get_exchange_key(request)
+            logger.warning("No recorded response for %s", key)
+            content = json.dumps(
+                {
+                    "exception": "replay_miss",
+                    "errorcode": "replaymiss",
+                    "message": f"No recorded response for {key}",
+                }
+            ).encode()
+            response = httpx.Response(
+                404,
+                headers={"content-type": "application/json"},
+                stream=httpx.ByteStream(content),
+                request=request,
+            )
+        return response
@@ -0,0 +1,196 @@
+"""Full-text search index over the resolved Moodle course modules."""
+
+import heapq
+import html
+import math
+import re
+from collections import Counter, defaultdict
+
+from fastapi import FastAPI
+
+from hook.models import Content, Module, Question, SearchHit
+from hook.postprocess import postprocess
+
+SCRIPT_PATTERN = re.compile(
+    r"<(script|style)\b.*?</\1\s*>", flags=re.DOTALL | re.IGNORECASE
+)
+TAG_PATTERN = re.compile(r"<[^>]*>")
+TOKEN_PATTERN = re.compile(r"\w\w+")
+# Weight of module name terms over content terms.
+NAME_WEIGHT = 3
+# BM25 ranking parameters.
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def tokenize(text: str) -> list[str]:
+    """Return the lowercased words of the HTML `text`, without tags and scripts."""
+    if not text:
+        return []
+
+    text = TAG_PATTERN.sub(" ", SCRIPT_PATTERN.sub(" ", text))
+    return TOKEN_PATTERN.findall(html.unescape(text).lower())
+
+
+def get_text(item: Content | Question) -> str:
+    """Return the text of a module content `item` or the HTML of a quiz question."""
+    return item.html if isinstance(item, Question) else item.content
+
+
+def get_module_terms(module: Module) -> dict[str, int]:
+    """Return the weighted term frequencies of the `module` name and contents.
+
+    Contents are the text of files and the HTML of quiz questions.
+    """
+    terms = Counter()
+    for term in tokenize(module.name):
+        terms[term] += NAME_WEIGHT
+    for item in module.contents or []:
+        terms.update(tokenize(get_text(item)))
+    return dict(terms)
+
+
+def get_modules_terms(modules: list[Module]) -> list[dict[str, int]]:
+    """Return the weighted term frequencies of each of the `modules`."""
+    return [get_module_terms(module) for module in modules]
+
+
+class SearchIndex:
+    """An inverted index of course modules, ranked with BM25.
+
+    Modules are indexed by course and module id, indexing a module again replacing
+    its previous terms. Only the module metadata and term frequencies are kept.
+    """
+
+    def __init__(self):
+        """Initialize an empty index."""
+        self._postings: dict[str, dict[tuple, int]] = defaultdict(dict)
+        self._documents: dict[tuple, tuple[SearchHit, int, tuple[str, ...]]] = {}
+        self._courses: dict[int, set[tuple]] = defaultdict(set)
+        self._length = 0
+
+    def __len__(self) -> int:
+        """Return the number of indexed modules."""
+        return len(self._documents)
+
+    def __contains__(self, course_id: int) -> bool:
+        """Return whether modules of the course `course_id` are indexed."""
+        return course_id in self._courses
+
+    def add(self, course_id: int, module: Module, terms: dict[str, int]) -> None:
+        """Index the `module` of the course `course_id` with its `terms`."""
+        key = (course_id, module.id)
+        self.remove(key)
+        hit = SearchHit(
+            course_id, module.id, module.name, module.modname, module.url, 0
+        )
+        length = sum(terms.values())
+        self._documents[key] = (hit, length, tuple(terms))
+        self._courses[course_id].add(key)
+        self._length += length
+        for term, frequency in terms.items():
+            self._postings[term][key] = frequency
+
+    def remove(self, key: tuple) -> None:
+        """Remove the module of `key`, a (course id, module id) tuple, if indexed."""
+        document = self._documents.pop(key, None)
+        if document is None:
+            return
+
+        _, length, terms = document
+        self._length -= length
+        course_keys = self._courses[key[0]]
+        course_keys.discard(key)
+        if not course_keys:
+            del self._courses[key[0]]
+        for term in terms:
+            postings = self._postings[term]
+            del postings[key]
+            if not postings:
+                del self._postings[term]
+
+    def replace_course(
+        self, course_id: int, modules: list[Module], terms: list[dict[str, int]]
+    ) -> None:
+        """Index the `modules` of the course `course_id`, removing the other ones."""
+        keys = {(course_id, module.id) for module in modules}
+        for key in self._courses.get(course_id, set()) - keys:
+            self.remove(key)
+        for module, module_terms in zip(modules, terms):
+            self.add(course_id, module, module_terms)
+
+    def search(
+        self, query: str, course_id: int = None, limit: int = 20
+    ) -> tuple[list[SearchHit], int]:
+        """Return the `limit` best modules matching the `query` and their total.
+
+        Modules match if they contain any query term, and are ranked with BM25. If
+        `course_id` is set, only modules of this course are searched.
+        """
+        scores = self._score(tokenize(query), course_id)
+        best = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+        hits = []
+        for key, score in best:
+            hit = self._documents[key][0]
+            hits.append(
+                SearchHit(hit.course_id, hit.id, hit.name, hit.modname, hit.url, score)
+            )
+        return hits, len(scores)
+
+    def _score(self, terms: list[str], course_id: int = None) -> dict[tuple, float]:
+        """Return the BM25 scores of the modules containing any of the `terms`."""
+        count = len(self._documents)
+        average_length = self._length / count if count else 1
+        scores = defaultdict(float)
+        for term in set(terms):
+            postings = self._postings.get(term, {})
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for key, frequency in postings.items():
+                if course_id is not None and key[0] != course_id:
+                    continue
+                length = self._documents[key][1]
+                norm = 1 - BM25_B + BM25_B * length / average_length
+                scores[key] += (
+                    idf * frequency * (BM25_K1 + 1) / (frequency + BM25_K1 * norm)
+                )
+        return scores
+
+    def stats(self) -> dict:
+        """Return the number of indexed courses, modules and terms."""
+        return {
+            "courses": len(self._courses),
+            "modules": len(self._documents),
+            "terms": len(self._postings),
+        }
+
+
+async def index_course_modules(
+    fastapi_app: FastAPI,
+    course_id: int,
+    modules: list[Module],
+    complete: bool = True,
+    refresh: bool = True,
+) -> None:
+    """Index the resolved `modules` of the course `course_id`, if search is enabled.
+
+    If `complete` is set, `modules` are all the course modules and other modules
+    of the course are removed from the index. Unless `refresh` is set, already
+    indexed courses are skipped. Terms are extracted off the event loop for large
+    contents.
+    """
+    index = fastapi_app.search_index
+    if index is None or (not refresh and course_id in index):
+        return
+
+    size = sum(
+        len(get_text(item) or "")
+        for module in modules
+        for item in module.contents or []
+    )
+    terms = await postprocess(fastapi_app, size, get_modules_terms, modules)
+    if complete:
+        index.replace_course(course_id, modules, terms)
+        return
+
+    for module, module_terms in zip(modules, terms):
+        index.add(course_id, module, module_terms)
@@ -0,0 +1,63 @@
+"""Fast JSON and MessagePack serialization of hook API results."""
+
+import json
+from typing import Any
+
+import httpx
+import orjson
+
+from hook.conf import get_settings
+from hook.models import Content, Course, Module, Question
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+# MessagePack extension type codes of the models, by index. Append new models only,
+# as codes are persisted in the shared cache.
+MODELS = (Course, Content, Question, Module)
+
+
+def dumps(content: Any) -> bytes:
+    """Return the `content` encoded to JSON, including models and non-str keys."""
+    # pylint: disable=no-member
+    return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+def loads(data: bytes | str) -> Any:
+    """Return the JSON `data` decoded with the `moodle_json_decoder` setting."""
+    if get_settings().moodle_json_decoder == "orjson":
+        return orjson.loads(data)  # pylint: disable=no-member
+
+    return json.loads(data)
+
+
+def decode_response(response: httpx.Response) -> Any:
+    """Return the JSON body of the Moodle `response`."""
+    if get_settings().moodle_json_decoder == "orjson":
+        return orjson.loads(response.content)  # pylint: disable=no-member
+
+    return response.json()
+
+
+def pack(value: Any) -> bytes:
+    """Return the `value` serialized with MessagePack.
+
+    Models are packed as extension types holding their field values only.
+    """
+
+    def default(obj: Any) -> Any:
+        values = [getattr(obj, name) for name in obj.__slots__]
+        return msgpack.ExtType(MODELS.index(type(obj)), pack(values))
+
+    return msgpack.packb(value, default=default)
+
+
+def unpack(data: bytes) -> Any:
+    """Return the MessagePack `data` deserialized, restoring models."""
+
+    def ext_hook(code: int, ext_data: bytes) -> Any:
+        return MODELS[code](*unpack(ext_data))
+
+    return msgpack.unpackb(data, ext_hook=ext_hook)
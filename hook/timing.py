@@ -0,0 +1,119 @@
+"""Server-Timing breakdown of hook API requests."""
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Iterator
+from urllib.parse import parse_qs
+
+from fastapi.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from hook.conf import get_settings
+from hook.serialization import dumps
+
+server_timing: ContextVar["ServerTiming"] = ContextVar("server_timing", default=None)
+
+
+class ServerTiming:
+    """The cumulated durations of the phases of a hook API request.
+
+    Phases running concurrently (e.g. file downloads) are summed up, thus a phase
+    duration might exceed the total request duration.
+    """
+
+    def __init__(self):
+        """Initialize an empty phase breakdown."""
+        self.start = time.perf_counter()
+        self.durations: dict[str, float] = {}
+        self.counts: dict[str, int] = {}
+
+    def add(self, name: str, duration: float) -> None:
+        """Add `duration` seconds to the `name` phase."""
+        self.durations[name] = self.durations.get(name, 0) + duration
+        self.counts[name] = self.counts.get(name, 0) + 1
+
+    def header(self) -> str:
+        """Return the `Server-Timing` header value, including the total duration."""
+        metrics = [
+            f'{name};dur={duration * 1000:.1f};desc="{self.counts[name]}x"'
+            for name, duration in self.durations.items()
+        ]
+        metrics.append(f"total;dur={(time.perf_counter() - self.start) * 1000:.1f}")
+        return ", ".join(metrics)
+
+
+@contextmanager
+def timed(name: str) -> Iterator[None]:
+    """Record the duration of the wrapped block as the `name` phase.
+
+    Nothing is recorded when Server-Timing is not enabled for the current request.
+    """
+    timing = server_timing.get()
+    if timing is None:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing.add(name, time.perf_counter() - start)
+
+
+class TimedJSONResponse(JSONResponse):
+    """A JSON response recording its rendering as the `serialize` phase.
+
+    The `content` is rendered with orjson, which also encodes the hook models.
+    Endpoints returning large results should return this response directly, which
+    skips the costly `jsonable_encoder` conversion done by FastAPI.
+    """
+
+    def render(self, content: Any) -> bytes:
+        """Render the `content` to JSON."""
+        with timed("serialize"):
+            return dumps(content)
+
+
+class ServerTimingMiddleware:
+    """An ASGI middleware adding a `Server-Timing` header to hook API responses.
+
+    The header is added when the `server_timing` setting is enabled or when the
+    request has a `timing=1` query parameter.
+    """
+
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, app: ASGIApp):
+        """Initialize the Server-Timing middleware."""
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Handle the request and add the `Server-Timing` header to its response."""
+        if scope["type"] != "http" or not self.is_enabled(scope):
+            await self.app(scope, receive, send)
+            return
+
+        timing = ServerTiming()
+        token = server_timing.set(timing)
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", timing.header().encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            server_timing.reset(token)
+
+    @staticmethod
+    def is_enabled(scope: Scope) -> bool:
+        """Return whether Server-Timing is enabled for the request `scope`."""
+        if get_settings().server_timing:
+            return True
+
+        query = parse_qs(scope.get("query_string", b"").decode())
+        return query.get("timing", ["0"])[-1].lower() in {"1", "true", "on", "yes"}
@@ -0,0 +1,125 @@
+"""Moodle upstream HTTP clients."""
+
+import httpx
+
+from hook.balancer import BalancerTransport, OriginPool
+from hook.conf import Settings
+from hook.guard import AdaptiveLimiter, CircuitBreaker, GuardTransport
+from hook.metrics import MetricsTransport
+from hook.replay import Archive, RecordTransport, ReplayTransport
+
+
+def create_archive(settings: Settings) -> Archive:
+    """Return the upstream archive or `None` if the `upstream_mode` is `live`."""
+    if settings.upstream_mode == "live":
+        return None
+
+    return Archive(settings.upstream_archive)
+
+
+def create_origin_pool(settings: Settings) -> OriginPool:
+    """Return the pool of Moodle web nodes or `None` if `moodle_origins` is unset.
+
+    No pool is used when upstream exchanges are replayed.
+    """
+    if not settings.moodle_origins or settings.upstream_mode == "replay":
+        return None
+
+    return OriginPool(
+        settings.moodle_origins,
+        settings.moodle_origin_max_failures,
+        settings.moodle_health_path,
+        settings.moodle_connect_timeout,
+    )
+
+
+def create_moodle_client(  # pylint: disable=too-many-arguments
+    settings: Settings,
+    name: str,
+    path: str,
+    params: dict,
+    origins: OriginPool = None,
+    archive: Archive = None,
+) -> httpx.AsyncClient:
+    """Return an instrumented HTTP client named `name` for the Moodle `path` endpoint.
+
+    The client uses the connection pooling settings, records upstream metrics and
+    is guarded against Moodle overload if the `guard` setting is enabled. Requests
+    are spread across the `origins` Moodle web nodes if given. Exchanges are
+    recorded to or replayed from the `archive` according to the `upstream_mode`.
+    """
+    if settings.upstream_mode == "replay":
+        transport = ReplayTransport(
+            archive, settings.replay_latency, settings.replay_jitter
+        )
+    else:
+        transport = httpx.AsyncHTTPTransport(
+            http2=settings.moodle_http2,
+            limits=httpx.Limits(
+                max_connections=settings.moodle_max_connections,
+                max_keepalive_connections=settings.moodle_max_keepalive_connections,
+                keepalive_expiry=settings.moodle_keepalive_expiry,
+            ),
+        )
+    if settings.upstream_mode == "record":
+        transport = RecordTransport(transport, archive)
+    if origins is not None:
+        transport = BalancerTransport(transport, origins)
+    transport = MetricsTransport(transport, name)
+    if settings.guard:
+        limiter = AdaptiveLimiter(
+            settings.guard_initial_limit,
+            settings.guard_min_limit,
+            settings.guard_max_limit,
+            settings.guard_latency_target,
+            settings.guard_queue_size,
+            settings.guard_queue_timeout,
+        )
+        breaker = CircuitBreaker(
+            settings.guard_failure_threshold, settings.guard_open_duration
+        )
+        transport = GuardTransport(transport, name, limiter, breaker)
+
+    return httpx.AsyncClient(
+        base_url=f"{settings.moodle_url}{path}",
+        params=params,
+        timeout=httpx.Timeout(
+            settings.moodle_timeout, connect=settings.moodle_connect_timeout
+        ),
+        transport=transport,
+    )
+
+
+def get_guard_stats(client: httpx.AsyncClient) -> dict:
+    """Return the guard statistics of the Moodle `client` or `None` if unguarded."""
+    # pylint: disable=protected-access
+    if isinstance(client._transport, GuardTransport):
+        return client._transport.stats()
+    return None
+
+
+def get_pool_stats(client: httpx.AsyncClient) -> dict:
+    """Return the connection pool usage statistics of the Moodle `client`.
+
+    Statistics are empty when upstream exchanges are replayed.
+    """
+    # pylint: disable=protected-access
+    transport = client._transport
+    while not isinstance(transport, httpx.AsyncHTTPTransport):
+        transport = getattr(transport, "transport", None)
+        if transport is None:
+            return {}
+    pool = transport._pool
+    connections = pool.connections
+    requests = getattr(pool, "_requests", [])
+    queued = sum(request.is_queued() for request in requests)
+    idle = sum(connection.is_idle() for connection in connections)
+    return {
+        "connections": len(connections),
+        "idle_connections": idle,
+        "active_connections": len(connections) - idle,
+        "active_requests": len(requests) - queued,
+        "queued_requests": queued,
+        "max_connections": pool._max_connections,
+        "max_keepalive_connections": pool._max_keepalive_connections,
+    }
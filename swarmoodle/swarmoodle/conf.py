@@ -86,6 +86,9 @@ class Settings(BaseSettings):
     oulad_code_module: Literal["AAA", "BBB", "CCC", "DDD", "EEE", "FFF", "GGG"] = "AAA"
     oulad_code_presentation: Literal["2013B", "2013J", "2014J", "2014B"] = "2013J"
     oulad_default_path: Path = Path("/app/data/OULAD")
+    # Directory of the columnar (Parquet) cache of the OULAD CSV files, defaulting
+    # to a `parquet` directory next to them.
+    oulad_cache_path: Path | None = None
 
     redis_dsn: RedisDsn = "redis://redis:6379"
 
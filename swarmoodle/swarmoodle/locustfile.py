@@ -27,11 +27,7 @@ from swarmoodle.moodle import (
     get_moodle_course,
     get_moodle_users_by_usernames,
 )
-from swarmoodle.oulad import (
-    filter_by_module_presentation,
-    get_oulad,
-    map_oulad_to_moodle,
-)
+from swarmoodle.oulad import map_oulad_to_moodle, read_oulad_table
 
 settings = get_settings()
 dictConfig(settings.logging)
@@ -43,26 +39,29 @@ logger = logging.getLogger(__name__)
 fake = Faker(["en_US"])
 redis = Redis.from_url(str(settings.redis_dsn))
 
-oulad = get_oulad()
+# Only read the simulated module presentation and the used columns.
+oulad_presentation = {
+    "code_module": settings.oulad_code_module,
+    "code_presentation": settings.oulad_code_presentation,
+}
 students = (
-    filter_by_module_presentation(
-        oulad.student_info, settings.oulad_code_module, settings.oulad_code_presentation
-    )
+    read_oulad_table("studentInfo", **oulad_presentation)
+    .drop(columns=["code_module", "code_presentation"])
     .iloc[0 : settings.moodle_students]
     .set_index("id_student")
 )
 student_vle = (
-    filter_by_module_presentation(
-        oulad.student_vle, settings.oulad_code_module, settings.oulad_code_presentation
+    read_oulad_table(
+        "studentVle",
+        columns=["id_student", "id_site", "date", "sum_click"],
+        filters=[("id_student", "in", students.index.tolist())],
+        **oulad_presentation,
     )
     .set_index("id_student")
     .join(students.loc[:, []], how="right")
 )
 vle = (
-    filter_by_module_presentation(
-        oulad.vle, settings.oulad_code_module, settings.oulad_code_presentation
-    )
-    .drop(columns=["week_from", "week_to"])
+    read_oulad_table("vle", columns=["id_site", "activity_type"], **oulad_presentation)
     .set_index("id_site")
     .pipe(lambda df: df[df.index.isin(student_vle.id_site)])
 )
@@ -2,16 +2,35 @@
 
 import logging
 import math
+import os
+import tempfile
 from dataclasses import dataclass
 from functools import lru_cache
 from pathlib import Path
 
 import pandas as pd
+import pyarrow.parquet as pq
 
 from swarmoodle.conf import get_settings
 
 logger = logging.getLogger(__name__)
 
+# Low-cardinality columns stored as categoricals.
+CATEGORICAL_COLUMNS = {"code_module", "code_presentation", "activity_type", "gender"}
+# Id, date and click count columns stored as 32-bit integers.
+INT32_COLUMNS = {
+    "id_assessment",
+    "id_site",
+    "id_student",
+    "date",
+    "date_registration",
+    "date_submitted",
+    "date_unregistration",
+    "sum_click",
+}
+# Rows per Parquet row group, the unit skipped by module/presentation filters.
+ROW_GROUP_SIZE = 100_000
+
 
 @dataclass
 class OULAD:
@@ -29,13 +48,115 @@ class OULAD:
     vle: pd.DataFrame
 
 
+def get_oulad_cache_path(path: Path) -> Path:
+    """Return the columnar cache directory of the OULAD CSV files in `path`."""
+    return get_settings().oulad_cache_path or Path(path) / "parquet"
+
+
+def convert_oulad_table(csv_path: Path, parquet_path: Path) -> None:
+    """Convert the OULAD `csv_path` table to a Parquet file with compact dtypes.
+
+    Rows are sorted by `code_module` and `code_presentation`, if present, so that
+    row groups of other module presentations are skipped when reading filtered
+    tables. The file is written atomically, thus concurrent readers either see the
+    previous file or the complete new one.
+    """
+    logger.info("Converting %s to %s", csv_path, parquet_path)
+    header = pd.read_csv(csv_path, nrows=0).columns
+    dtype = {name: "category" for name in header if name in CATEGORICAL_COLUMNS}
+    dtype.update({name: "Int32" for name in header if name in INT32_COLUMNS})
+    data = pd.read_csv(csv_path, dtype=dtype, engine="pyarrow")
+    # Columns without missing values don't need the nullable integer dtype.
+    data = data.astype(
+        {
+            name: "int32"
+            for name in header
+            if name in INT32_COLUMNS and not data[name].hasnans
+        }
+    )
+    if "code_module" in data:
+        data = data.sort_values(
+            ["code_module", "code_presentation"], kind="stable", ignore_index=True
+        )
+
+    parquet_path.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile(
+        dir=parquet_path.parent, prefix=".", delete=False
+    ) as file:
+        temporary_path = Path(file.name)
+    try:
+        data.to_parquet(temporary_path, index=False, row_group_size=ROW_GROUP_SIZE)
+        os.replace(temporary_path, parquet_path)
+    except BaseException:
+        # Don't leave partially written files in the cache directory.
+        temporary_path.unlink(missing_ok=True)
+        raise
+
+
+def read_oulad_table(  # pylint: disable=too-many-arguments
+    name: str,
+    path: Path = None,
+    columns: list[str] = None,
+    code_module: str = None,
+    code_presentation: str = None,
+    filters: list[tuple] = None,
+) -> pd.DataFrame:
+    """Read the OULAD `name` table from its columnar cache.
+
+    The cache is created from the CSV file on first read and whenever the CSV file
+    is modified.
+
+    Args:
+        name (str): The OULAD table name (CSV file name without extension).
+        path (Path): The OULAD CSV files directory. Defaults to the
+            `oulad_default_path` setting.
+        columns (list): The columns to read. By default all columns are read.
+        code_module (str): The `code_module` of the rows to read, if set.
+        code_presentation (str): The `code_presentation` of the rows to read, if set.
+        filters (list): Additional `(column, operator, value)` row filters.
+
+    Return:
+        result (DataFrame): The OULAD table rows.
+    """
+    path = Path(path) if path else get_settings().oulad_default_path
+    csv_path = path / f"{name}.csv"
+    parquet_path = get_oulad_cache_path(path) / f"{name}.parquet"
+    if (
+        not parquet_path.exists()
+        or parquet_path.stat().st_mtime < csv_path.stat().st_mtime
+    ):
+        convert_oulad_table(csv_path, parquet_path)
+
+    filters = list(filters or [])
+    names = pq.read_schema(parquet_path).names
+    for column, value in (
+        ("code_module", code_module),
+        ("code_presentation", code_presentation),
+    ):
+        if value is not None and column in names:
+            filters.append((column, "==", value))
+    return pd.read_parquet(parquet_path, columns=columns, filters=filters or None)
+
+
 @lru_cache(maxsize=1)
-def get_oulad(path: Path = None) -> OULAD:
-    """Return the OULAD dataset tables in a dataclass."""
+def get_oulad(
+    path: Path = None, code_module: str = None, code_presentation: str = None
+) -> OULAD:
+    """Return the OULAD dataset tables in a dataclass.
+
+    Tables are read from their columnar cache. If `code_module` or
+    `code_presentation` is set, only rows of this module presentation are read.
+    """
     path = path if path else get_settings().oulad_default_path
+    code = {"code_module": code_module, "code_presentation": code_presentation}
+    assessments = read_oulad_table("assessments", path, **code)
+    student_assessment_filters = None
+    if code_module or code_presentation:
+        ids = assessments.id_assessment.tolist()
+        student_assessment_filters = [("id_assessment", "in", ids)]
     return OULAD(
-        assessments=pd.read_csv(f"{path}/assessments.csv"),
-        courses=pd.read_csv(f"{path}/courses.csv"),
+        assessments=assessments,
+        courses=read_oulad_table("courses", path, **code),
         domains=pd.DataFrame(
             {
                 "code_module": ["AAA", "BBB", "CCC", "DDD", "EEE", "FFF", "GGG"],
@@ -50,11 +171,13 @@ def get_oulad(path: Path = None) -> OULAD:
                 ],
             },
         ),
-        student_assessment=pd.read_csv(f"{path}/studentAssessment.csv"),
-        student_info=pd.read_csv(f"{path}/studentInfo.csv"),
-        student_registration=pd.read_csv(f"{path}/studentRegistration.csv"),
-        student_vle=pd.read_csv(f"{path}/studentVle.csv"),
-        vle=pd.read_csv(f"{path}/vle.csv"),
+        student_assessment=read_oulad_table(
+            "studentAssessment", path, filters=student_assessment_filters
+        ),
+        student_info=read_oulad_table("studentInfo", path, **code),
+        student_registration=read_oulad_table("studentRegistration", path, **code),
+        student_vle=read_oulad_table("studentVle", path, **code),
+        vle=read_oulad_table("vle", path, **code),
     )
 
 
@@ -106,7 +229,7 @@ def map_oulad_to_moodle(vle: pd.DataFrame, moodle_course: list[dict]) -> dict:
         "folder": ["folder"],
         "homepage": ["homepage"],
     }
-    site_by_activity = vle.groupby("activity_type").groups
+    site_by_activity = vle.groupby("activity_type", observed=True).groups
     last_used_index = {activity: 0 for activity in site_by_activity}
     moodle_id_by_oulad_site = {}
     for i, activity_type in enumerate(map(lambda x: x["modname"], moodle_course)):
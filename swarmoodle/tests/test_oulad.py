@@ -1,18 +1,32 @@
 """Test OULAD utilities."""
 
 import logging
+import os
+import shutil
 
 import pandas as pd
+import pytest
 from pytest import LogCaptureFixture
 
+from swarmoodle.conf import get_settings
 from swarmoodle.oulad import (
     OULAD,
     filter_by_module_presentation,
     get_oulad,
     map_oulad_to_moodle,
+    read_oulad_table,
 )
 
 
+@pytest.fixture(name="oulad_cache_path", autouse=True)
+def fixture_oulad_cache_path(monkeypatch, tmp_path):
+    """Use a temporary OULAD columnar cache directory."""
+    monkeypatch.setenv("SWARMOODLE_OULAD_CACHE_PATH", str(tmp_path / "parquet"))
+    get_settings.cache_clear()
+    yield tmp_path / "parquet"
+    get_settings.cache_clear()
+
+
 def test_oulad_get_oulad():
     """Test the `get_oulad` function."""
     oulad = get_oulad("./tests/OULAD")
@@ -31,6 +45,78 @@ def test_oulad_get_oulad():
     assert get_oulad.cache_info().hits == 1
 
 
+def test_oulad_read_oulad_table(oulad_cache_path, tmp_path):
+    """Test the `read_oulad_table` function."""
+    student_vle = read_oulad_table("studentVle", "./tests/OULAD")
+    assert (oulad_cache_path / "studentVle.parquet").exists()
+    assert student_vle.dtypes.astype(str).to_dict() == {
+        "code_module": "category",
+        "code_presentation": "category",
+        "id_student": "int32",
+        "id_site": "int32",
+        "date": "int32",
+        "sum_click": "int32",
+    }
+    expected = pd.read_csv("./tests/OULAD/studentVle.csv")
+    assert len(student_vle) == len(expected)
+
+    # Given columns and a module presentation, only these should be read.
+    student_vle = read_oulad_table(
+        "studentVle",
+        "./tests/OULAD",
+        columns=["id_site", "sum_click"],
+        code_module="AAA",
+        code_presentation="2013J",
+    )
+    assert student_vle.columns.to_list() == ["id_site", "sum_click"]
+    filtered = expected[
+        (expected.code_module == "AAA") & (expected.code_presentation == "2013J")
+    ]
+    assert (
+        student_vle.values.tolist()
+        == filtered[["id_site", "sum_click"]].values.tolist()
+    )
+
+    # Given missing values, ids and dates should be nullable integers.
+    registrations = read_oulad_table("studentRegistration", "./tests/OULAD")
+    assert str(registrations.date_unregistration.dtype) == "Int32"
+
+    # Given a modified CSV file, the cache should be refreshed.
+    shutil.copy("./tests/OULAD/courses.csv", tmp_path / "courses.csv")
+    assert len(read_oulad_table("courses", tmp_path)) == len(
+        expected := pd.read_csv(tmp_path / "courses.csv")
+    )
+    expected.iloc[:1].to_csv(tmp_path / "courses.csv", index=False)
+    stat = (oulad_cache_path / "courses.parquet").stat()
+    os.utime(tmp_path / "courses.csv", (stat.st_atime + 1, stat.st_mtime + 1))
+    assert len(read_oulad_table("courses", tmp_path)) == 1
+
+
+def test_oulad_read_oulad_table_with_conversion_error(oulad_cache_path, monkeypatch):
+    """Test that a failed conversion leaves no temporary file behind."""
+
+    def to_parquet(*_, **__):
+        raise OSError("No space left on device")
+
+    monkeypatch.setattr(pd.DataFrame, "to_parquet", to_parquet)
+    with pytest.raises(OSError):
+        read_oulad_table("courses", "./tests/OULAD")
+    assert not list(oulad_cache_path.iterdir())
+
+
+def test_oulad_get_oulad_with_module_presentation():
+    """Test the `get_oulad` function with a module presentation."""
+    oulad = get_oulad("./tests/OULAD", "AAA", "2014J")
+    assert oulad.courses.values.tolist() == [["AAA", "2014J", 269]]
+    assert oulad.student_vle.empty
+    assert oulad.student_assessment.empty
+    oulad = get_oulad("./tests/OULAD", "AAA", "2013J")
+    assert len(oulad.student_vle) == len(pd.read_csv("./tests/OULAD/studentVle.csv"))
+    expected = pd.read_csv("./tests/OULAD/studentAssessment.csv")
+    assert len(oulad.student_assessment) == len(expected)
+    get_oulad.cache_clear()
+
+
 def test_oulad_filter_by_module_presentation():
     """Test the `filter_by_module_presentation` function."""
     oulad = get_oulad("./tests/OULAD")
@@ -0,0 +1,105 @@
+"""Test the load balancing of Moodle requests across Moodle web nodes."""
+
+import httpx
+import pytest
+from pytest_httpx import HTTPXMock
+
+from hook.balancer import BalancerTransport, OriginPool
+
+
+@pytest.mark.anyio
+async def test_balancer_origin_pool_select():
+    """Test the `OriginPool.select` and `OriginPool.record` methods."""
+    origins = OriginPool(["http://moodle-1", "http://moodle-2"], max_failures=2)
+    first, second = origins.origins
+
+    # Given no outstanding requests, the least used origin should be selected.
+    assert origins.select() is first
+    first.requests = 1
+    assert origins.select() is second
+    second.outstanding = 1
+    assert origins.select() is first
+
+    # Given consecutive failures, the origin should be ejected.
+    origins.record(first, success=False)
+    origins.record(first, success=True)
+    origins.record(first, success=False)
+    assert first.healthy
+    origins.record(first, success=False)
+    assert not first.healthy
+    assert origins.select() is second
+
+    # Given all origins ejected, all of them should be used.
+    origins.set_healthy(second, False)
+    assert origins.select() is first
+    await origins.aclose()
+
+
+@pytest.mark.anyio
+async def test_balancer_origin_pool_check_health(httpx_mock: HTTPXMock):
+    """Test the `OriginPool.check_health` method."""
+    origins = OriginPool(
+        ["http://moodle-1", "http://moodle-2", "http://moodle-3"],
+        max_failures=1,
+        health_path="/login/index.php",
+    )
+    first, second, third = origins.origins
+    origins.set_healthy(first, False)
+    httpx_mock.add_response(url="http://moodle-1/login/index.php", status_code=303)
+    httpx_mock.add_response(url="http://moodle-2/login/index.php", status_code=503)
+    httpx_mock.add_exception(
+        httpx.ConnectError("refused"), url="http://moodle-3/login/index.php"
+    )
+
+    await origins.check_health()
+    assert first.healthy
+    assert not second.healthy
+    assert not third.healthy
+    assert origins.stats()[0] == {
+        "url": "http://moodle-1",
+        "healthy": True,
+        "outstanding": 0,
+        "requests": 0,
+    }
+    await origins.aclose()
+
+
+@pytest.mark.anyio
+async def test_balancer_transport():
+    """Test the `BalancerTransport` class."""
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        if request.url.host == "moodle-2":
+            return httpx.Response(500)
+        return httpx.Response(200, json={})
+
+    origins = OriginPool(["http://moodle-1", "https://moodle-2:8443"], max_failures=1)
+    transport = BalancerTransport(httpx.MockTransport(handler), origins)
+    async with httpx.AsyncClient(
+        base_url="http://moodle/webservice/rest/server.php", transport=transport
+    ) as client:
+        await client.post("", params={"wstoken": "foo"})
+        await client.post("", params={"wstoken": "foo"})
+        await client.post("", params={"wstoken": "foo"})
+
+    # Requests should be spread across origins, keeping their path and query.
+    assert [str(request.url) for request in requests] == [
+        "http://moodle-1/webservice/rest/server.php/?wstoken=foo",
+        "https://moodle-2:8443/webservice/rest/server.php/?wstoken=foo",
+        "http://moodle-1/webservice/rest/server.php/?wstoken=foo",
+    ]
+    # The public host should be kept not to trigger Moodle `wwwroot` redirections.
+    assert requests[1].headers["Host"] == "moodle"
+    # The failing origin should be ejected and outstanding requests released.
+    assert [origin.stats() for origin in origins.origins] == [
+        {"url": "http://moodle-1", "healthy": True, "outstanding": 0, "requests": 2},
+        {
+            "url": "https://moodle-2:8443",
+            "healthy": False,
+            "outstanding": 0,
+            "requests": 1,
+        },
+    ]
+    await origins.aclose()
@@ -0,0 +1,197 @@
+"""Test the webservice results cache."""
+
+import asyncio
+import fnmatch
+
+import pytest
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+from hook.cache import SharedCache, SingleFlight, TTLCache
+
+
+class FakeRedis:
+    """A minimal in-memory stand-in for the asynchronous Redis client."""
+
+    def __init__(self):
+        """Initialize an empty store."""
+        self.data = {}
+        self.commands = []
+        self.error = None
+
+    def pipeline(self, transaction: bool = True):  # pylint: disable=unused-argument
+        """Return a pipeline queuing `get` and `pttl` commands."""
+        return self
+
+    def get(self, key):
+        """Queue a `GET` command."""
+        self.commands.append(self.data.get(key, (None, -2))[0])
+        return self
+
+    def pttl(self, key):
+        """Queue a `PTTL` command."""
+        self.commands.append(self.data.get(key, (None, -2))[1])
+        return self
+
+    async def execute(self):
+        """Return the results of the queued commands."""
+        if self.error:
+            raise self.error
+        results, self.commands = self.commands, []
+        return results
+
+    async def set(self, key, value, px):
+        """Set the `key` to `value` for `px` milliseconds."""
+        if self.error:
+            raise self.error
+        self.data[key] = (value, px)
+
+    async def scan_iter(self, match):
+        """Yield the keys matching the `match` pattern."""
+        for key in list(self.data):
+            if fnmatch.fnmatch(key, match):
+                yield key
+
+    async def delete(self, *keys):
+        """Delete the `keys` and return the number of deleted keys."""
+        return sum(self.data.pop(key, None) is not None for key in keys)
+
+
+def test_cache_ttl_cache_get_set(monkeypatch):
+    """Test the `TTLCache.get` and `TTLCache.set` methods."""
+    now = [100.0]
+    monkeypatch.setattr("hook.cache.time.monotonic", lambda: now[0])
+    cache = TTLCache(maxsize=10)
+    assert cache.get("foo") is None
+    assert cache.get("foo", "default") == "default"
+    cache.set("foo", "bar", ttl=10)
+    assert "foo" in cache
+    assert cache.get("foo") == "bar"
+    assert cache.stats() == {"size": 1, "maxsize": 10, "hits": 1, "misses": 2}
+
+    # Given an expired entry, `get` should return the default and drop the entry.
+    now[0] = 110.0
+    assert "foo" not in cache
+    assert cache.get("foo") is None
+    assert not len(cache)
+
+
+def test_cache_ttl_cache_lru_eviction():
+    """Test the `TTLCache` least recently used eviction policy."""
+    cache = TTLCache(maxsize=2)
+    cache.set("a", 1, ttl=60)
+    cache.set("b", 2, ttl=60)
+    assert cache.get("a") == 1
+    cache.set("c", 3, ttl=60)
+    assert "a" in cache
+    assert "b" not in cache
+    assert "c" in cache
+
+    # Given a `maxsize` of 0, nothing should be cached.
+    cache = TTLCache(maxsize=0)
+    cache.set("a", 1, ttl=60)
+    assert "a" not in cache
+
+
+def test_cache_ttl_cache_invalidate():
+    """Test the `TTLCache.invalidate` method."""
+    cache = TTLCache(maxsize=10)
+    cache.set(("core_course_get_contents", ("courseid", 2)), [], ttl=60)
+    cache.set(("core_course_get_contents", ("courseid", 3)), [], ttl=60)
+    cache.set(("core_course_get_courses",), [], ttl=60)
+    assert cache.invalidate("core_course_get_contents") == 2
+    assert cache.invalidate("core_course_get_contents") == 0
+    assert len(cache) == 1
+    assert cache.invalidate() == 1
+    assert not len(cache)
+
+
+@pytest.mark.anyio
+async def test_cache_single_flight_do():
+    """Test the `SingleFlight.do` method."""
+    calls = []
+
+    async def call(value):
+        calls.append(value)
+        await asyncio.sleep(0.01)
+        return value
+
+    singleflight = SingleFlight()
+    results = await asyncio.gather(
+        singleflight.do("a", lambda: call(1)),
+        singleflight.do("a", lambda: call(2)),
+        singleflight.do("b", lambda: call(3)),
+    )
+    assert results == [1, 1, 3]
+    assert calls == [1, 3]
+    assert singleflight.coalesced == 1
+    assert len(singleflight) == 0
+
+    # Once the in-flight call completed, a new call should be issued.
+    assert await singleflight.do("a", lambda: call(4)) == 4
+
+
+@pytest.mark.anyio
+async def test_cache_single_flight_do_with_cancelled_caller():
+    """Test that cancelling a `SingleFlight.do` caller doesn't affect the others."""
+
+    async def call():
+        await asyncio.sleep(0.01)
+        return "result"
+
+    singleflight = SingleFlight()
+    first = asyncio.ensure_future(singleflight.do("a", call))
+    second = asyncio.ensure_future(singleflight.do("a", call))
+    await asyncio.sleep(0)
+    first.cancel()
+    assert await second == "result"
+
+
+@pytest.mark.anyio
+async def test_cache_shared_cache_without_redis():
+    """Test the `SharedCache` class without Redis."""
+    local = TTLCache(maxsize=10)
+    cache = SharedCache(local)
+    assert await cache.get(("courses",)) is None
+    await cache.set(("courses",), [1], ttl=60)
+    assert await cache.get(("courses",)) == [1]
+    assert local.get(("courses",)) == [1]
+    assert await cache.invalidate("courses") == 1
+    assert cache.stats() == {"enabled": False, "hits": 0, "misses": 0}
+
+
+@pytest.mark.anyio
+async def test_cache_shared_cache_with_redis():
+    """Test the `SharedCache` class sharing values between workers with Redis."""
+    redis = FakeRedis()
+    worker_a = SharedCache(TTLCache(maxsize=10), redis, local_ttl=5)
+    worker_b = SharedCache(TTLCache(maxsize=10), redis, local_ttl=5)
+    await worker_a.set(("quiz", 1, 100), [{"slot": 1}], ttl=60)
+    assert redis.data["hook:quiz:1:100"][1] == 60000
+
+    # Given a value cached by another worker, `get` should fetch it from Redis and
+    # keep it in the local cache.
+    assert await worker_b.get(("quiz", 1, 100)) == [{"slot": 1}]
+    assert worker_b.local.get(("quiz", 1, 100)) == [{"slot": 1}]
+    assert await worker_b.get(("quiz", 2, 100)) is None
+    assert worker_b.stats() == {"enabled": True, "hits": 1, "misses": 1}
+
+    await worker_a.set(("courses",), [], ttl=60)
+    assert await worker_b.invalidate("quiz") == 2
+    assert list(redis.data) == ["hook:courses"]
+
+    # Given a single element key, it should be removed from Redis as well.
+    assert await worker_a.invalidate("courses") == 2
+    assert not redis.data
+    assert await worker_a.get(("courses",)) is None
+
+
+@pytest.mark.anyio
+async def test_cache_shared_cache_with_redis_errors():
+    """Test the `SharedCache` class when Redis is unavailable."""
+    redis = FakeRedis()
+    redis.error = RedisConnectionError()
+    cache = SharedCache(TTLCache(maxsize=10), redis)
+    await cache.set(("courses",), [1], ttl=60)
+    assert await cache.get(("courses",)) == [1]
+    cache.local.invalidate()
+    assert await cache.get(("courses",), "default") == "default"
@@ -0,0 +1,118 @@
+"""Test the response compression and conditional requests of the hook API."""
+
+import gzip
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse, StreamingResponse
+
+from hook.compression import (
+    CompressionMiddleware,
+    ETagMiddleware,
+    get_encoding,
+    get_etag,
+    is_not_modified,
+)
+
+
+@pytest.fixture(name="app")
+def fixture_app() -> FastAPI:
+    """Return an app with large, small and streamed responses."""
+    fastapi_app = FastAPI()
+    fastapi_app.add_middleware(ETagMiddleware)
+    fastapi_app.add_middleware(CompressionMiddleware)
+
+    @fastapi_app.get("/large")
+    async def large():
+        return {"html": "<p>Lorem ipsum</p>" * 1000}
+
+    @fastapi_app.get("/small")
+    async def small():
+        return PlainTextResponse("small")
+
+    @fastapi_app.get("/stream")
+    async def stream():
+        lines = (f'{{"id": {index}}}\n' for index in range(3))
+        return StreamingResponse(lines, media_type="application/x-ndjson")
+
+    return fastapi_app
+
+
+def test_compression_get_encoding(monkeypatch):
+    """Test the `get_encoding` function."""
+    monkeypatch.setattr("hook.compression.zstandard", None)
+    assert get_encoding("") is None
+    assert get_encoding("identity") is None
+    assert get_encoding("gzip, deflate") == "gzip"
+    assert get_encoding("GZIP;q=0.5") == "gzip"
+    assert get_encoding("gzip;q=0") is None
+    assert get_encoding("gzip;q=0, *") is None
+    assert get_encoding("*;q=0.1") == "gzip"
+    assert get_encoding("zstd") is None
+
+    monkeypatch.setattr("hook.compression.zstandard", object())
+    assert get_encoding("gzip, zstd") == "zstd"
+    assert get_encoding("gzip, zstd;q=0.5") == "gzip"
+
+
+def test_compression_get_etag():
+    """Test the `get_etag` and `is_not_modified` functions."""
+    etag = get_etag(b"body")
+    assert etag == get_etag(b"body")
+    assert etag != get_etag(b"other")
+    assert etag.startswith('W/"')
+    assert is_not_modified(etag, etag)
+    assert is_not_modified(f'"foo", {etag.removeprefix("W/")}', etag)
+    assert is_not_modified("*", etag)
+    assert not is_not_modified('W/"foo"', etag)
+
+
+@pytest.mark.anyio
+async def test_compression_compression_middleware(app: FastAPI):
+    """Test the `CompressionMiddleware` class."""
+    async with httpx.AsyncClient(app=app, base_url="http://test") as client:
+        headers = {"Accept-Encoding": "gzip"}
+        async with client.stream("GET", "/large", headers=headers) as response:
+            body = b"".join([chunk async for chunk in response.aiter_raw()])
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.headers["content-length"] == str(len(body))
+        assert response.headers["vary"] == "Accept-Encoding"
+        assert len(gzip.decompress(body)) > 10 * len(body)
+
+        # Given a response below the threshold, it should not be compressed.
+        response = await client.get("/small", headers=headers)
+        assert "content-encoding" not in response.headers
+        assert response.text == "small"
+
+        # Given a client not accepting gzip, responses should not be compressed.
+        response = await client.get("/large", headers={"Accept-Encoding": "br"})
+        assert "content-encoding" not in response.headers
+        assert response.headers["vary"] == "Accept-Encoding"
+
+        # Given a streamed response, each chunk should be compressed.
+        response = await client.get("/stream", headers=headers)
+        assert response.headers["content-encoding"] == "gzip"
+        assert "content-length" not in response.headers
+        assert response.text.splitlines() == ['{"id": 0}', '{"id": 1}', '{"id": 2}']
+
+
+@pytest.mark.anyio
+async def test_compression_etag_middleware(app: FastAPI):
+    """Test the `ETagMiddleware` class."""
+    async with httpx.AsyncClient(app=app, base_url="http://test") as client:
+        response = await client.get("/large")
+        etag = response.headers["etag"]
+        assert etag == get_etag(response.content)
+
+        response = await client.get("/large", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.content == b""
+        assert response.headers["etag"] == etag
+
+        response = await client.get("/large", headers={"If-None-Match": 'W/"foo"'})
+        assert response.status_code == 200
+
+        # Streamed responses should not have an ETag.
+        response = await client.get("/stream")
+        assert "etag" not in response.headers
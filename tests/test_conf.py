@@ -0,0 +1,33 @@
+"""Test hook configuration."""
+
+import pytest
+from pydantic import ValidationError
+
+from hook.conf import Settings, get_settings
+
+
+def test_conf_settings_settings():
+    """Test the `settings` function."""
+    settings = get_settings()
+    assert isinstance(settings, Settings)
+    assert get_settings.cache_info().currsize == 1
+    assert get_settings.cache_info().maxsize == 1
+    get_settings()
+    assert get_settings.cache_info().hits >= 1
+
+
+def test_conf_settings_moodle_concurrency(monkeypatch):
+    """Test the `Settings.moodle_concurrency` property."""
+    # Given no environment variables, `moodle_concurrency` should default to 10.
+    monkeypatch.delenv("HOOK_MOODLE_CONCURRENCY", raising=False)
+    assert Settings().moodle_concurrency == 10
+
+    # Given an invalid environment variable,
+    # instantiating `Settings` should raise a `ValidationError`.
+    monkeypatch.setenv("HOOK_MOODLE_CONCURRENCY", "0")
+    with pytest.raises(ValidationError, match=r"Input should be greater than 0"):
+        Settings()
+
+    # Given a valid environment variable, `moodle_concurrency` should be set.
+    monkeypatch.setenv("HOOK_MOODLE_CONCURRENCY", "50")
+    assert Settings().moodle_concurrency == 50
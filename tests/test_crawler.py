@@ -0,0 +1,110 @@
+"""Test the background crawling of Moodle courses."""
+
+import logging
+import re
+
+import pytest
+from asgi_lifespan import LifespanManager
+from pytest_httpx import HTTPXMock
+
+from hook.conf import get_settings
+from hook.crawler import crawl, warm_up
+from hook.main import app
+
+WS_URL = re.compile(r"http://moodle/webservice/rest/server\.php/.*")
+
+
+@pytest.fixture
+def settings(monkeypatch):
+    """Use the default settings with the Moodle cache enabled."""
+    monkeypatch.setenv("HOOK_MOODLE_URL", "http://moodle")
+    get_settings.cache_clear()
+    yield get_settings()
+    get_settings.cache_clear()
+
+
+@pytest.mark.anyio
+@pytest.mark.usefixtures("settings")
+async def test_crawler_warm_up(httpx_mock: HTTPXMock, caplog):
+    """Test the `warm_up` function."""
+    # pylint: disable=no-member
+    courses = [
+        {"id": 1, "visible": 1, "format": "site"},
+        {"id": 2, "visible": 1, "format": "topics"},
+        {"id": 3, "visible": 0, "format": "topics"},
+        {"id": 4, "visible": 1, "format": "topics"},
+    ]
+    contents = [{"visible": 1, "modules": [{"id": 1, "visible": 1}]}]
+    httpx_mock.add_response(
+        url=WS_URL, match_content=b"wsfunction=core_course_get_courses", json=courses
+    )
+    httpx_mock.add_response(
+        url=WS_URL,
+        match_content=b"wsfunction=core_course_get_contents&courseid=2",
+        json=contents,
+    )
+    httpx_mock.add_response(
+        url=WS_URL,
+        match_content=b"wsfunction=core_course_get_contents&courseid=4",
+        json={"exception": "moodle_exception"},
+    )
+    async with LifespanManager(app):
+        with caplog.at_level(logging.ERROR):
+            assert await warm_up(app) == 1
+
+        assert "Failed to warm up course 4" in caplog.text
+        assert app.cache.get(("core_course_get_contents", ("courseid", 2)))
+        assert app.cache.get(("core_course_get_courses",)) == courses
+
+
+@pytest.mark.anyio
+@pytest.mark.usefixtures("settings")
+async def test_crawler_warm_up_without_quiz_reuse(httpx_mock: HTTPXMock):
+    """Test the `warm_up` function skipping quizzes without attempts reuse."""
+    courses = [{"id": 2, "visible": 1, "format": "topics"}]
+    modules = [
+        {"id": 1, "instance": 5, "modname": "quiz", "visible": 1},
+        {
+            "id": 2,
+            "modname": "page",
+            "name": "Page",
+            "visible": 1,
+            "contents": [
+                {
+                    "type": "file",
+                    "fileurl": "http://moodle/webservice/pluginfile.php/2/index.html",
+                }
+            ],
+        },
+    ]
+    httpx_mock.add_response(
+        url=WS_URL, match_content=b"wsfunction=core_course_get_courses", json=courses
+    )
+    httpx_mock.add_response(
+        url=WS_URL,
+        match_content=b"wsfunction=core_course_get_contents&courseid=2",
+        json=[{"visible": 1, "modules": modules}],
+    )
+    async with LifespanManager(app):
+        assert await warm_up(app) == 1
+
+    # No quiz attempt should have been started.
+    assert not any(
+        b"mod_quiz" in request.content for request in httpx_mock.get_requests()
+    )
+    # Given neither file store nor search, files should not be downloaded.
+    assert not any(
+        "pluginfile" in request.url.path for request in httpx_mock.get_requests()
+    )
+
+
+@pytest.mark.anyio
+@pytest.mark.usefixtures("settings")
+async def test_crawler_crawl(httpx_mock: HTTPXMock, caplog):
+    """Test the `crawl` function without interval."""
+    httpx_mock.add_response(url=WS_URL, json=[])
+    async with LifespanManager(app):
+        with caplog.at_level(logging.INFO):
+            await crawl(app)
+
+    assert "Warmed up 0 courses" in caplog.text
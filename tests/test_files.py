@@ -0,0 +1,62 @@
+"""Test the persistent on-disk store of Moodle file contents."""
+
+from hook.files import FileStore
+
+
+def test_files_file_store_read_write_text(tmp_path):
+    """Test the `FileStore.read_text` and `FileStore.write_text` methods."""
+    store = FileStore(tmp_path, maxsize=1024)
+    assert store.read_text("http://moodle/a.html", 1) is None
+    store.write_text("http://moodle/a.html", 1, "<p>café</p>")
+    store.write_text("http://moodle/b.html", 1, "")
+    assert store.read_text("http://moodle/a.html", 1) == "<p>café</p>"
+    assert store.read_text("http://moodle/b.html", 1) == ""
+    assert len(store) == 2
+    assert store.size == len("<p>café</p>".encode())
+
+    # Given a new modification time, the file should not be found.
+    assert store.read_text("http://moodle/a.html", 2) is None
+
+    # Given a new store instance on the same path, stored files should be indexed.
+    store = FileStore(tmp_path, maxsize=1024)
+    assert len(store) == 2
+    assert store.read_text("http://moodle/a.html", 1) == "<p>café</p>"
+
+
+def test_files_file_store_eviction(tmp_path):
+    """Test the `FileStore` least recently used eviction policy."""
+    store = FileStore(tmp_path, maxsize=10)
+    store.write_text("a", 1, "aaaa")
+    store.write_text("b", 1, "bbbb")
+    assert store.read_text("a", 1) == "aaaa"
+    store.write_text("c", 1, "cccc")
+    assert store.size == 8
+    assert store.read_text("a", 1) == "aaaa"
+    assert store.read_text("b", 1) is None
+    assert store.read_text("c", 1) == "cccc"
+    assert not store.get_path(store.get_key("b", 1)).exists()
+
+
+def test_files_file_store_read_text_while_evicted(tmp_path):
+    """Test that a file evicted while being read is not recreated."""
+    store = FileStore(tmp_path, maxsize=1024)
+    store.write_text("a", 1, "aaaa")
+    path = store.get_path(store.get_key("a", 1))
+    lock = store._lock  # pylint: disable=protected-access
+
+    class EvictingLock:
+        """A lock evicting the file right before being acquired."""
+
+        def __enter__(self):
+            """Evict the file, as a concurrent `write_text` would, and acquire it."""
+            path.unlink()
+            return lock.__enter__()
+
+        def __exit__(self, *args):
+            """Release the lock."""
+            return lock.__exit__(*args)
+
+    store._lock = EvictingLock()  # pylint: disable=protected-access
+    assert store.read_text("a", 1) == "aaaa"
+    assert not path.exists()
+    assert store.read_text("a", 1) is None
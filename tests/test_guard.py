@@ -0,0 +1,189 @@
+"""Test the adaptive concurrency limiting and circuit breaking of Moodle requests."""
+
+import asyncio
+
+import httpx
+import pytest
+
+from hook.guard import (
+    AdaptiveLimiter,
+    CircuitBreaker,
+    GuardTransport,
+    UpstreamUnavailable,
+)
+
+
+def create_limiter(**kwargs) -> AdaptiveLimiter:
+    """Return an adaptive limiter with test defaults overridden by `kwargs`."""
+    options = {
+        "limit": 2,
+        "min_limit": 1,
+        "max_limit": 4,
+        "latency_target": 1.0,
+        "max_queue": 1,
+        "queue_timeout": 0.05,
+    }
+    return AdaptiveLimiter(**{**options, **kwargs})
+
+
+@pytest.mark.anyio
+async def test_guard_adaptive_limiter_acquire():
+    """Test the `AdaptiveLimiter.acquire` and `AdaptiveLimiter.release` methods."""
+    limiter = create_limiter()
+    await limiter.acquire()
+    await limiter.acquire()
+    assert limiter.in_flight == 2
+
+    # Given a full limit, requests should be queued and get freed slots in order.
+    waiter = asyncio.ensure_future(limiter.acquire())
+    await asyncio.sleep(0)
+    assert len(limiter) == 1
+    with pytest.raises(UpstreamUnavailable, match="queue_full"):
+        await limiter.acquire()
+    limiter.release()
+    await waiter
+    assert limiter.in_flight == 2
+    assert len(limiter) == 0
+
+    # Given no slot freed in time, queued requests should be rejected.
+    with pytest.raises(UpstreamUnavailable, match="queue_timeout") as error:
+        await limiter.acquire()
+    assert error.value.retry_after == 0.05
+    assert len(limiter) == 0
+
+
+def test_guard_adaptive_limiter_record(monkeypatch):
+    """Test the `AdaptiveLimiter.record` method."""
+    now = [100.0]
+    monkeypatch.setattr("hook.guard.time.monotonic", lambda: now[0])
+    limiter = create_limiter()
+    limiter.record(0.5, success=True)
+    assert limiter.limit == 2.5
+    limiter.record(0.5, success=True)
+    limiter.record(0.5, success=True)
+    assert limiter.limit > 3
+
+    # Given slow or failed requests, the limit should decrease once per target.
+    limiter.record(2.0, success=True)
+    assert limiter.limit == pytest.approx(3.3 * 0.9, abs=0.1)
+    limit = limiter.limit
+    limiter.record(0.1, success=False)
+    assert limiter.limit == limit
+    now[0] = 101.0
+    limiter.record(0.1, success=False)
+    assert limiter.limit == limit * 0.9
+
+    # The limit should stay within its bounds.
+    for _ in range(100):
+        now[0] += 1
+        limiter.record(0.1, success=False)
+    assert limiter.limit == 1
+    for _ in range(100):
+        limiter.record(0.1, success=True)
+    assert limiter.limit == 4
+
+
+def test_guard_circuit_breaker(monkeypatch):
+    """Test the `CircuitBreaker` class."""
+    now = [100.0]
+    monkeypatch.setattr("hook.guard.time.monotonic", lambda: now[0])
+    breaker = CircuitBreaker(failure_threshold=2, open_duration=10)
+    breaker.record(success=False)
+    breaker.check()
+    breaker.record(success=False)
+    assert breaker.state == "open"
+    with pytest.raises(UpstreamUnavailable, match="circuit_open") as error:
+        breaker.check()
+    assert error.value.retry_after == 10
+
+    # Given the open duration elapsed, a single probe should be let through.
+    now[0] = 110.0
+    assert breaker.check() is True
+    assert breaker.state == "half_open"
+    with pytest.raises(UpstreamUnavailable):
+        breaker.check()
+
+    # Given a failed probe, the circuit should reopen.
+    breaker.record(success=False)
+    assert breaker.state == "open"
+
+    # Given an aborted probe, another probe should be let through.
+    now[0] = 120.0
+    breaker.check()
+    breaker.abort()
+    breaker.check()
+    breaker.record(success=True)
+    assert breaker.state == "closed"
+    assert breaker.failures == 0
+
+
+class ChunkStream(httpx.AsyncByteStream):
+    """A response stream which is not read by the transport."""
+
+    async def __aiter__(self):
+        """Yield a single chunk."""
+        yield b"{}"
+
+
+def handler(request: httpx.Request) -> httpx.Response:
+    """Return a streamed response, with a 502 status for `/error` requests."""
+    status_code = 502 if request.url.path == "/error" else 200
+    return httpx.Response(status_code, stream=ChunkStream())
+
+
+@pytest.mark.anyio
+async def test_guard_guard_transport():
+    """Test the `GuardTransport` class."""
+    limiter = create_limiter()
+    breaker = CircuitBreaker(failure_threshold=2, open_duration=10)
+    transport = GuardTransport(httpx.MockTransport(handler), "moodle", limiter, breaker)
+    async with httpx.AsyncClient(transport=transport) as client:
+        assert (await client.get("http://moodle/ok")).status_code == 200
+        # The request slot should be held until the response is closed.
+        async with client.stream("GET", "http://moodle/ok"):
+            assert limiter.in_flight == 1
+        assert limiter.in_flight == 0
+
+        # Given consecutive 5xx responses, the circuit should open.
+        await client.get("http://moodle/error")
+        await client.get("http://moodle/error")
+        assert transport.stats() == {
+            "limit": 2,
+            "in_flight": 0,
+            "queued": 0,
+            "circuit": "open",
+        }
+        with pytest.raises(UpstreamUnavailable, match="circuit_open"):
+            await client.get("http://moodle/ok")
+
+
+@pytest.mark.anyio
+async def test_guard_guard_transport_half_open():
+    """Test that a single probe request is sent while the circuit is half-open."""
+    requests = []
+    event = asyncio.Event()
+
+    async def probe_handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        await event.wait()
+        return httpx.Response(200, json={})
+
+    # Given an elapsed open duration, the next request should be the probe.
+    breaker = CircuitBreaker(failure_threshold=1, open_duration=0)
+    breaker.record(success=False)
+    transport = GuardTransport(
+        httpx.MockTransport(probe_handler),
+        "moodle",
+        create_limiter(limit=4, max_queue=10),
+        breaker,
+    )
+    async with httpx.AsyncClient(transport=transport) as client:
+        tasks = [asyncio.create_task(client.get("http://moodle/ok")) for _ in range(10)]
+        await asyncio.sleep(0.01)
+        event.set()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+
+    # Requests rejected during the probe should not let other probes through.
+    assert len(requests) == 1
+    assert sum(isinstance(result, httpx.Response) for result in results) == 1
+    assert breaker.state == "closed"
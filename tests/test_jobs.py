@@ -0,0 +1,72 @@
+"""Test the background jobs."""
+
+import asyncio
+
+import pytest
+
+from hook.jobs import JobQueue, add_progress
+
+
+@pytest.mark.anyio
+async def test_jobs_job_queue():
+    """Test the `JobQueue` class."""
+    jobs = JobQueue(workers=1, maxsize=1, ttl=60)
+    event = asyncio.Event()
+
+    async def resolve():
+        add_progress(total=2)
+        add_progress(resolved=1)
+        await event.wait()
+        add_progress(resolved=1)
+        return ["module"]
+
+    async def fail():
+        raise ValueError("invalid")
+
+    job = jobs.submit("course", resolve)
+    assert job.summary()["status"] == "pending"
+    # Given a pending or running job, the same job should be returned.
+    assert jobs.submit("course", resolve) is job
+    # Given a full queue, new jobs should be rejected.
+    with pytest.raises(asyncio.QueueFull):
+        jobs.submit("other", resolve)
+
+    jobs.start()
+    await asyncio.sleep(0)
+    assert jobs.get(job.id).summary() == {
+        "id": job.id,
+        "status": "running",
+        "total": 2,
+        "resolved": 1,
+        "created": job.created,
+        "finished": None,
+    }
+    event.set()
+    await asyncio.sleep(0)
+    assert job.summary()["result"] == ["module"]
+    assert job.resolved == 2
+    # Given a done job, a new job should be queued.
+    rerun = jobs.submit("course", resolve)
+    assert rerun is not job
+    await asyncio.sleep(0)
+    assert rerun.status == "done"
+
+    failed = jobs.submit("failing", fail)
+    await asyncio.sleep(0)
+    assert failed.summary()["error"] == "invalid"
+    assert jobs.stats() == {"pending": 0, "running": 0, "done": 2, "failed": 1}
+    # Given a failed job, a new job should be queued.
+    assert jobs.submit("failing", fail) is not failed
+    await asyncio.sleep(0)
+    await jobs.aclose()
+
+    # Given expired jobs, they should be forgotten.
+    jobs.ttl = 0
+    job.finished -= 1
+    assert jobs.get(job.id) is None
+    assert jobs.submit("course", resolve) is not job
+
+
+def test_jobs_add_progress():
+    """Test the `add_progress` function outside of a job."""
+    add_progress(total=1, resolved=1)
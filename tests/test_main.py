@@ -1,13 +1,33 @@
 """Hook API main entrypoint test."""
 
+import json
+import re
+
 import pytest
 from httpx import AsyncClient
+from pytest_httpx import HTTPXMock
 
+from hook.conf import get_settings
 from hook.main import patch_moodle_url
 
 COURSES_COUNT = 3
 
 
+@pytest.fixture
+def non_mocked_hosts() -> list:
+    """Do not mock requests sent to the hook API test client with `httpx_mock`."""
+    return ["test"]
+
+
+@pytest.fixture
+def without_shared_cache(monkeypatch):
+    """Disable the shared Redis cache, e.g. enabled by the `docker-compose` setup."""
+    monkeypatch.setenv("HOOK_REDIS_URL", "")
+    get_settings.cache_clear()
+    yield
+    get_settings.cache_clear()
+
+
 @pytest.mark.anyio
 async def test_main_root(client: AsyncClient):
     """Test the main root route."""
@@ -37,6 +57,23 @@ async def test_main_courses(client: AsyncClient):
     }
 
 
+@pytest.mark.anyio
+async def test_main_courses_with_pagination(client: AsyncClient):
+    """Test the courses route with `fields`, `offset` and `limit`."""
+    response = await client.get("/courses?fields=id,fullname&offset=1&limit=1")
+    assert response.headers["x-total-count"] == str(COURSES_COUNT)
+    assert response.json() == [{"id": 3, "fullname": "Digital Literacy "}]
+
+
+@pytest.mark.anyio
+async def test_main_courses_with_unknown_fields(client: AsyncClient):
+    """Test the courses routes with unknown `fields`."""
+    response = await client.get("/courses?fields=id,visible")
+    assert response.status_code == 422
+    response = await client.get("/courses/3?fields=id,visible")
+    assert response.status_code == 422
+
+
 @pytest.mark.anyio
 async def test_main_courses_with_raw(client: AsyncClient):
     """Test the courses route with `raw=1`."""
@@ -86,6 +123,66 @@ async def test_main_courses_with_course_id_with_raw(client: AsyncClient):
     assert response[0]["visible"] == 1
 
 
+@pytest.mark.anyio
+async def test_main_courses_with_course_id_with_stream(client: AsyncClient):
+    """Test the courses/{course_id} route with `stream=1`."""
+    expected = (await client.get("/courses/3")).json()
+    response = await client.get("/courses/3?stream=1")
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert [json.loads(line) for line in response.text.splitlines()] == expected
+
+
+@pytest.mark.anyio
+async def test_main_courses_with_course_id_with_pagination(client: AsyncClient):
+    """Test the courses/{course_id} route with `fields`, `offset` and `limit`."""
+    response = await client.get("/courses/3?fields=id,name&offset=18&limit=2")
+    assert response.headers["x-total-count"] == "23"
+    assert response.json()[0] == {"id": 42, "name": " Digital Literacies in Higher Ed"}
+    assert len(response.json()) == 2
+
+    response = await client.get("/courses/3?fields=id,name&offset=18&stream=1")
+    assert response.headers["x-total-count"] == "23"
+    assert len(response.text.splitlines()) == 5
+
+
+@pytest.mark.anyio
+async def test_main_file(client: AsyncClient, httpx_mock: HTTPXMock):
+    """Test the files/{path} route."""
+    url = re.compile(r".*/webservice/pluginfile\.php/25/mod_resource/a\.pdf\?.*")
+    httpx_mock.add_response(
+        url=url,
+        match_headers={"range": "bytes=0-3"},
+        status_code=206,
+        content=b"%PDF",
+        headers={"Content-Type": "application/pdf", "Content-Range": "bytes 0-3/8"},
+    )
+    response = await client.get(
+        "/files/25/mod_resource/a.pdf", headers={"Range": "bytes=0-3"}
+    )
+    assert response.status_code == 206
+    assert response.content == b"%PDF"
+    assert response.headers["content-type"] == "application/pdf"
+    assert response.headers["content-range"] == "bytes 0-3/8"
+    assert response.headers["content-length"] == "4"
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize(
+    "path",
+    [
+        "%2e%2e/%2e%2e/webservice/upload.php",
+        "25/%2e%2e/%2E%2E/upload.php",
+        "25/%2e/a.pdf",
+        "25%5C..%5Cupload.php",
+    ],
+)
+async def test_main_file_with_invalid_path(client: AsyncClient, path: str):
+    """Test the files/{path} route with paths escaping `pluginfile.php`."""
+    response = await client.get(f"/files/{path}")
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Invalid file path"}
+
+
 @pytest.mark.anyio
 async def test_main_quiz_with_quiz_id(client: AsyncClient):
     """Test the quiz/{quiz_id} route."""
@@ -106,3 +203,43 @@ def test_main_patch_moodle_url(monkeypatch):
     monkeypatch.setenv("HOOK_MOODLE_URL", "http://foo")
     assert patch_moodle_url("http://bar:8080/hello/world") == "http://foo/hello/world"
     assert patch_moodle_url(None) is None
+
+
+@pytest.mark.anyio
+@pytest.mark.usefixtures("without_shared_cache")
+async def test_main_admin_cache(client: AsyncClient):
+    """Test the admin/cache routes."""
+    await client.delete("/admin/cache")
+    await client.get("/courses")
+    await client.get("/courses")
+    response = (await client.get("/admin/cache")).json()
+    # Both the webservice result and the normalized courses should be cached.
+    assert response["size"] == 2
+    assert response["hits"] >= 1
+    assert response["shared"]["enabled"] is False
+    response = await client.delete("/admin/cache?wsfunction=core_course_get_courses")
+    assert response.json() == {"invalidated": 1}
+    response = await client.delete("/admin/cache?wsfunction=courses")
+    assert response.json() == {"invalidated": 1}
+
+
+@pytest.mark.anyio
+async def test_main_metrics(client: AsyncClient):
+    """Test the metrics route."""
+    await client.get("/courses")
+    response = await client.get("/metrics")
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'function="core_course_get_courses"' in response.text
+    assert 'route="/courses"' in response.text
+
+
+@pytest.mark.anyio
+async def test_main_courses_batch(client: AsyncClient):
+    """Test the courses/batch route."""
+    expected = (await client.get("/courses/3?fields=id,name")).json()
+    response = await client.post("/courses/batch?fields=id,name", json=[3, 3, 999])
+    assert response.status_code == 200
+    response = response.json()
+    assert list(response) == ["3", "999"]
+    assert response["3"] == expected
+    assert "exception" in response["999"]
@@ -0,0 +1,79 @@
+"""Test the hook API and Moodle upstream metrics."""
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from prometheus_client import REGISTRY
+
+from hook.metrics import (
+    MetricsMiddleware,
+    MetricsTransport,
+    get_metrics,
+    get_upstream_function,
+)
+
+
+def test_metrics_get_upstream_function():
+    """Test the `get_upstream_function` function."""
+    url = "http://moodle/webservice/rest/server.php"
+    request = httpx.Request("POST", url, data={"wsfunction": "foo"})
+    assert get_upstream_function(request) == "foo"
+    request = httpx.Request("GET", url, params={"wsfunction": "bar"})
+    assert get_upstream_function(request) == "bar"
+    request = httpx.Request("GET", url)
+    assert get_upstream_function(request) == "unknown"
+    request = httpx.Request("POST", "http://moodle/webservice/pluginfile.php/1/a.pdf")
+    assert get_upstream_function(request) == "pluginfile"
+
+
+@pytest.mark.anyio
+async def test_metrics_metrics_transport():
+    """Test the `MetricsTransport` class."""
+    labels = {"client": "test", "function": "foo"}
+
+    def handler(request: httpx.Request):
+        assert REGISTRY.get_sample_value("hook_upstream_requests_in_flight", labels)
+        if request.url.path == "/error":
+            raise httpx.ConnectError("error")
+        return httpx.Response(200 if request.url.path == "/" else 500)
+
+    transport = MetricsTransport(httpx.MockTransport(handler), "test")
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://moodle"
+    ) as client:
+        await client.post("/", data={"wsfunction": "foo"})
+        await client.post("/fail", data={"wsfunction": "foo"})
+        with pytest.raises(httpx.ConnectError):
+            await client.post("/error", data={"wsfunction": "foo"})
+
+    count = "hook_upstream_request_duration_seconds_count"
+    errors = "hook_upstream_request_errors_total"
+    assert REGISTRY.get_sample_value(count, labels) == 3
+    assert REGISTRY.get_sample_value(errors, {**labels, "reason": "500"}) == 1
+    assert REGISTRY.get_sample_value(errors, {**labels, "reason": "ConnectError"}) == 1
+    assert REGISTRY.get_sample_value("hook_upstream_requests_in_flight", labels) == 0
+
+
+@pytest.mark.anyio
+async def test_metrics_metrics_middleware():
+    """Test the `MetricsMiddleware` class."""
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware)
+
+    @app.get("/items/{item_id}")
+    async def item(item_id: int):
+        return item_id
+
+    async with httpx.AsyncClient(app=app, base_url="http://test") as client:
+        await client.get("/items/1")
+        await client.get("/items/2")
+        await client.get("/missing")
+
+    count = "hook_request_duration_seconds_count"
+    labels = {"method": "GET", "route": "/items/{item_id}", "status": "200"}
+    assert REGISTRY.get_sample_value(count, labels) == 2
+    labels = {"method": "GET", "route": "unmatched", "status": "404"}
+    assert REGISTRY.get_sample_value(count, labels) == 1
+    content, media_type = get_metrics()
+    assert media_type.startswith("text/plain")
+    assert b"hook_request_duration_seconds_bucket" in content
@@ -0,0 +1,15 @@
+"""Test the typed models of the normalized hook API results."""
+
+from hook.models import Content, Module, project
+
+
+def test_models_project():
+    """Test the `project` function."""
+    content = Content(type="url", mimetype="text/html", fileurl="x", content=None)
+    module = Module(
+        id=1, instance=2, name="a", modname="url", url="y", contents=[content]
+    )
+    assert project(module, None) is module
+    assert project(module, {"name", "id"}) == {"id": 1, "name": "a"}
+    assert project(module, {"contents"}) == {"contents": [content]}
+    assert project(module, set()) == {}
@@ -0,0 +1,275 @@
+"""Test the Moodle webservices calls and the normalization of their results."""
+
+import json
+import re
+
+import pytest
+from asgi_lifespan import LifespanManager
+from pytest_httpx import HTTPXMock
+
+from hook.conf import get_settings
+from hook.main import app
+from hook.models import Question
+from hook.moodle import (
+    get_course_contents,
+    get_quiz,
+    get_quiz_questions,
+    moodle_ws_batch,
+)
+
+WS_URL = re.compile(r"http://moodle/webservice/rest/server\.php/.*")
+REVIEW = {
+    "attempt": {"id": 7},
+    "questions": [{"slot": 1, "type": "x", "page": 0, "html": "a<![CDATA[b]]>c"}],
+}
+
+
+@pytest.fixture
+def settings(monkeypatch):
+    """Use the default settings with quiz attempts reuse enabled."""
+    monkeypatch.setenv("HOOK_MOODLE_URL", "http://moodle")
+    monkeypatch.setenv("HOOK_QUIZ_REUSE_ATTEMPTS", "true")
+    get_settings.cache_clear()
+    yield get_settings()
+    get_settings.cache_clear()
+
+
+def add_ws_response(httpx_mock: HTTPXMock, content: str, result):
+    """Mock the Moodle webservice `result` of a request with `content`."""
+    httpx_mock.add_response(url=WS_URL, match_content=content.encode(), json=result)
+
+
+@pytest.mark.anyio
+@pytest.mark.usefixtures("settings")
+async def test_moodle_ws_batch(monkeypatch, httpx_mock: HTTPXMock):
+    """Test the `moodle_ws_batch` function with batching enabled."""
+    monkeypatch.setenv("HOOK_MOODLE_BATCH_SIZE", "2")
+    get_settings.cache_clear()
+    error = {"exception": "invalid_parameter_exception"}
+    httpx_mock.add_response(
+        url=WS_URL,
+        json={
+            "responses": [
+                {"error": False, "data": json.dumps([{"id": 1}])},
+                {"error": True, "exception": json.dumps(error)},
+            ]
+        },
+    )
+    httpx_mock.add_response(
+        url=WS_URL, json={"responses": [{"error": False, "data": "[]"}]}
+    )
+    params_list = [{"courseid": 1}, {"courseid": 2}, {"courseid": 3}]
+    async with LifespanManager(app):
+        results = await moodle_ws_batch(app, "core_course_get_contents", params_list)
+        assert results == [[{"id": 1}], error, []]
+        # Successful results should be cached, errors should be requested again.
+        httpx_mock.reset(assert_all_responses_were_requested=False)
+        httpx_mock.add_response(
+            url=WS_URL,
+            match_content=(
+                b"wsfunction=tool_mobile_call_external_functions"
+                b"&requests%5B0%5D%5Bfunction%5D=core_course_get_contents"
+                b"&requests%5B0%5D%5Barguments%5D=%7B%22courseid%22%3A+2%7D"
+            ),
+            json={"responses": [{"error": False, "data": "[]"}]},
+        )
+        results = await moodle_ws_batch(app, "core_course_get_contents", params_list)
+        assert results == [[{"id": 1}], [], []]
+
+
+@pytest.mark.anyio
+@pytest.mark.usefixtures("settings")
+async def test_moodle_ws_batch_without_batching(monkeypatch, httpx_mock: HTTPXMock):
+    """Test the `moodle_ws_batch` function when batching is not available."""
+    monkeypatch.setenv("HOOK_MOODLE_BATCH_SIZE", "10")
+    get_settings.cache_clear()
+    add_ws_response(
+        httpx_mock,
+        "wsfunction=tool_mobile_call_external_functions"
+        "&requests%5B0%5D%5Bfunction%5D=core_course_get_contents"
+        "&requests%5B0%5D%5Barguments%5D=%7B%22courseid%22%3A+1%7D"
+        "&requests%5B1%5D%5Bfunction%5D=core_course_get_contents"
+        "&requests%5B1%5D%5Barguments%5D=%7B%22courseid%22%3A+2%7D",
+        {"exception": "webservice_access_exception"},
+    )
+    add_ws_response(
+        httpx_mock, "wsfunction=core_course_get_contents&courseid=1", [{"id": 1}]
+    )
+    add_ws_response(
+        httpx_mock, "wsfunction=core_course_get_contents&courseid=2", [{"id": 2}]
+    )
+    params_list = [{"courseid": 1}, {"courseid": 2}]
+    async with LifespanManager(app):
+        results = await moodle_ws_batch(app, "core_course_get_contents", params_list)
+        assert results == [[{"id": 1}], [{"id": 2}]]
+
+
+@pytest.mark.anyio
+@pytest.mark.usefixtures("settings")
+async def test_moodle_get_course_contents_with_sync(monkeypatch, httpx_mock: HTTPXMock):
+    """Test the `get_course_contents` function with incremental course sync."""
+    monkeypatch.setenv("HOOK_COURSE_SYNC", "true")
+    get_settings.cache_clear()
+    monkeypatch.setattr("hook.moodle.time.time", lambda: 1000)
+    sections = [{"id": 1, "modules": [{"id": 10, "name": "a"}, {"id": 11}]}]
+    updated_sections = [{"id": 1, "modules": [{"id": 10, "name": "b"}, {"id": 11}]}]
+    add_ws_response(
+        httpx_mock, "wsfunction=core_course_get_contents&courseid=3", sections
+    )
+    add_ws_response(
+        httpx_mock,
+        "wsfunction=core_course_get_updates_since&courseid=3&since=1000",
+        {"instances": [{"contextlevel": "module", "id": 10}], "warnings": []},
+    )
+    add_ws_response(
+        httpx_mock,
+        "wsfunction=core_course_get_contents&courseid=3"
+        "&options%5B0%5D%5Bname%5D=cmid&options%5B0%5D%5Bvalue%5D=10",
+        [{"id": 1, "modules": [{"id": 10, "name": "b"}]}],
+    )
+    async with LifespanManager(app):
+        assert await get_course_contents(app, 3) == sections
+        assert await get_course_contents(app, 3) == updated_sections
+
+    assert len(httpx_mock.get_requests()) == 3
+
+
+@pytest.mark.anyio
+@pytest.mark.usefixtures("settings")
+async def test_moodle_get_course_contents_with_sync_invalidated(
+    monkeypatch, httpx_mock: HTTPXMock
+):
+    """Test that course snapshots are invalidated with the `course` prefix."""
+    # pylint: disable=no-member
+    monkeypatch.setenv("HOOK_COURSE_SYNC", "true")
+    get_settings.cache_clear()
+    sections = [{"id": 1, "modules": [{"id": 10, "name": "a"}]}]
+    add_ws_response(
+        httpx_mock, "wsfunction=core_course_get_contents&courseid=3", sections
+    )
+    add_ws_response(
+        httpx_mock, "wsfunction=core_course_get_contents&courseid=3", sections
+    )
+    async with LifespanManager(app):
+        assert await get_course_contents(app, 3) == sections
+        assert await app.shared_cache.invalidate("course") == 1
+        # Given no snapshot, the course contents should be fully fetched again.
+        assert await get_course_contents(app, 3) == sections
+
+    assert len(httpx_mock.get_requests()) == 2
+
+
+@pytest.mark.anyio
+@pytest.mark.usefixtures("settings")
+async def test_moodle_get_course_contents_with_sync_new_module(
+    monkeypatch, httpx_mock: HTTPXMock
+):
+    """Test the `get_course_contents` function when a module has been added."""
+    # pylint: disable=no-member
+    monkeypatch.setenv("HOOK_COURSE_SYNC", "true")
+    get_settings.cache_clear()
+    monkeypatch.setattr("hook.moodle.time.time", lambda: 1000)
+    add_ws_response(
+        httpx_mock,
+        "wsfunction=core_course_get_updates_since&courseid=3&since=1000",
+        {"instances": [{"contextlevel": "module", "id": 12}], "warnings": []},
+    )
+    add_ws_response(
+        httpx_mock,
+        "wsfunction=core_course_get_contents&courseid=3"
+        "&options%5B0%5D%5Bname%5D=cmid&options%5B0%5D%5Bvalue%5D=12",
+        [{"id": 1, "modules": [{"id": 12}]}],
+    )
+    sections = [{"id": 1, "modules": [{"id": 10}]}]
+    add_ws_response(
+        httpx_mock, "wsfunction=core_course_get_contents&courseid=3", sections
+    )
+    async with LifespanManager(app):
+        # The snapshot should be fully refetched when a module is missing from it.
+        app.cache.set(("course", 3), (sections, 1000), 60)
+        assert await get_course_contents(app, 3) == sections
+
+    assert len(httpx_mock.get_requests()) == 3
+
+
+@pytest.mark.anyio
+@pytest.mark.usefixtures("settings")
+async def test_moodle_get_quiz_questions():
+    """Test the `get_quiz_questions` function."""
+    async with LifespanManager(app):
+        assert await get_quiz_questions(app, REVIEW) == [
+            Question(slot=1, type="x", page=0, html="ac")
+        ]
+
+
+@pytest.mark.anyio
+@pytest.mark.usefixtures("settings")
+async def test_moodle_get_quiz_with_finished_attempt(httpx_mock: HTTPXMock):
+    """Test the `get_quiz` function reusing a finished attempt."""
+    add_ws_response(
+        httpx_mock,
+        "wsfunction=core_course_get_course_module_by_instance"
+        "&module=quiz&instance=2",
+        {"cm": {"course": 3}},
+    )
+    add_ws_response(
+        httpx_mock,
+        "wsfunction=mod_quiz_get_quizzes_by_courses&courseids%5B0%5D=3",
+        {"quizzes": [{"id": 1, "timemodified": 200}, {"id": 2, "timemodified": 100}]},
+    )
+    add_ws_response(
+        httpx_mock,
+        "wsfunction=mod_quiz_get_user_attempts&quizid=2&status=all&includepreviews=1",
+        {
+            "attempts": [
+                {"id": 6, "state": "finished", "timestart": 50},
+                {"id": 7, "state": "finished", "timestart": 150},
+                {"id": 8, "state": "inprogress", "timestart": 160},
+            ]
+        },
+    )
+    add_ws_response(
+        httpx_mock, "wsfunction=mod_quiz_get_attempt_review&attemptid=7", REVIEW
+    )
+    async with LifespanManager(app):
+        expected = [Question(slot=1, type="x", page=0, html="ac")]
+        assert await get_quiz(app, 2) == expected
+        # The second call should be served from cache, without upstream requests.
+        assert await get_quiz(app, 2) == expected
+
+    assert len(httpx_mock.get_requests()) == 4
+
+
+@pytest.mark.anyio
+@pytest.mark.usefixtures("settings")
+async def test_moodle_get_quiz_with_modified_quiz(httpx_mock: HTTPXMock):
+    """Test the `get_quiz` function submitting an attempt for a modified quiz."""
+    add_ws_response(
+        httpx_mock,
+        "wsfunction=core_course_get_course_module_by_instance"
+        "&module=quiz&instance=2",
+        {"cm": {"course": 3}},
+    )
+    add_ws_response(
+        httpx_mock,
+        "wsfunction=mod_quiz_get_quizzes_by_courses&courseids%5B0%5D=3",
+        {"quizzes": [{"id": 2, "timemodified": 300}]},
+    )
+    add_ws_response(
+        httpx_mock,
+        "wsfunction=mod_quiz_get_user_attempts&quizid=2&status=all&includepreviews=1",
+        {"attempts": [{"id": 7, "state": "finished", "timestart": 150}]},
+    )
+    add_ws_response(
+        httpx_mock, "wsfunction=mod_quiz_start_attempt&quizid=2", {"attempt": {"id": 9}}
+    )
+    add_ws_response(
+        httpx_mock,
+        "wsfunction=mod_quiz_process_attempt&attemptid=9&finishattempt=1",
+        {"state": "finished"},
+    )
+    add_ws_response(
+        httpx_mock, "wsfunction=mod_quiz_get_attempt_review&attemptid=9", REVIEW
+    )
+    async with LifespanManager(app):
+        assert await get_quiz(app, 2, raw=True) == REVIEW
@@ -0,0 +1,68 @@
+"""Test the post-processing of Moodle contents."""
+
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from hook.conf import Settings, get_settings
+from hook.models import Question
+from hook.postprocess import (
+    clean_html,
+    clean_quiz_questions,
+    create_executor,
+    decode_text,
+    postprocess,
+)
+
+
+def test_postprocess_clean_html():
+    """Test the `clean_html` function."""
+    html = "<p>a</p><![CDATA[\nvar x = 1;\n]]><p>b</p><![CDATA[c]]>"
+    assert clean_html(html) == "<p>a</p><p>b</p>"
+
+
+def test_postprocess_clean_quiz_questions():
+    """Test the `clean_quiz_questions` function."""
+    questions = [{"slot": 1, "type": "x", "page": 0, "html": "a<![CDATA[b]]>", "y": 1}]
+    assert clean_quiz_questions(questions) == [
+        Question(slot=1, type="x", page=0, html="a")
+    ]
+
+
+def test_postprocess_decode_text():
+    """Test the `decode_text` function."""
+    assert decode_text("café".encode("latin-1"), "latin-1") == "café"
+    assert decode_text(b"caf\xe9", "utf-8") == "caf�"
+
+
+def test_postprocess_create_executor():
+    """Test the `create_executor` function."""
+    executor = create_executor(Settings(postprocess_executor="process"))
+    assert executor.__class__.__name__ == "ProcessPoolExecutor"
+    executor.shutdown()
+    executor = create_executor(Settings(postprocess_workers=2))
+    assert executor.__class__.__name__ == "ThreadPoolExecutor"
+    executor.shutdown()
+
+
+@pytest.mark.anyio
+async def test_postprocess_postprocess(monkeypatch):
+    """Test the `postprocess` function."""
+    monkeypatch.setenv("HOOK_POSTPROCESS_THRESHOLD", "10")
+    get_settings.cache_clear()
+    executor = create_executor(Settings())
+    fastapi_app = SimpleNamespace(executor=executor)
+
+    def thread_name():
+        return threading.current_thread().name
+
+    try:
+        # Given a payload below the threshold, it should be processed inline.
+        assert await postprocess(fastapi_app, 9, thread_name) == "MainThread"
+        # Given a payload above the threshold, it should be processed in the pool.
+        name = await postprocess(fastapi_app, 10, thread_name)
+        assert name.startswith("postprocess")
+    finally:
+        executor.shutdown()
+        get_settings.cache_clear()
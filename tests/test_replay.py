@@ -0,0 +1,131 @@
+"""Test the recording and replay of Moodle upstream exchanges."""
+
+import httpx
+import pytest
+from asgi_lifespan import LifespanManager
+
+from hook.conf import get_settings
+from hook.main import app
+from hook.replay import Archive, RecordTransport, ReplayTransport, get_exchange_key
+
+
+def test_replay_get_exchange_key():
+    """Test the `get_exchange_key` function."""
+    request = httpx.Request(
+        "POST",
+        "http://moodle-1/webservice/rest/server.php?wstoken=foo&b=2&a=1",
+        data={"wsfunction": "core_course_get_courses"},
+    )
+    key = get_exchange_key(request)
+    assert key.startswith("POST /webservice/rest/server.php?a=1&b=2 ")
+    assert "foo" not in key
+
+    # Given another origin and token, the key should be the same.
+    request = httpx.Request(
+        "POST",
+        "http://moodle-2/webservice/rest/server.php?a=1&b=2&wstoken=bar",
+        data={"wsfunction": "core_course_get_courses"},
+    )
+    assert get_exchange_key(request) == key
+
+
+@pytest.mark.anyio
+async def test_replay_record_and_replay(tmp_path):
+    """Test the `RecordTransport` and `ReplayTransport` classes."""
+    path = tmp_path / "upstream.jsonl.gz"
+    responses = [
+        httpx.Response(200, json={"attempt": 1}, headers={"set-cookie": "a=b"}),
+        httpx.Response(200, json={"attempt": 2}),
+    ]
+    transport = RecordTransport(
+        httpx.MockTransport(lambda _: responses.pop(0)), Archive(path)
+    )
+    async with httpx.AsyncClient(
+        base_url="http://moodle", params={"wstoken": "foo"}, transport=transport
+    ) as client:
+        await client.post("/", data={"wsfunction": "mod_quiz_start_attempt"})
+        response = await client.post("/", data={"wsfunction": "mod_quiz_start_attempt"})
+        assert response.json() == {"attempt": 2}
+
+    archive = Archive(path)
+    assert len(archive) == 2
+    assert path.read_bytes().count(b"foo") == 0
+    transport = ReplayTransport(archive, latency=0.01, jitter=0.01)
+    async with httpx.AsyncClient(
+        base_url="http://moodle", params={"wstoken": "bar"}, transport=transport
+    ) as client:
+        data = {"wsfunction": "mod_quiz_start_attempt"}
+        response = await client.post("/", data=data)
+        assert response.json() == {"attempt": 1}
+        assert "set-cookie" not in response.headers
+        # Recorded responses should be replayed in order, repeating the last one.
+        assert (await client.post("/", data=data)).json() == {"attempt": 2}
+        assert (await client.post("/", data=data)).json() == {"attempt": 2}
+
+        # Given a request missing from the archive, a Moodle exception is returned.
+        response = await client.post("/", data={"wsfunction": "other"})
+        assert response.status_code == 404
+        assert response.json()["exception"] == "replay_miss"
+
+
+@pytest.mark.anyio
+async def test_replay_archive_flush(tmp_path):
+    """Test that recorded exchanges are written to disk once flushed."""
+    path = tmp_path / "upstream.jsonl.gz"
+    archive = Archive(path)
+    request = httpx.Request("GET", "http://moodle/a.pdf")
+    archive.record(request, httpx.Response(200, content=b"%PDF"))
+    assert len(archive) == 1
+    assert not path.exists()
+
+    await archive.flush()
+    archive.record(request, httpx.Response(200, content=b"%PDF-2"))
+    await archive.flush()
+    assert len(Archive(path)) == 2
+
+
+@pytest.fixture
+def upstream_archive(monkeypatch, tmp_path):
+    """Use the default settings with an upstream archive in `tmp_path`."""
+    path = tmp_path / "upstream.jsonl.gz"
+    monkeypatch.setenv("HOOK_MOODLE_URL", "http://moodle")
+    monkeypatch.setenv("HOOK_UPSTREAM_ARCHIVE", str(path))
+    yield path
+    get_settings.cache_clear()
+
+
+@pytest.mark.anyio
+@pytest.mark.usefixtures("upstream_archive")
+async def test_replay_record_and_replay_file(monkeypatch):
+    """Test recording and replaying a file streamed by the hook API."""
+    # pylint: disable=no-member
+    path = "/files/25/mod_resource/content/1/a.pdf"
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        assert (
+            request.url.path
+            == "/webservice/pluginfile.php/25/mod_resource/content/1/a.pdf"
+        )
+        return httpx.Response(200, content=b"%PDF", headers={"etag": '"a"'})
+
+    monkeypatch.setenv("HOOK_UPSTREAM_MODE", "record")
+    get_settings.cache_clear()
+    async with LifespanManager(app) as manager:
+        # Replace the connection pool wrapped by the record transport.
+        wrapper = app.moodle_file._transport  # pylint: disable=protected-access
+        while not isinstance(wrapper.transport, httpx.AsyncHTTPTransport):
+            wrapper = wrapper.transport
+        wrapper.transport = httpx.MockTransport(handler)
+        async with httpx.AsyncClient(app=manager.app, base_url="http://test") as client:
+            response = await client.get(path)
+            assert response.status_code == 200
+            assert response.content == b"%PDF"
+
+    monkeypatch.setenv("HOOK_UPSTREAM_MODE", "replay")
+    get_settings.cache_clear()
+    async with LifespanManager(app) as manager:
+        async with httpx.AsyncClient(app=manager.app, base_url="http://test") as client:
+            response = await client.get(path)
+            assert response.status_code == 200
+            assert response.content == b"%PDF"
+            assert response.headers["etag"] == '"a"'
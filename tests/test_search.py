@@ -0,0 +1,112 @@
+"""Test the full-text search index over the resolved Moodle course modules."""
+
+import re
+
+import pytest
+from asgi_lifespan import LifespanManager
+from pytest_httpx import HTTPXMock
+
+from hook.conf import get_settings
+from hook.main import app
+from hook.models import Content, Module, Question
+from hook.moodle import get_course_modules
+from hook.search import SearchIndex, get_module_terms, tokenize
+
+
+def create_module(module_id: int, name: str, text: str = None) -> Module:
+    """Return a resource module with a single file of `text`."""
+    contents = [Content("file", "text/html", "http://moodle/a.html", text)]
+    return Module(module_id, module_id, name, "resource", "http://moodle", contents)
+
+
+def test_search_tokenize():
+    """Test the `tokenize` function."""
+    assert tokenize(None) == []
+    assert tokenize(
+        "<p class='x'>Caf&eacute; <b>au</b> lait, a</p>"
+        "<script>var hidden = 1;</script><STYLE>p {}</STYLE>"
+    ) == ["café", "au", "lait"]
+
+
+def test_search_get_module_terms():
+    """Test the `get_module_terms` function."""
+    module = Module(1, 1, "Quiz quiz", "quiz", "http://moodle", None)
+    assert get_module_terms(module) == {"quiz": 6}
+    module.contents = [Question(1, "x", 0, "<p>A quiz question</p>")]
+    assert get_module_terms(module) == {"quiz": 7, "question": 1}
+    assert get_module_terms(create_module(2, "File", None)) == {"file": 3}
+
+
+def test_search_search_index():
+    """Test the `SearchIndex` class."""
+    index = SearchIndex()
+    assert index.search("python") == ([], 0)
+    index.add(1, create_module(10, "Python basics", "<p>Learn python.</p>"), {})
+    modules = [
+        create_module(10, "Python basics", "<p>Learn python.</p>"),
+        create_module(11, "Advanced topics", "<p>Python generators and asyncio.</p>"),
+        create_module(12, "Java", "<p>Learn java.</p>"),
+    ]
+    index.replace_course(1, modules, list(map(get_module_terms, modules)))
+    other = create_module(20, "Snakes", "<p>The python is a snake.</p>")
+    index.add(2, other, get_module_terms(other))
+    assert 1 in index
+    assert len(index) == 4
+
+    # Modules should be ranked by relevance, names weighing more than contents and
+    # short contents more than long ones.
+    hits, total = index.search("Python")
+    assert total == 3
+    assert [(hit.course_id, hit.id) for hit in hits] == [(1, 10), (2, 20), (1, 11)]
+    assert hits[0].score > hits[1].score > hits[2].score > 0
+    hits, total = index.search("learn python", course_id=1, limit=1)
+    assert [hit.id for hit in hits] == [10]
+    assert total == 3
+
+    # Given a course indexed again, removed modules should be dropped.
+    index.replace_course(1, modules[2:], [get_module_terms(modules[2])])
+    assert index.search("python") == (index.search("snake")[0], 1)
+    assert index.stats() == {"courses": 2, "modules": 2, "terms": 7}
+    index.replace_course(1, [], [])
+    assert 1 not in index
+
+
+@pytest.mark.anyio
+async def test_search_get_course_modules(monkeypatch, httpx_mock: HTTPXMock):
+    """Test the indexing of modules resolved by `get_course_modules`."""
+    monkeypatch.setenv("HOOK_MOODLE_URL", "http://moodle")
+    monkeypatch.setenv("HOOK_SEARCH", "true")
+    get_settings.cache_clear()
+    sections = [
+        {
+            "visible": 1,
+            "modules": [
+                {
+                    "id": 10,
+                    "name": "Syllabus",
+                    "modname": "resource",
+                    "visible": 1,
+                    "contents": [
+                        {"type": "file", "fileurl": "http://moodle/pluginfile.php/a"}
+                    ],
+                }
+            ],
+        }
+    ]
+    httpx_mock.add_response(
+        url=re.compile(r"http://moodle/webservice/rest/server\.php/.*"), json=sections
+    )
+    httpx_mock.add_response(
+        url=re.compile(r"http://moodle/pluginfile\.php/a.*"),
+        text="<h1>Course outline</h1>",
+    )
+    # pylint: disable=no-member
+    async with LifespanManager(app):
+        await get_course_modules(app, 3, html=False)
+        assert not app.search_index.search("outline")[1]
+        await get_course_modules(app, 3, html=True)
+        hits, _ = app.search_index.search("syllabus outline")
+        assert [(hit.course_id, hit.id, hit.name) for hit in hits] == [
+            (3, 10, "Syllabus")
+        ]
+    get_settings.cache_clear()
@@ -0,0 +1,54 @@
+"""Test the JSON and MessagePack serialization of hook API results."""
+
+import httpx
+import pytest
+
+from hook.conf import get_settings
+from hook.models import Content, Course, Module, Question
+from hook.serialization import decode_response, dumps, loads, pack, unpack
+
+
+def test_serialization_dumps():
+    """Test the `dumps` function."""
+    course = Course(id=1, fullname="é", url="u", summary=None)
+    assert dumps([course]) == (
+        '[{"id":1,"fullname":"é","url":"u","summary":null}]'.encode()
+    )
+    assert dumps({1: {"id": 1}}) == b'{"1":{"id":1}}'
+
+
+@pytest.mark.parametrize("decoder", ["json", "orjson"])
+def test_serialization_loads(monkeypatch, decoder):
+    """Test the `loads` and `decode_response` functions with each decoder."""
+    monkeypatch.setenv("HOOK_MOODLE_JSON_DECODER", decoder)
+    get_settings.cache_clear()
+    assert loads('{"a": [1, "é"]}') == {"a": [1, "é"]}
+    response = httpx.Response(200, content='{"a": [1, "é"]}'.encode())
+    assert decode_response(response) == {"a": [1, "é"]}
+    get_settings.cache_clear()
+
+
+def test_serialization_pack_unpack():
+    """Test the `pack` and `unpack` functions restoring models."""
+    modules = [
+        Module(
+            id=1,
+            instance=2,
+            name="a",
+            modname="resource",
+            url="u",
+            contents=[
+                Content(type="file", mimetype="text/html", fileurl="f", content="c")
+            ],
+        ),
+        Module(
+            id=3,
+            instance=4,
+            name="b",
+            modname="quiz",
+            url="v",
+            contents=[Question(slot=1, type="x", page=0, html="h")],
+        ),
+    ]
+    assert unpack(pack(modules)) == modules
+    assert unpack(pack({"a": [1, None]})) == {"a": [1, None]}
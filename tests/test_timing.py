@@ -0,0 +1,78 @@
+"""Test the Server-Timing breakdown of hook API requests."""
+
+import re
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from hook.conf import get_settings
+from hook.timing import (
+    ServerTiming,
+    ServerTimingMiddleware,
+    TimedJSONResponse,
+    server_timing,
+    timed,
+)
+
+
+def test_timing_server_timing_header(monkeypatch):
+    """Test the `ServerTiming.header` method."""
+    monkeypatch.setattr("hook.timing.time.perf_counter", lambda: 1.0)
+    timing = ServerTiming()
+    timing.add("ws", 0.0125)
+    timing.add("ws", 0.0025)
+    timing.add("file", 0.1)
+    assert timing.header() == (
+        'ws;dur=15.0;desc="2x", file;dur=100.0;desc="1x", total;dur=0.0'
+    )
+
+
+def test_timing_timed():
+    """Test the `timed` context manager."""
+    # Given no Server-Timing for the current context, nothing should be recorded.
+    with timed("ws"):
+        pass
+
+    timing = ServerTiming()
+    token = server_timing.set(timing)
+    try:
+        with timed("ws"):
+            pass
+    finally:
+        server_timing.reset(token)
+    assert list(timing.durations) == ["ws"]
+
+
+@pytest.mark.anyio
+async def test_timing_server_timing_middleware(monkeypatch):
+    """Test the `ServerTimingMiddleware` class."""
+    app = FastAPI(default_response_class=TimedJSONResponse)
+    app.add_middleware(ServerTimingMiddleware)
+
+    @app.get("/")
+    async def root():
+        with timed("ws"):
+            return {"foo": "bar"}
+
+    async with httpx.AsyncClient(app=app, base_url="http://test") as client:
+        response = await client.get("/")
+        assert response.json() == {"foo": "bar"}
+        assert "server-timing" not in response.headers
+
+        response = await client.get("/?timing=1")
+        assert response.json() == {"foo": "bar"}
+        pattern = (
+            r'ws;dur=[\d.]+;desc="1x", serialize;dur=[\d.]+;desc="1x", '
+            r"total;dur=[\d.]+"
+        )
+        assert re.fullmatch(pattern, response.headers["server-timing"])
+
+        # Given the `server_timing` setting, the header should always be added.
+        monkeypatch.setenv("HOOK_SERVER_TIMING", "true")
+        get_settings.cache_clear()
+        try:
+            response = await client.get("/")
+        finally:
+            get_settings.cache_clear()
+        assert "server-timing" in response.headers
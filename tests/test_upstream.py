@@ -0,0 +1,53 @@
+"""Test the Moodle upstream HTTP clients."""
+
+import httpx
+import pytest
+from pytest_httpx import HTTPXMock
+
+from hook.conf import Settings
+from hook.upstream import create_moodle_client, get_guard_stats, get_pool_stats
+
+
+@pytest.mark.anyio
+async def test_upstream_create_moodle_client(httpx_mock: HTTPXMock):
+    """Test the `create_moodle_client` function."""
+    settings = Settings(
+        moodle_url="http://moodle",
+        moodle_timeout=10,
+        moodle_connect_timeout=2,
+        moodle_max_connections=5,
+        moodle_max_keepalive_connections=3,
+    )
+    httpx_mock.add_response(
+        url="http://moodle/webservice/rest/server.php/?wstoken=foo", json={}
+    )
+    async with create_moodle_client(
+        settings, "moodle", "/webservice/rest/server.php", {"wstoken": "foo"}
+    ) as client:
+        assert client.timeout == httpx.Timeout(10, connect=2)
+        assert (await client.post("/")).json() == {}
+        assert get_pool_stats(client) == {
+            "connections": 0,
+            "idle_connections": 0,
+            "active_connections": 0,
+            "active_requests": 0,
+            "queued_requests": 0,
+            "max_connections": 5,
+            "max_keepalive_connections": 3,
+        }
+
+
+@pytest.mark.anyio
+async def test_upstream_get_guard_stats():
+    """Test the `get_guard_stats` function."""
+    async with create_moodle_client(Settings(), "moodle", "/", {}) as client:
+        assert get_guard_stats(client) is None
+
+    settings = Settings(guard=True, guard_initial_limit=5)
+    async with create_moodle_client(settings, "moodle", "/", {}) as client:
+        assert get_guard_stats(client) == {
+            "limit": 5,
+            "in_flight": 0,
+            "queued": 0,
+            "circuit": "closed",
+        }